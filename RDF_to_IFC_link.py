@@ -1,126 +1,235 @@
+import argparse
+
 import ifcopenshell
 import ifcopenshell.guid
 from rdflib import Graph, Namespace
 
+from instrumentation import stage
+
 # Namespaces
 CDO = Namespace("https://w3id.org/damagemodels/cdo#")
 
-def add_damages_from_rdf(ifc_file_path, rdf_file_path, output_ifc_path):
-    # Load IFC model
-    model = ifcopenshell.open(ifc_file_path)
-
-    # Load RDF
-    g = Graph()
-    g.parse(rdf_file_path, format="ttl")
-
-    for damage in g.subjects():
-        # Collect damage type(s)
-        damage_types = list(g.objects(damage, CDO['Crack'])) + list(g.objects(damage, CDO['Spalling']))
-        if not damage_types:
-            continue
-
-        damage_name = str(g.value(damage, CDO['hasName'])) or "Unnamed Damage"
-        width = g.value(damage, CDO['hasWidth'])
-        depth = g.value(damage, CDO['hasDepth'])
-        severity = g.value(damage, CDO['hasSeverity'])
-        coords = g.value(damage, CDO['hasCoordinates'])
-        damage_class = ", ".join([str(dt).split("#")[-1] for dt in damage_types])
+DAMAGE_TYPE_PREDICATES = (CDO['Crack'], CDO['Spalling'])
+DAMAGE_PROPERTIES = {
+    "name": CDO['hasName'],
+    "width": CDO['hasWidth'],
+    "depth": CDO['hasDepth'],
+    "severity": CDO['hasSeverity'],
+    "coords": CDO['hasCoordinates'],
+}
+
+
+def collect_damages(g):
+    """One row per damage with all its properties and its element's GUID.
+
+    Each predicate of interest is read once through rdflib's predicate index,
+    so the cost grows with the number of damage triples, not with the total
+    number of triples, and every damage is visited exactly once.
+    """
+    damages = {}
+    for predicate in DAMAGE_TYPE_PREDICATES:
+        for damage, damage_type in g.subject_objects(predicate):
+            damages.setdefault(damage, {"types": []})["types"].append(damage_type)
+
+    for key, predicate in DAMAGE_PROPERTIES.items():
+        for damage, value in g.subject_objects(predicate):
+            row = damages.get(damage)
+            if row is not None and key not in row:
+                row[key] = value
+
+    element_guids = {}
+    for element, guid in g.subject_objects(CDO['ifcGlobalId']):
+        element_guids.setdefault(element, guid)
+    for damage, element in g.subject_objects(CDO['damageLocatedOn']):
+        row = damages.get(damage)
+        if row is not None and "guid" not in row and element in element_guids:
+            row["guid"] = element_guids[element]
+
+    return damages
+
+
+def damage_records(g, elements_by_guid):
+    """``(damage, element, name, damage_class, properties)`` for every damage whose element is in the model.
+
+    ``properties`` is the ordered ``(name, value)`` list written to
+    PSet_DamageProperties; missing values are left out.
+    """
+    for damage, row in collect_damages(g).items():
+        damage_name = str(row["name"]) if row.get("name") is not None else "Unnamed Damage"
+        damage_class = ", ".join([str(dt).split("#")[-1] for dt in row["types"]])
 
         # Get IFC element GUID
-        ifc_element = None
-        for obj in g.objects(damage, CDO['damageLocatedOn']):
-            ifc_guid = g.value(obj, CDO['ifcGlobalId'])
-            if ifc_guid:
-                ifc_element = model.by_guid(str(ifc_guid))
-                break
+        ifc_element = elements_by_guid.get(str(row["guid"])) if "guid" in row else None
         if not ifc_element:
             print(f"Warning: IFC element for damage {damage} not found. Skipping.")
             continue
 
-        # Create IfcProxy to represent damage
-        damage_proxy = model.create_entity(
-            "IfcProxy",
-            GlobalId=ifcopenshell.guid.new(),
-            OwnerHistory=None,
-            Name=damage_name,
-            Description="Damage instance from RDF",
-            ObjectType=damage_class,
-            Tag=None,
-            ProxyType="NOTDEFINED"
-        )
+        properties = [
+            ("DamageClass", damage_class),
+            ("Width", row.get("width")),
+            ("Depth", row.get("depth")),
+            ("Severity", row.get("severity")),
+            ("Coordinates", row.get("coords")),
+        ]
+        properties = [(name, value) for name, value in properties if value is not None]
+        yield damage, ifc_element, damage_name, damage_class, properties
+
+
+def _create_proxy(model, damage_name, damage_class, description):
+    return model.create_entity(
+        "IfcProxy",
+        GlobalId=ifcopenshell.guid.new(),
+        OwnerHistory=None,
+        Name=damage_name,
+        Description=description,
+        ObjectType=damage_class,
+        Tag=None,
+        ProxyType="NOTDEFINED"
+    )
+
+
+def _create_pset(model, name, description, properties):
+    # HasProperties is set once from the finished tuple instead of growing it per property
+    return model.create_entity(
+        "IfcPropertySet",
+        GlobalId=ifcopenshell.guid.new(),
+        OwnerHistory=None,
+        Name=name,
+        Description=description,
+        HasProperties=tuple(properties)
+    )
+
+
+def _create_rel_defines(model, objects, pset):
+    return model.create_entity(
+        "IfcRelDefinesByProperties",
+        GlobalId=ifcopenshell.guid.new(),
+        OwnerHistory=None,
+        RelatedObjects=list(objects),
+        RelatingPropertyDefinition=pset
+    )
+
+
+def _create_rel_aggregates(model, element, proxies):
+    return model.create_entity(
+        "IfcRelAggregates",
+        GlobalId=ifcopenshell.guid.new(),
+        OwnerHistory=None,
+        RelatingObject=element,
+        RelatedObjects=list(proxies)
+    )
+
+
+def _single_value(model, name, value):
+    return model.create_entity(
+        "IfcPropertySingleValue",
+        Name=name,
+        Description=None,
+        NominalValue=model.create_entity("IfcText", str(value)),
+        Unit=None
+    )
+
+
+def emit_per_damage(model, records, description="Damage instance from RDF"):
+    """Original layout: every damage gets its own label pset and relationships on the host element."""
+    count = 0
+    for _, ifc_element, damage_name, damage_class, properties in records:
+        damage_proxy = _create_proxy(model, damage_name, damage_class, description)
 
         # === Property Set: Damage Properties ===
-        pset_damage = model.create_entity(
-            "IfcPropertySet",
-            GlobalId=ifcopenshell.guid.new(),
-            OwnerHistory=None,
-            Name="PSet_DamageProperties",
-            Description="Damage metadata",
-            HasProperties=[]
-        )
-
-        def add_property(pset, name, value):
-            if value is not None:
-                prop = model.create_entity(
-                    "IfcPropertySingleValue",
-                    Name=name,
-                    Description=None,
-                    NominalValue=ifcopenshell.util.element.add_simple_value(str(value)),
-                    Unit=None
-                )
-                pset.HasProperties.append(prop)
-
-        add_property(pset_damage, "DamageClass", damage_class)
-        add_property(pset_damage, "Width", width)
-        add_property(pset_damage, "Depth", depth)
-        add_property(pset_damage, "Severity", severity)
-        add_property(pset_damage, "Coordinates", coords)
-
-        # Link properties to proxy
-        model.create_entity(
-            "IfcRelDefinesByProperties",
-            GlobalId=ifcopenshell.guid.new(),
-            OwnerHistory=None,
-            RelatedObjects=[damage_proxy],
-            RelatingPropertyDefinition=pset_damage
-        )
+        pset_damage = _create_pset(model, "PSet_DamageProperties", "Damage metadata",
+                                   [_single_value(model, name, value) for name, value in properties])
+        _create_rel_defines(model, [damage_proxy], pset_damage)
 
         # === Property Set: Label damage class on original element ===
-        pset_label = model.create_entity(
-            "IfcPropertySet",
-            GlobalId=ifcopenshell.guid.new(),
-            OwnerHistory=None,
-            Name="PSet_DamageLabels",
-            Description="Damage labels for element",
-            HasProperties=[]
-        )
-        add_property(pset_label, "DamageClass", damage_class)
-
-        model.create_entity(
-            "IfcRelDefinesByProperties",
-            GlobalId=ifcopenshell.guid.new(),
-            OwnerHistory=None,
-            RelatedObjects=[ifc_element],
-            RelatingPropertyDefinition=pset_label
-        )
+        pset_label = _create_pset(model, "PSet_DamageLabels", "Damage labels for element",
+                                  [_single_value(model, "DamageClass", damage_class)])
+        _create_rel_defines(model, [ifc_element], pset_label)
 
         # === Link proxy damage to IFC element ===
-        model.create_entity(
-            "IfcRelAggregates",
-            GlobalId=ifcopenshell.guid.new(),
-            OwnerHistory=None,
-            RelatingObject=ifc_element,
-            RelatedObjects=[damage_proxy]
-        )
+        _create_rel_aggregates(model, ifc_element, [damage_proxy])
+        count += 1
+    return count
+
+
+def emit_grouped(model, records, description="Damage instance from RDF"):
+    """Compact layout: damages grouped per host element.
+
+    Each element gets one IfcRelAggregates over all of its damage proxies and
+    one PSet_DamageLabels (distinct classes plus a count). Identical
+    ``(name, value)`` properties are shared between psets, and damages with
+    identical property sets share one pset and one IfcRelDefinesByProperties.
+    """
+    values = {}
+    psets = {}
+    by_element = {}
+
+    def single_value(name, value):
+        key = (name, str(value))
+        if key not in values:
+            values[key] = _single_value(model, name, value)
+        return values[key]
+
+    for _, ifc_element, damage_name, damage_class, properties in records:
+        damage_proxy = _create_proxy(model, damage_name, damage_class, description)
+        key = tuple((name, str(value)) for name, value in properties)
+        if key not in psets:
+            psets[key] = (_create_pset(model, "PSet_DamageProperties", "Damage metadata",
+                                       [single_value(name, value) for name, value in properties]), [])
+        psets[key][1].append(damage_proxy)
+
+        group = by_element.setdefault(ifc_element.id(), (ifc_element, [], {}))
+        group[1].append(damage_proxy)
+        group[2].setdefault(damage_class, None)
+
+    for pset_damage, proxies in psets.values():
+        _create_rel_defines(model, proxies, pset_damage)
+
+    for ifc_element, proxies, classes in by_element.values():
+        pset_label = _create_pset(model, "PSet_DamageLabels", "Damage labels for element", [
+            single_value("DamageClass", "; ".join(classes)),
+            single_value("DamageCount", len(proxies)),
+        ])
+        _create_rel_defines(model, [ifc_element], pset_label)
+        _create_rel_aggregates(model, ifc_element, proxies)
+
+    return sum(len(proxies) for _, proxies, _ in by_element.values())
+
+
+def add_damages_from_rdf(ifc_file_path, rdf_file_path, output_ifc_path, group_by_element=False):
+    # Load IFC model
+    with stage("ifc_link", "open_model"):
+        model = ifcopenshell.open(ifc_file_path)
+        elements_by_guid = {entity.GlobalId: entity for entity in model.by_type("IfcRoot")}
+
+    # Load RDF
+    with stage("ifc_link", "parse_rdf"):
+        g = Graph()
+        g.parse(rdf_file_path, format="ttl")
+
+    emit = emit_grouped if group_by_element else emit_per_damage
+    with stage("ifc_link", "emit", grouped=group_by_element):
+        count = emit(model, damage_records(g, elements_by_guid))
 
     # Save updated IFC
-    model.write(output_ifc_path)
-    print(f"Updated IFC saved to: {output_ifc_path}")
+    with stage("ifc_link", "write"):
+        model.write(output_ifc_path)
+    print(f"Updated IFC saved to: {output_ifc_path} ({count} damages)")
 
 
 # Example usage
-add_damages_from_rdf(
-    ifc_file_path="example.ifc",
-    rdf_file_path="ontology_output.ttl",
-    output_ifc_path="example_with_damages.ifc"
-)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attach RDF damages to an IFC model.")
+    parser.add_argument("--ifc", default="example.ifc")
+    parser.add_argument("--rdf", default="ontology_output.ttl")
+    parser.add_argument("--output", default="example_with_damages.ifc")
+    parser.add_argument("--group-by-element", action="store_true",
+                        help="one label pset and one aggregate relationship per host element")
+    args = parser.parse_args()
+
+    add_damages_from_rdf(
+        ifc_file_path=args.ifc,
+        rdf_file_path=args.rdf,
+        output_ifc_path=args.output,
+        group_by_element=args.group_by_element
+    )
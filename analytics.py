@@ -0,0 +1,156 @@
+import itertools
+import numpy as np
+
+# --- Crack growth analytics over the HAS_EPOCH / NEXT_EPOCH series ---
+METRICS = ("Width_mm", "Length_m")
+
+# One round trip for the whole selection: every damage's epochs come back as
+# a single ordered list of [Epoch, Width_mm, Length_m] triples.
+EPOCH_SERIES_QUERY = """
+MATCH (d:Damage)
+WHERE ($damage_ids IS NULL OR d.Damage_ID IN $damage_ids)
+  AND ($ifc_guid IS NULL OR d.IFC_GUID = $ifc_guid)
+  AND ($damage_type IS NULL OR d.DamageType = $damage_type)
+MATCH (d)-[:HAS_EPOCH]->(e:Epoch)
+WITH d, e
+ORDER BY d.Damage_ID, e.Epoch
+RETURN d.Damage_ID AS damage_id,
+       d.DamageType AS damage_type,
+       d.IFC_GUID AS ifc_guid,
+       collect([e.Epoch, e.Width_mm, e.Length_m]) AS series
+"""
+
+
+async def fetch_epoch_series(tx, damage_ids=None, ifc_guid=None, damage_type=None):
+    result = await tx.run(EPOCH_SERIES_QUERY, damage_ids=damage_ids,
+                          ifc_guid=ifc_guid, damage_type=damage_type)
+    return [record.data() async for record in result]
+
+
+def to_padded_arrays(rows):
+    """Ragged per-damage series -> ``(epochs, widths, lengths)`` arrays of shape (n_damages, max_epochs).
+
+    Missing values and padding are NaN. The scatter into the padded matrix is a
+    single fancy-indexing assignment, not a loop over damages.
+    """
+    lengths = np.fromiter((len(row["series"]) for row in rows), dtype=np.int64, count=len(rows))
+    n, width = len(rows), int(lengths.max()) if len(rows) else 0
+
+    triples = list(itertools.chain.from_iterable(row["series"] for row in rows))
+    flat = np.array(triples, dtype=np.float64).reshape(-1, 3)
+    row_index = np.repeat(np.arange(n), lengths)
+    col_index = np.arange(len(flat)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+    padded = np.full((3, n, width), np.nan)
+    padded[:, row_index, col_index] = flat.T
+    return padded[0], padded[1], padded[2]
+
+
+def growth_statistics(epochs, values, threshold=None):
+    """Vectorised growth statistics for every row of ``values`` (NaN = missing).
+
+    Returns per-epoch deltas and rates plus, per damage, the least-squares
+    growth slope (units per epoch), the latest value and, if ``threshold`` is
+    given, the extrapolated number of epochs until the slope reaches it.
+    """
+    valid = ~np.isnan(epochs) & ~np.isnan(values)
+    x = np.where(valid, epochs, np.nan)
+    y = np.where(valid, values, np.nan)
+
+    deltas = np.diff(y, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates = deltas / np.diff(x, axis=1)
+        rate_valid = np.isfinite(rates)
+        mean_rate = np.where(rate_valid, rates, 0.0).sum(axis=1) / rate_valid.sum(axis=1)
+
+    count = valid.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = np.nansum(x, axis=1) / count
+        y_mean = np.nansum(y, axis=1) / count
+        dx = np.where(valid, x - x_mean[:, None], 0.0)
+        dy = np.where(valid, y - y_mean[:, None], 0.0)
+        sxx = (dx * dx).sum(axis=1)
+        slope = np.where(sxx > 0, (dx * dy).sum(axis=1) / sxx, np.nan)
+        intercept = y_mean - slope * x_mean
+        syy = (dy * dy).sum(axis=1)
+        r_squared = np.where((sxx > 0) & (syy > 0), (dx * dy).sum(axis=1) ** 2 / (sxx * syy), np.nan)
+
+    # Latest observation = right-most valid column of each row
+    has_value = count > 0
+    last_col = np.where(has_value, valid.shape[1] - 1 - np.argmax(valid[:, ::-1], axis=1), 0)
+    rows = np.arange(len(values))
+    latest_epoch = np.where(has_value, epochs[rows, last_col], np.nan)
+    latest_value = np.where(has_value, values[rows, last_col], np.nan)
+    first_col = np.argmax(valid, axis=1)
+    total_growth = np.where(has_value, latest_value - values[rows, first_col], np.nan)
+
+    stats = {
+        "n_epochs": count,
+        "latest_epoch": latest_epoch,
+        "latest_value": latest_value,
+        "total_growth": total_growth,
+        "mean_rate": mean_rate,
+        "slope": slope,
+        "intercept": intercept,
+        "r_squared": r_squared,
+        "deltas": deltas,
+        "rates": rates,
+    }
+
+    if threshold is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            remaining = (threshold - latest_value) / slope
+        stats["epochs_to_threshold"] = np.where(
+            ~has_value, np.nan,
+            np.where(latest_value >= threshold, 0.0, np.where(slope > 0, remaining, np.inf))
+        )
+    return stats
+
+
+def _json_float(value):
+    value = float(value)
+    return value if np.isfinite(value) else None
+
+
+def analyze_growth(rows, metric="Width_mm", threshold=None, top=None, include_series=False):
+    """Rank damages by growth slope of ``metric``; fastest-growing first."""
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Expected one of {', '.join(METRICS)}.")
+    rows = [row for row in rows if row["series"]]
+    if not rows:
+        return []
+
+    epochs, widths, lengths = to_padded_arrays(rows)
+    values = widths if metric == "Width_mm" else lengths
+    stats = growth_statistics(epochs, values, threshold)
+
+    # NaN slopes (single-epoch series) sort last
+    order = np.argsort(np.where(np.isnan(stats["slope"]), -np.inf, stats["slope"]))[::-1]
+    if top is not None:
+        order = order[:top]
+
+    ranked = []
+    for i in order:
+        entry = {
+            "damage_id": rows[i]["damage_id"],
+            "damage_type": rows[i]["damage_type"],
+            "ifc_guid": rows[i]["ifc_guid"],
+            "n_epochs": int(stats["n_epochs"][i]),
+            "latest_epoch": _json_float(stats["latest_epoch"][i]),
+            "latest_value": _json_float(stats["latest_value"][i]),
+            "total_growth": _json_float(stats["total_growth"][i]),
+            "mean_rate": _json_float(stats["mean_rate"][i]),
+            "slope": _json_float(stats["slope"][i]),
+            "intercept": _json_float(stats["intercept"][i]),
+            "r_squared": _json_float(stats["r_squared"][i]),
+        }
+        if threshold is not None:
+            entry["epochs_to_threshold"] = _json_float(stats["epochs_to_threshold"][i])
+        if include_series:
+            n = len(rows[i]["series"])
+            entry["epochs"] = [_json_float(v) for v in epochs[i, :n]]
+            entry["values"] = [_json_float(v) for v in values[i, :n]]
+            entry["deltas"] = [_json_float(v) for v in stats["deltas"][i, :n - 1]]
+            entry["rates"] = [_json_float(v) for v in stats["rates"][i, :n - 1]]
+        ranked.append(entry)
+    return ranked
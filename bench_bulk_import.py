@@ -0,0 +1,55 @@
+"""Throughput of bulk_import.py on a synthetic archive.
+
+Writes --files JSON files holding --damages damages of --epochs epochs each
+(default 200 x 2500 x 20 = 10M epochs) into a scratch directory, converts
+them to neo4j-admin CSVs and prints the conversion throughput. A second run
+with --delta over the same archive measures the incremental no-op path.
+
+    python bench_bulk_import.py --files 200 --damages 2500 --epochs 20 --workers 8
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bulk_import import convert_directory
+from synthetic import damage_upload
+
+
+def write_archive(directory, files, damages, epochs, seed):
+    for file_index in range(files):
+        payload = damage_upload(damages, epochs, seed=f"{seed}-{file_index}", id_prefix=f"syn_{file_index:05d}")
+        with open(os.path.join(directory, f"flight_{file_index:05d}.json"), "w") as f:
+            json.dump(payload, f)
+
+
+def main(args):
+    scratch = tempfile.mkdtemp(prefix="bulk_import_bench_")
+    archive, output = os.path.join(scratch, "archive"), os.path.join(scratch, "csv")
+    os.makedirs(archive)
+    try:
+        start = time.perf_counter()
+        write_archive(archive, args.files, args.damages, args.epochs, args.seed)
+        print(f"generated {args.files * args.damages * args.epochs} epochs in {time.perf_counter() - start:.1f}s")
+
+        for delta in (False, True):
+            summary = convert_directory(archive, output, args.workers, delta)
+            label = "delta" if delta else "full"
+            print(f"{label:>5}: {summary['written']} in {summary['elapsed_s']}s "
+                  f"({summary['epochs_per_s']} epochs/s, {summary['duplicates_skipped']} duplicates skipped)")
+    finally:
+        if not args.keep:
+            shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--damages", type=int, default=2500)
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory")
+    main(parser.parse_args())
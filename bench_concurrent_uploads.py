@@ -0,0 +1,120 @@
+"""Concurrency benchmark for /upload_damage_json.
+
+Fires N uploads at once through the ASGI app and reports the wall time.
+By default the database is an in-process stand-in that sleeps for a fixed
+latency per Cypher round trip, once with a blocking sleep (what the old
+synchronous driver did to the event loop) and once with an awaited sleep
+(the async driver). Pass --neo4j to run against the instance in .env instead,
+e.g. a local test container:
+
+    docker run -p 7687:7687 -e NEO4J_AUTH=neo4j/test1234 neo4j:5
+    uri=bolt://localhost:7687 user=neo4j pwd=test1234 python bench_concurrent_uploads.py --neo4j
+"""
+import argparse
+import asyncio
+import json
+import time
+import types
+
+import httpx
+
+import main
+from cache import TTLCache
+from database import AsyncNeo4jConnection, driver_config, uri, user, pwd
+from synthetic import damage_upload
+
+
+# --- Stand-in database ---
+class _StandInResult:
+    # Summary counters as the driver reports them (nothing is ever created)
+    counters = types.SimpleNamespace(relationships_created=0)
+
+    async def consume(self):
+        return self
+
+    # No records: reads inside the write (summaries.previous_guids_async) find nothing
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        raise StopAsyncIteration
+
+
+class _StandInTx:
+    def __init__(self, latency, blocking):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def run(self, query, parameters=None, **kwargs):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        return _StandInResult()
+
+
+class StandInConnection:
+    def __init__(self, latency, blocking):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def execute_write(self, work, *args, **kwargs):
+        return await work(_StandInTx(self.latency, self.blocking), *args, **kwargs)
+
+
+# --- Workload ---
+def make_payload(n_damages, n_epochs, tag):
+    return json.dumps(damage_upload(n_damages, n_epochs, seed=tag, id_prefix=f"bench_{tag}")).encode("utf-8")
+
+
+async def run_uploads(db, concurrency, n_damages, n_epochs, chunk_size):
+    # httpx's ASGI transport does not run the lifespan handler
+    main.app.dependency_overrides[main.get_db] = lambda: db
+    main.app.state.cache = TTLCache()
+    payloads = [make_payload(n_damages, n_epochs, i) for i in range(concurrency)]
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def upload(body):
+            response = await client.post(
+                "/upload_damage_json",
+                params={"chunk_size": chunk_size},
+                files={"file": ("bench.json", body, "application/json")},
+            )
+            response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(upload(body) for body in payloads))
+        elapsed = time.perf_counter() - start
+
+    main.app.dependency_overrides.clear()
+    return elapsed
+
+
+async def bench(args):
+    results = {}
+    if args.neo4j:
+        db = AsyncNeo4jConnection(uri, user, pwd, **driver_config())
+        try:
+            results["neo4j_async"] = await run_uploads(db, args.concurrency, args.damages, args.epochs, args.chunk_size)
+        finally:
+            await db.close()
+    else:
+        for label, blocking in (("blocking_driver", True), ("async_driver", False)):
+            db = StandInConnection(args.latency, blocking)
+            results[label] = await run_uploads(db, args.concurrency, args.damages, args.epochs, args.chunk_size)
+
+    for label, elapsed in results.items():
+        print(f"{label:>16}: {args.concurrency} concurrent uploads in {elapsed:.3f}s "
+              f"({args.concurrency / elapsed:.1f} uploads/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--damages", type=int, default=50)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02, help="stand-in seconds per round trip")
+    parser.add_argument("--neo4j", action="store_true", help="use the Neo4j instance from .env")
+    asyncio.run(bench(parser.parse_args()))
@@ -0,0 +1,113 @@
+"""Damage lookup and IFC emission in RDF_to_IFC_link.
+
+Builds an IFC model with --elements walls and a Turtle file with about
+--triples damage triples (7 per damage: two type predicates, four
+properties and damageLocatedOn, plus one ifcGlobalId per element), then times:
+
+  legacy_lookup  the previous loop: g.subjects() with g.value/g.objects probes
+                 per subject and model.by_guid per hit
+  indexed_lookup collect_damages() + a prebuilt GlobalId dict
+  link_total     the whole add_damages_from_rdf run, including parse and write
+
+and, for the per-damage and the grouped (--group-by-element) emission, the
+time to add the entities, the time to write the file, its size and the time
+to open it again. --hosts puts all damages on that many elements, to model
+elements that carry hundreds of damages.
+
+    python bench_ifc_link.py --elements 100000 --triples 1000000
+    python bench_ifc_link.py --elements 1000 --hosts 100 --triples 700000 --skip-legacy
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import ifcopenshell
+from rdflib import Graph
+
+from RDF_to_IFC_link import CDO, add_damages_from_rdf, collect_damages, damage_records, emit_grouped, emit_per_damage
+from synthetic import write_damage_ttl, write_ifc_model
+
+TRIPLES_PER_DAMAGE = 7
+
+
+def legacy_lookup(g, model):
+    found = 0
+    for damage in g.subjects():
+        damage_types = list(g.objects(damage, CDO['Crack'])) + list(g.objects(damage, CDO['Spalling']))
+        if not damage_types:
+            continue
+        for key in ("hasName", "hasWidth", "hasDepth", "hasSeverity", "hasCoordinates"):
+            g.value(damage, CDO[key])
+        for obj in g.objects(damage, CDO['damageLocatedOn']):
+            ifc_guid = g.value(obj, CDO['ifcGlobalId'])
+            if ifc_guid:
+                model.by_guid(str(ifc_guid))
+                found += 1
+                break
+    return found
+
+
+def indexed_lookup(g, model):
+    elements_by_guid = {entity.GlobalId: entity for entity in model.by_type("IfcRoot")}
+    return sum(1 for row in collect_damages(g).values()
+               if elements_by_guid.get(str(row.get("guid"))) is not None)
+
+
+def emission(label, emit, ifc_path, g, output):
+    model = ifcopenshell.open(ifc_path)
+    elements_by_guid = {entity.GlobalId: entity for entity in model.by_type("IfcRoot")}
+    records = list(damage_records(g, elements_by_guid))
+
+    start = time.perf_counter()
+    emit(model, records)
+    build = time.perf_counter() - start
+    start = time.perf_counter()
+    model.write(output)
+    write = time.perf_counter() - start
+    start = time.perf_counter()
+    reopened = ifcopenshell.open(output)
+    load = time.perf_counter() - start
+
+    print(f"{label:>15}: build {build:6.2f}s  write {write:6.2f}s  load {load:6.2f}s  "
+          f"{os.path.getsize(output) / 2**20:7.1f} MB  {len(list(reopened))} entities")
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{label:>15}: {time.perf_counter() - start:8.2f}s  ({result})")
+
+
+def main(args):
+    scratch = tempfile.mkdtemp(prefix="ifc_link_bench_")
+    ifc_path, ttl_path = os.path.join(scratch, "model.ifc"), os.path.join(scratch, "damages.ttl")
+    try:
+        guids = write_ifc_model(ifc_path, args.elements, args.seed)
+        write_damage_ttl(ttl_path, guids, args.triples // TRIPLES_PER_DAMAGE, args.seed, args.hosts)
+
+        model = ifcopenshell.open(ifc_path)
+        g = Graph()
+        g.parse(ttl_path, format="ttl")
+        print(f"{args.elements} elements, {len(g)} triples")
+
+        if not args.skip_legacy:
+            timed("legacy_lookup", legacy_lookup, g, model)
+        timed("indexed_lookup", indexed_lookup, g, model)
+        timed("link_total", add_damages_from_rdf, ifc_path, ttl_path, os.path.join(scratch, "out.ifc"))
+
+        emission("per_damage", emit_per_damage, ifc_path, g, os.path.join(scratch, "per_damage.ifc"))
+        emission("grouped", emit_grouped, ifc_path, g, os.path.join(scratch, "grouped.ifc"))
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--triples", type=int, default=1_000_000)
+    parser.add_argument("--hosts", type=int, default=None, help="elements that carry damages (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-legacy", action="store_true")
+    main(parser.parse_args())
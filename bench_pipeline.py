@@ -0,0 +1,216 @@
+"""End-to-end benchmark of the ingestion, RDF and IFC paths, emitted as JSON.
+
+Generates a seeded synthetic workload (synthetic.py) and runs each stage in
+a fresh process, so its memory high-water mark is its own:
+
+  upload_damage_json    POST of the damage upload through the ASGI app, against
+                        an in-process stand-in database (--latency seconds per
+                        round trip) or, with --neo4j, the instance in .env
+  json_to_rdf           inference file -> Turtle
+  add_damages_from_rdf  damage TTL + IFC model -> IFC
+
+Each stage reports wall time (best of --repeat runs), peak RSS, the RSS
+before the stage started (imports), optionally the peak of Python
+allocations (--tracemalloc, which slows the stage down) and the sub-stage
+breakdown recorded by instrumentation.stage(). Store one file per commit
+to track regressions:
+
+    python bench_pipeline.py --damages 20000 --detections 50000 --elements 5000 -o bench/$(git rev-parse --short HEAD).json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+STAGES = ("upload_damage_json", "json_to_rdf", "add_damages_from_rdf")
+
+
+# --- Stages (run in the child process) ---
+async def _upload(paths, args):
+    import httpx
+
+    import main
+    from bench_concurrent_uploads import StandInConnection
+    from cache import TTLCache
+    from database import AsyncNeo4jConnection, driver_config, uri, user, pwd
+    from schema import bootstrap_schema_async
+
+    if args.neo4j:
+        db = AsyncNeo4jConnection(uri, user, pwd, **driver_config())
+        await bootstrap_schema_async(db)
+    else:
+        db = StandInConnection(args.latency, blocking=False)
+    # httpx's ASGI transport does not run the lifespan handler
+    main.app.dependency_overrides[main.get_db] = lambda: db
+    main.app.state.cache = TTLCache()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            with open(paths["upload"], "rb") as f:
+                response = await client.post(
+                    "/upload_damage_json",
+                    params={"chunk_size": args.chunk_size, "stream": args.stream, "batch_size": args.batch_size},
+                    files={"file": ("damages.json", f, "application/json")},
+                )
+        response.raise_for_status()
+    finally:
+        main.app.dependency_overrides.clear()
+        if args.neo4j:
+            await db.close()
+    report = response.json()
+    return {key: value for key, value in report.items() if key not in ("status", "timings")}
+
+
+def _json_to_rdf(paths, args):
+    from generate_RDF import json_to_rdf
+
+    output = os.path.join(paths["directory"], "inference.ttl")
+    json_to_rdf(paths["inference"], output)
+    return {"output_mb": round(os.path.getsize(output) / 2**20, 2)}
+
+
+def _add_damages_from_rdf(paths, args):
+    from RDF_to_IFC_link import add_damages_from_rdf
+
+    output = os.path.join(paths["directory"], "linked.ifc")
+    add_damages_from_rdf(paths["ifc"], paths["ttl"], output, args.group_by_element)
+    return {"output_mb": round(os.path.getsize(output) / 2**20, 2)}
+
+
+def _rss_mb(usage):
+    return round(usage.ru_maxrss / 1024, 1)
+
+
+def _run_stage(name, paths, args, queue):
+    from instrumentation import InMemoryExporter, add_exporter
+
+    exporter = InMemoryExporter()
+    add_exporter(exporter)
+    # Import everything the stage needs before measuring
+    if name == "upload_damage_json":
+        import main  # noqa: F401
+    baseline = _rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    start = time.perf_counter()
+    # Progress output of the stages goes to stderr; stdout is the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        if name == "upload_damage_json":
+            details = asyncio.run(_upload(paths, args))
+        elif name == "json_to_rdf":
+            details = _json_to_rdf(paths, args)
+        else:
+            details = _add_damages_from_rdf(paths, args)
+    seconds = time.perf_counter() - start
+
+    result = {"seconds": round(seconds, 4), "peak_rss_mb": _rss_mb(resource.getrusage(resource.RUSAGE_SELF)),
+              "baseline_rss_mb": baseline, **details}
+    if args.tracemalloc:
+        result["python_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+        tracemalloc.stop()
+
+    breakdown = {}
+    for record in exporter.stages:
+        key = f"{record['pipeline']}.{record['stage']}"
+        breakdown[key] = breakdown.get(key, 0.0) + record["seconds"]
+    result["stages"] = {key: round(seconds, 4) for key, seconds in breakdown.items()}
+    queue.put(result)
+
+
+# --- Harness ---
+def run_stage(name, paths, args):
+    # spawn, not fork: a forked child would start out with the generator's heap
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run_stage, args=(name, paths, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(args):
+    from synthetic import write_workload
+
+    scratch = tempfile.mkdtemp(prefix="pipeline_bench_")
+    try:
+        start = time.perf_counter()
+        paths = write_workload(scratch, args.elements, args.damages, args.epochs, args.detections,
+                               args.link_damages, args.seed)
+        paths["directory"] = scratch
+        generation = time.perf_counter() - start
+
+        results = {}
+        for name in args.stages:
+            runs = [run_stage(name, paths, args) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            results[name] = {**best, "runs_seconds": [run["seconds"] for run in runs]}
+
+        report = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": "neo4j" if args.neo4j else f"stand-in ({args.latency}s per round trip)",
+            "workload": {
+                "seed": args.seed, "elements": args.elements, "damages": args.damages, "epochs": args.epochs,
+                "detections": args.detections, "link_damages": args.link_damages,
+                "generation_seconds": round(generation, 2),
+                "input_mb": {name: round(os.path.getsize(path) / 2**20, 2)
+                             for name, path in paths.items() if name != "directory"},
+            },
+            "settings": {"chunk_size": args.chunk_size, "stream": args.stream, "batch_size": args.batch_size,
+                         "group_by_element": args.group_by_element, "repeat": args.repeat},
+            "results": results,
+        }
+    finally:
+        shutil.rmtree(scratch)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    from ingestion import DEFAULT_CHUNK_SIZE, DEFAULT_STREAM_BATCH_SIZE
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=1000)
+    parser.add_argument("--damages", type=int, default=5000, help="damages in the upload")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--detections", type=int, default=10_000)
+    parser.add_argument("--link-damages", type=int, default=10_000, help="damages in the TTL for the IFC link")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--stream", action="store_true", help="upload with stream=true")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_STREAM_BATCH_SIZE)
+    parser.add_argument("--group-by-element", action="store_true")
+    parser.add_argument("--latency", type=float, default=0.0, help="stand-in seconds per round trip")
+    parser.add_argument("--neo4j", action="store_true", help="use the Neo4j instance from .env")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the peak of Python allocations")
+    parser.add_argument("-o", "--output", default=None, help="also write the JSON report to this file")
+    main(parser.parse_args())
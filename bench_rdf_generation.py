@@ -0,0 +1,61 @@
+"""Turtle (json_to_rdf) vs streaming N-Triples (json_to_rdf_stream) on synthetic detections.
+
+Each variant runs in its own process so its peak RSS can be reported
+separately (pool workers are reported as "children").
+
+    python bench_rdf_generation.py --detections 200000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from generate_RDF import json_to_rdf, json_to_rdf_stream
+from synthetic import write_inference_file
+
+def _run(variant, json_file, output, workers, chunk_size, queue):
+    start = time.perf_counter()
+    if variant == "turtle":
+        json_to_rdf(json_file, output)
+    else:
+        json_to_rdf_stream(json_file, output, "nt", variant == "nt.gz", workers, chunk_size)
+    elapsed = time.perf_counter() - start
+    queue.put({
+        "seconds": round(elapsed, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "output_mb": round(os.path.getsize(output) / 2**20, 1),
+    })
+
+
+def main(args):
+    scratch = tempfile.mkdtemp(prefix="rdf_bench_")
+    json_file = os.path.join(scratch, "inference.json")
+    try:
+        write_inference_file(json_file, args.detections, args.seed, args.per_image)
+        print(f"{args.detections} detections, input {os.path.getsize(json_file) / 2**20:.1f} MB")
+
+        for variant in ("turtle", "nt", "nt.gz"):
+            queue = multiprocessing.Queue()
+            output = os.path.join(scratch, f"out.{'ttl' if variant == 'turtle' else variant}")
+            process = multiprocessing.Process(
+                target=_run, args=(variant, json_file, output, args.workers, args.chunk_size, queue))
+            process.start()
+            result = queue.get()
+            process.join()
+            print(f"{variant:>7}: {result}")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--detections", type=int, default=100_000)
+    parser.add_argument("--per-image", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+"""MATCH latency on Damage_ID / epoch_id with and without the schema indexes.
+
+Seeds N Epoch nodes (and N / epochs-per-damage Damage nodes) tagged with a
+bench_ prefix into the Neo4j instance from .env, then times random point
+lookups twice: once forced onto a label scan with a USING SCAN hint (the
+situation before schema.py existed) and once through the uniqueness
+constraint's index. The seeded nodes are removed afterwards unless --keep.
+
+    uri=bolt://localhost:7687 user=neo4j pwd=test1234 python bench_schema_lookup.py --nodes 1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from database import Neo4jConnection, driver_config, uri, user, pwd
+from schema import bootstrap_schema
+
+SEED_QUERY = """
+UNWIND range($start, $end - 1) AS i
+MERGE (d:Damage {Damage_ID: 'bench_damage_' + toString(i / $per_damage)})
+  ON CREATE SET d.DamageType = 'crack', d.IFC_GUID = 'bench_guid_' + toString(i % 1000)
+MERGE (e:Epoch {epoch_id: 'bench_damage_' + toString(i / $per_damage) + '_epoch_' + toString(i % $per_damage)})
+  ON CREATE SET e.Epoch = i % $per_damage, e.Width_mm = rand()
+MERGE (d)-[:HAS_EPOCH]->(e)
+"""
+
+CLEANUP_QUERY = """
+MATCH (n) WHERE (n:Damage AND n.Damage_ID STARTS WITH 'bench_damage_')
+             OR (n:Epoch AND n.epoch_id STARTS WITH 'bench_damage_')
+WITH n LIMIT $batch
+DETACH DELETE n
+RETURN count(*) AS deleted
+"""
+
+LOOKUPS = {
+    "epoch_scan": "MATCH (e:Epoch) USING SCAN e:Epoch WHERE e.epoch_id = $id RETURN e.Width_mm AS w",
+    "epoch_index": "MATCH (e:Epoch {epoch_id: $id}) RETURN e.Width_mm AS w",
+    "damage_scan": "MATCH (d:Damage) USING SCAN d:Damage WHERE d.Damage_ID = $id RETURN d.DamageType AS t",
+    "damage_index": "MATCH (d:Damage {Damage_ID: $id}) RETURN d.DamageType AS t",
+}
+
+
+def seed(db, nodes, per_damage, batch):
+    start = time.perf_counter()
+    for offset in range(0, nodes, batch):
+        db.query(SEED_QUERY, {"start": offset, "end": min(offset + batch, nodes), "per_damage": per_damage})
+    print(f"seeded {nodes} epochs in {time.perf_counter() - start:.1f}s")
+
+
+def cleanup(db, batch=10000):
+    while db.query(CLEANUP_QUERY, {"batch": batch})[0]["deleted"]:
+        pass
+
+
+def time_lookups(db, query, ids):
+    samples = []
+    for value in ids:
+        start = time.perf_counter()
+        db.query(query, {"id": value})
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), max(samples)
+
+
+def main(args):
+    db = Neo4jConnection(uri, user, pwd, **driver_config())
+    try:
+        bootstrap_schema(db)
+        seed(db, args.nodes, args.epochs_per_damage, args.batch)
+
+        rng = random.Random(args.seed)
+        damages = args.nodes // args.epochs_per_damage
+        damage_ids = [f"bench_damage_{rng.randrange(damages)}" for _ in range(args.samples)]
+        epoch_ids = [f"{d}_epoch_{rng.randrange(args.epochs_per_damage)}" for d in damage_ids]
+
+        for name, query in LOOKUPS.items():
+            ids = epoch_ids if name.startswith("epoch") else damage_ids
+            # The scan variants are orders of magnitude slower; sample fewer.
+            ids = ids[: max(1, len(ids) // 20)] if name.endswith("scan") else ids
+            median, worst = time_lookups(db, query, ids)
+            print(f"{name:>13}: median {median:8.2f} ms   max {worst:8.2f} ms   ({len(ids)} lookups)")
+    finally:
+        if not args.keep:
+            cleanup(db)
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=1_000_000)
+    parser.add_argument("--epochs-per-damage", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=20000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="leave the seeded nodes in place")
+    main(parser.parse_args())
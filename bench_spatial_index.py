@@ -0,0 +1,70 @@
+"""Spatial assignment of detections: BVH query vs brute force, cold vs cached index.
+
+Builds a model of --elements walls laid out on a grid (ifcopenshell.api, real
+geometry), then times:
+
+  cold_build     triangulation + BVH build + save (first run on a model)
+  cached_load    the same load_spatial_index call answered from the .npz file
+  bvh_query      SpatialIndex.assign for --detections random points
+  brute_force    every point against every box in NumPy (same answers)
+
+    python bench_spatial_index.py --elements 5000 --detections 10000
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from spatial_index import _box_distance_sq, load_spatial_index
+from synthetic import write_ifc_model
+
+SPACING = 5.0
+
+
+def brute_force(index, points, block=200):
+    result = []
+    for start in range(0, len(points), block):
+        d = _box_distance_sq(points[start:start + block, None, :], index.bounds[None, :, :3], index.bounds[None, :, 3:])
+        order = np.lexsort((np.broadcast_to(index.volumes, d.shape), d), axis=1)[:, 0]
+        result.append(order)
+    return np.concatenate(result)
+
+
+def timed(label, fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    print(f"{label:>12}: {time.perf_counter() - start:8.3f}s")
+    return result
+
+
+def main(args):
+    scratch = tempfile.mkdtemp(prefix="spatial_bench_")
+    model_path, index_dir = os.path.join(scratch, "model.ifc"), os.path.join(scratch, "index")
+    try:
+        write_ifc_model(model_path, args.elements, args.seed, geometry=True, spacing=SPACING)
+        extent = int(np.ceil(np.sqrt(args.elements))) * SPACING
+        rng = np.random.default_rng(args.seed)
+        points = rng.uniform([0, 0, 0], [extent, extent, 3], (args.detections, 3))
+        print(f"{args.elements} elements, {args.detections} detections")
+
+        index = timed("cold_build", load_spatial_index, model_path, index_dir)
+        timed("cached_load", load_spatial_index, model_path, index_dir)
+        indices, _ = timed("bvh_query", index.query, points)
+        timed("assign", index.assign, points)
+        if not args.skip_brute_force:
+            expected = timed("brute_force", brute_force, index, points)
+            print(f"{'agreement':>12}: {np.mean(indices == expected):.4f}")
+    finally:
+        shutil.rmtree(scratch)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--elements", type=int, default=5000)
+    parser.add_argument("--detections", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-brute-force", action="store_true")
+    main(parser.parse_args())
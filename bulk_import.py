@@ -0,0 +1,236 @@
+"""Convert a directory of damage JSON uploads into neo4j-admin import CSVs.
+
+Every input file has the same ``{ "Damage_001": { Metadata, Epochs } }``
+layout as /upload_damage_json and is flattened with the same rules
+(ingestion.add_damage_params), so the offline import produces exactly the
+graph the API would: Damage and Epoch nodes plus HAS_EPOCH, NEXT_EPOCH and
+the typed damage_relations relationships.
+
+    python bulk_import.py archive/ import_csv/ --workers 8
+    neo4j-admin database import full --nodes=import_csv/damages_header.csv,import_csv/damages.csv ...
+
+Files are read in sorted path order. When a Damage_ID or epoch_id occurs
+more than once, the row converted last is kept, as when the files are
+uploaded through the API in that order. Relations to entries past the end of
+a file are counted as unresolved_relations and not written, as ingestion
+does.
+
+With --delta, ids already listed in the output directory's manifest are
+skipped and only new nodes/relationships are written, for use with
+``neo4j-admin database import incremental``.
+
+The import bypasses the API, so build the per-element damage summaries
+afterwards with ``python summaries.py``.
+"""
+import argparse
+import csv
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+import ijson
+
+from ingestion import add_damage_params, new_ingestion_params
+from relations import RelationResolver
+
+ARRAY_DELIMITER = ";"
+
+# --- CSV layout (header files are written separately, as neo4j-admin prefers) ---
+DAMAGE_COLUMNS = ("Damage_ID", "DamageType", "Image_Filename", "IFC_Filepath", "IFC_Data", "IFC_Element", "IFC_GUID")
+EPOCH_COLUMNS = ("epoch_id", "Epoch", "Storage_Path", "ReferenceCoOrdinateSystem", "Length_m", "Width_mm",
+                 "Position_3D_Axis_X", "Position_3D_Axis_Y", "Position_3D_Axis_Z", "Max_Width_3D_Position")
+
+HEADERS = {
+    "damages": ["Damage_ID:ID(Damage)", "DamageType", "Image_Filename", "IFC_Filepath", "IFC_Data",
+                "IFC_Element", "IFC_GUID", ":LABEL"],
+    "epochs": ["epoch_id:ID(Epoch)", "Epoch:int", "Storage_Path", "ReferenceCoOrdinateSystem",
+               "Length_m:double", "Width_mm:double", "Position_3D_Axis_X:double[]",
+               "Position_3D_Axis_Y:double[]", "Position_3D_Axis_Z:double[]",
+               "Max_Width_3D_Position:point{crs:cartesian-3D}", ":LABEL"],
+    "has_epoch": [":START_ID(Damage)", ":END_ID(Epoch)", ":TYPE"],
+    "next_epoch": [":START_ID(Epoch)", ":END_ID(Epoch)", ":TYPE"],
+    "relations": [":START_ID(Damage)", ":END_ID(Damage)", ":TYPE"],
+}
+
+MANIFESTS = {"damages": "manifest_damage_ids.txt", "epochs": "manifest_epoch_ids.txt"}
+
+
+# --- Row formatting (runs in the worker processes) ---
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, list):
+        return ARRAY_DELIMITER.join(map(repr, value))
+    if isinstance(value, dict):
+        return "{x:%r, y:%r, z:%r}" % (value["x"], value["y"], value["z"])
+    return value
+
+
+def _convert_file(path):
+    params = new_ingestion_params()
+    relations = RelationResolver()
+    with open(path, "rb") as f:
+        for damage_key, damage_obj in ijson.kvitems(f, "", use_float=True):
+            add_damage_params(params, damage_key, damage_obj, relations)
+
+    return path, {
+        "unresolved_relations": relations.unresolved,
+        "damages": [[_cell(row[c]) for c in DAMAGE_COLUMNS] + ["Damage"] for row in params["damages"]],
+        "epochs": [[_cell(row[c]) for c in EPOCH_COLUMNS] + ["Epoch"] for row in params["epochs"]],
+        "has_epoch": [[row["Damage_ID"], row["epoch_id"], "HAS_EPOCH"] for row in params["has_epoch"]],
+        "next_epoch": [[row["e1"], row["e2"], "NEXT_EPOCH"] for row in params["next_epoch"]],
+        "relations": [[row["source"], row["target"], row["relation_type"]] for row in params["relations"]],
+    }
+
+
+def _safe_convert(path):
+    try:
+        return _convert_file(path)
+    except Exception as e:
+        return path, e
+
+
+# --- Writer (runs in the parent, which owns deduplication) ---
+class CsvWriter:
+    """Deduplicating CSV writer; feed it ``_convert_file`` results in file order.
+
+    A node id seen again replaces the earlier row, so nodes are held until
+    ``close``. Relationships are written as they arrive, once each, when an
+    end is a node of this import.
+    """
+
+    def __init__(self, output_dir, delta=False):
+        self.output_dir = output_dir
+        self.delta = delta
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.known = {label: self._load_manifest(label) if delta else set() for label in MANIFESTS}
+        self.nodes = {label: {} for label in MANIFESTS}
+        self.seen_relationships = {name: set() for name in ("has_epoch", "next_epoch", "relations")}
+        self.counts = {name: 0 for name in HEADERS}
+        self.duplicates = 0
+        self.unresolved_relations = 0
+
+        prefix = "delta_" if delta else ""
+        self._files = {}
+        self._writers = {}
+        for name, header in HEADERS.items():
+            with open(os.path.join(output_dir, f"{prefix}{name}_header.csv"), "w", newline="") as f:
+                csv.writer(f).writerow(header)
+            self._files[name] = open(os.path.join(output_dir, f"{prefix}{name}.csv"), "w", newline="")
+            self._writers[name] = csv.writer(self._files[name])
+
+    def _load_manifest(self, label):
+        path = os.path.join(self.output_dir, MANIFESTS[label])
+        if not os.path.exists(path):
+            return set()
+        with open(path) as f:
+            return {line.rstrip("\n") for line in f}
+
+    def _add_node(self, label, row):
+        node_id = row[0]
+        if node_id in self.known[label] or node_id in self.nodes[label]:
+            self.duplicates += 1
+        if node_id not in self.known[label]:
+            # Last write wins, as with MERGE ... SET through the API
+            self.nodes[label][node_id] = row
+
+    def _add_relationship(self, name, row, start_label, end_label):
+        key = tuple(row)
+        if key in self.seen_relationships[name]:
+            return
+        if row[0] not in self.nodes[start_label] and row[1] not in self.nodes[end_label]:
+            return
+        self.seen_relationships[name].add(key)
+        self._writers[name].writerow(row)
+        self.counts[name] += 1
+
+    def write(self, rows):
+        for row in rows["damages"]:
+            self._add_node("damages", row)
+        for row in rows["epochs"]:
+            self._add_node("epochs", row)
+        for row in rows["has_epoch"]:
+            self._add_relationship("has_epoch", row, "damages", "epochs")
+        for row in rows["next_epoch"]:
+            self._add_relationship("next_epoch", row, "epochs", "epochs")
+        for row in rows["relations"]:
+            self._add_relationship("relations", row, "damages", "damages")
+        self.unresolved_relations += rows["unresolved_relations"]
+
+    def close(self):
+        for label, nodes in self.nodes.items():
+            self._writers[label].writerows(nodes.values())
+            self.counts[label] = len(nodes)
+        for f in self._files.values():
+            f.close()
+        # A full import replaces the database, so it also replaces the manifest
+        for label, filename in MANIFESTS.items():
+            with open(os.path.join(self.output_dir, filename), "a" if self.delta else "w") as f:
+                for node_id in self.nodes[label]:
+                    f.write(f"{node_id}\n")
+
+    def import_command(self, database="neo4j"):
+        prefix = "delta_" if self.delta else ""
+        path = lambda name: os.path.join(self.output_dir, f"{prefix}{name}")
+        mode = "incremental --force" if self.delta else "full"
+        return (
+            f"neo4j-admin database import {mode} {database} "
+            f"--array-delimiter='{ARRAY_DELIMITER}' "
+            # damage_relations may name Damage_IDs from outside this import
+            f"--skip-bad-relationships=true "
+            f"--nodes={path('damages_header.csv')},{path('damages.csv')} "
+            f"--nodes={path('epochs_header.csv')},{path('epochs.csv')} "
+            f"--relationships={path('has_epoch_header.csv')},{path('has_epoch.csv')} "
+            f"--relationships={path('next_epoch_header.csv')},{path('next_epoch.csv')} "
+            f"--relationships={path('relations_header.csv')},{path('relations.csv')}"
+        )
+
+
+def convert_directory(input_dir, output_dir, workers=None, delta=False, pattern="*.json"):
+    """Convert every matching file in ``input_dir``; returns a summary dict."""
+    paths = sorted(glob.glob(os.path.join(input_dir, "**", pattern), recursive=True))
+    writer = CsvWriter(output_dir, delta)
+    failures = []
+
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        # In path order, so that the last duplicate is the same on every run
+        for path, rows in pool.imap(_safe_convert, paths, chunksize=4):
+            if isinstance(rows, Exception):
+                failures.append({"file": path, "error": str(rows)})
+                continue
+            writer.write(rows)
+    writer.close()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "files": len(paths),
+        "failed_files": failures,
+        "written": writer.counts,
+        "duplicates_skipped": writer.duplicates,
+        "unresolved_relations": writer.unresolved_relations,
+        "elapsed_s": round(elapsed, 3),
+        "epochs_per_s": round(writer.counts["epochs"] / elapsed, 1) if elapsed else None,
+        "import_command": writer.import_command(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--delta", action="store_true", help="only emit ids not in the output manifest")
+    parser.add_argument("--pattern", default="*.json")
+    args = parser.parse_args()
+
+    summary = convert_directory(args.input_dir, args.output_dir, args.workers, args.delta, args.pattern)
+    for failure in summary["failed_files"]:
+        print(f"Warning: skipped {failure['file']}: {failure['error']}")
+    print(f"{summary['files']} files -> {summary['written']} "
+          f"({summary['duplicates_skipped']} duplicates skipped, "
+          f"{summary['unresolved_relations']} unresolved relations) in {summary['elapsed_s']}s "
+          f"= {summary['epochs_per_s']} epochs/s")
+    print(summary["import_command"])
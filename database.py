@@ -0,0 +1,144 @@
+from contextlib import contextmanager, asynccontextmanager
+from neo4j import GraphDatabase, AsyncGraphDatabase
+from dotenv import load_dotenv
+import os, threading, time
+
+from instrumentation import instrument_async_work, instrument_work, observe_query
+
+# --- Load environment variables ---
+load_dotenv()
+uri = os.getenv('uri')
+user = os.getenv('user')
+pwd = os.getenv('pwd')
+
+# --- Connection pool settings (same .env file as the credentials) ---
+max_connection_pool_size = int(os.getenv('max_connection_pool_size', 100))
+connection_acquisition_timeout = float(os.getenv('connection_acquisition_timeout', 60))
+max_connection_lifetime = float(os.getenv('max_connection_lifetime', 3600))
+
+
+def driver_config():
+    return {
+        "max_connection_pool_size": max_connection_pool_size,
+        "connection_acquisition_timeout": connection_acquisition_timeout,
+        "max_connection_lifetime": max_connection_lifetime,
+    }
+
+
+# --- Session bookkeeping shared by the sync and async wrappers ---
+class _PoolStatsMixin:
+    def _init_stats(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._sessions_active = 0
+        self._sessions_peak = 0
+        self._sessions_total = 0
+
+    def _session_opened(self):
+        with self._lock:
+            self._sessions_active += 1
+            self._sessions_total += 1
+            self._sessions_peak = max(self._sessions_peak, self._sessions_active)
+
+    def _session_closed(self):
+        with self._lock:
+            self._sessions_active -= 1
+
+    def pool_stats(self):
+        with self._lock:
+            stats = {
+                "max_connection_pool_size": self.config.get("max_connection_pool_size"),
+                "connection_acquisition_timeout": self.config.get("connection_acquisition_timeout"),
+                "max_connection_lifetime": self.config.get("max_connection_lifetime"),
+                "sessions_active": self._sessions_active,
+                "sessions_peak": self._sessions_peak,
+                "sessions_total": self._sessions_total,
+            }
+        stats["connections"] = _driver_pool_connections(self.driver)
+        return stats
+
+
+# --- Neo4j Driver Wrapper ---
+class Neo4jConnection(_PoolStatsMixin):
+    def __init__(self, uri, user, pwd, **config):
+        self.driver = GraphDatabase.driver(uri, auth=(user, pwd), **config)
+        self._init_stats(config)
+
+    def close(self):
+        self.driver.close()
+
+    @contextmanager
+    def _session(self, db=None):
+        self._session_opened()
+        try:
+            with self.driver.session(database=db) if db else self.driver.session() as session:
+                yield session
+        finally:
+            self._session_closed()
+
+    def query(self, query, parameters=None, db=None):
+        with self._session(db) as session:
+            start = time.perf_counter()
+            result = session.run(query, parameters)
+            records = [record.data() for record in result]
+            observe_query(query, parameters, "auto", time.perf_counter() - start)
+            return records
+
+    # Transaction functions get a timed transaction (see instrumentation.py)
+    def execute_read(self, work, *args, db=None, **kwargs):
+        with self._session(db) as session:
+            return session.execute_read(instrument_work(work, "read"), *args, **kwargs)
+
+    def execute_write(self, work, *args, db=None, **kwargs):
+        with self._session(db) as session:
+            return session.execute_write(instrument_work(work, "write"), *args, **kwargs)
+
+
+# --- Async Neo4j Driver Wrapper (used by the FastAPI endpoints) ---
+class AsyncNeo4jConnection(_PoolStatsMixin):
+    def __init__(self, uri, user, pwd, **config):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=(user, pwd), **config)
+        self._init_stats(config)
+
+    async def close(self):
+        await self.driver.close()
+
+    @asynccontextmanager
+    async def _session(self, db=None):
+        self._session_opened()
+        try:
+            async with self.driver.session(database=db) if db else self.driver.session() as session:
+                yield session
+        finally:
+            self._session_closed()
+
+    async def query(self, query, parameters=None, db=None):
+        async with self._session(db) as session:
+            start = time.perf_counter()
+            result = await session.run(query, parameters)
+            records = [record.data() async for record in result]
+            observe_query(query, parameters, "auto", time.perf_counter() - start)
+            return records
+
+    async def execute_read(self, work, *args, db=None, **kwargs):
+        async with self._session(db) as session:
+            return await session.execute_read(instrument_async_work(work, "read"), *args, **kwargs)
+
+    async def execute_write(self, work, *args, db=None, **kwargs):
+        async with self._session(db) as session:
+            return await session.execute_write(instrument_async_work(work, "write"), *args, **kwargs)
+
+
+def _driver_pool_connections(driver):
+    # The driver has no public pool metrics; read its pool defensively so a
+    # driver upgrade degrades to an empty report instead of an error.
+    pool = getattr(driver, "_pool", None)
+    connections = getattr(pool, "connections", None)
+    if not connections:
+        return {}
+    report = {}
+    for address, conns in list(connections.items()):
+        conns = list(conns)
+        in_use = sum(1 for conn in conns if getattr(conn, "in_use", False))
+        report[str(address)] = {"open": len(conns), "in_use": in_use, "idle": len(conns) - in_use}
+    return report
@@ -1,5 +1,15 @@
+import argparse
+import gzip
 import json
-from rdflib import Graph, Literal, RDF, RDFS, Namespace, XSD, OWL, URIRef, BNode
+import os
+from collections import deque
+from multiprocessing import Pool
+
+import ijson
+from rdflib import Dataset, Graph, Literal, RDF, RDFS, Namespace, XSD, OWL, URIRef, BNode
+
+from instrumentation import stage
+from spatial_index import assign_detections, load_spatial_index
 
 # Namespaces
 EX = Namespace("http://example.org/damageInstances#")
@@ -17,14 +27,7 @@ VOAF = Namespace("http://purl.org/vocommons/voaf#")
 DOT = Namespace("https://w3id.org/dot#")
 IFC = Namespace("https://standards.buildingsmart.org/IFC/DEV/IFC4_2/OWL#")
 
-def json_to_rdf(json_file, rdf_output):
-    # Load JSON inference file
-    with open(json_file, "r") as f:
-        data = json.load(f)
-
-    g = Graph()
-
-    # Bind prefixes
+def bind_prefixes(g):
     g.bind("ex", EX)
     g.bind("cdo", CDO)
     g.bind("dce", DCE)
@@ -40,6 +43,8 @@ def json_to_rdf(json_file, rdf_output):
     g.bind("dot", DOT)
     g.bind("ifc", IFC)
 
+
+def add_ontology_header(g):
     #################################################################
     # Ontology Metadata
     #################################################################
@@ -113,55 +118,183 @@ def json_to_rdf(json_file, rdf_output):
     g.add((CDO.Slab, RDFS.label, Literal("Slab", lang="en")))
     g.add((CDO.Slab, OWL.equivalentClass, IFC.IfcSlab))
 
+
+def add_detection(g, det, counter):
+    # One building element + one damage instance per detection; `counter`
+    # numbers both, as it always has (element_001 <-> crack_001, ...).
+    damage_class = det["damage_class"]
+    params = det["damage_parameters"]
+    coords = det["damage_location_3D"]
+    ifc_element = det["ifc_element"]
+    ifc_guid = det["ifc_guid"]
+
+    # Building Element instance
+    elem_uri = EX[f"{ifc_element.lower()}_{counter:03d}"]
+    g.add((elem_uri, RDF.type, CDO[ifc_element]))
+    g.add((elem_uri, RDFS.label, Literal(f"{ifc_element} instance {counter}")))
+    g.add((elem_uri, CDO.ifcGlobalId, Literal(ifc_guid, datatype=XSD.string)))
+
+    # Damage instance
+    damage_uri = EX[f"{damage_class}_{counter:03d}"]
+    g.add((damage_uri, RDF.type, CDO[damage_class.capitalize()]))
+
+    # Add parameters
+    for k, v in params.items():
+        if isinstance(v, (int, float)):
+            g.add((damage_uri, CDO[k], Literal(v, datatype=XSD.decimal)))
+        else:
+            g.add((damage_uri, CDO[k], Literal(v, datatype=XSD.string)))
+
+    # Add coordinates
+    coord_str = "POLYGON((" + ", ".join([f"{p['x']} {p['y']} {p['z']}" for p in coords]) + "))"
+    g.add((damage_uri, CDO.hasCoordinates, Literal(coord_str, datatype=XSD.string)))
+
+    # isStructural heuristic
+    is_structural = params.get("severity_level", "").lower() in ["medium", "high"]
+    g.add((damage_uri, CDO.isStructural, Literal(is_structural, datatype=XSD.boolean)))
+
+    # Link to element
+    g.add((damage_uri, CDO.damageLocatedOn, elem_uri))
+
+
+def json_to_rdf(json_file, rdf_output, ifc_model=None):
+    # Load JSON inference file
+    with stage("rdf", "load"):
+        with open(json_file, "r") as f:
+            data = json.load(f)
+
+    # Fill in missing ifc_element/ifc_guid from the model's geometry
+    if ifc_model:
+        with stage("rdf", "assign"):
+            detections = [det for result in data["inference_results"] for det in result["detections"]]
+            counts = assign_detections(detections, load_spatial_index(ifc_model))
+        print(f"Assigned {counts['assigned']} detections to IFC elements ({counts['unassigned']} unassigned)")
+
+    g = Graph()
+    bind_prefixes(g)
+    add_ontology_header(g)
+
     #################################################################
     # Building Elements and Damage Instances from JSON
     #################################################################
-    element_counter = 1
-    damage_counter = 1
-
-    for result in data["inference_results"]:
-        for det in result["detections"]:
-            damage_class = det["damage_class"]
-            params = det["damage_parameters"]
-            coords = det["damage_location_3D"]
-            ifc_element = det["ifc_element"]
-            ifc_guid = det["ifc_guid"]
-
-            # Building Element instance
-            elem_uri = EX[f"{ifc_element.lower()}_{element_counter:03d}"]
-            g.add((elem_uri, RDF.type, CDO[ifc_element]))
-            g.add((elem_uri, RDFS.label, Literal(f"{ifc_element} instance {element_counter}")))
-            g.add((elem_uri, CDO.ifcGlobalId, Literal(ifc_guid, datatype=XSD.string)))
-
-            # Damage instance
-            damage_uri = EX[f"{damage_class}_{damage_counter:03d}"]
-            g.add((damage_uri, RDF.type, CDO[damage_class.capitalize()]))
-
-            # Add parameters
-            for k, v in params.items():
-                if isinstance(v, (int, float)):
-                    g.add((damage_uri, CDO[k], Literal(v, datatype=XSD.decimal)))
-                else:
-                    g.add((damage_uri, CDO[k], Literal(v, datatype=XSD.string)))
-
-            # Add coordinates
-            coord_str = "POLYGON((" + ", ".join([f"{p['x']} {p['y']} {p['z']}" for p in coords]) + "))"
-            g.add((damage_uri, CDO.hasCoordinates, Literal(coord_str, datatype=XSD.string)))
-
-            # isStructural heuristic
-            is_structural = params.get("severity_level", "").lower() in ["medium", "high"]
-            g.add((damage_uri, CDO.isStructural, Literal(is_structural, datatype=XSD.boolean)))
-
-            # Link to element
-            g.add((damage_uri, CDO.damageLocatedOn, elem_uri))
-
-            element_counter += 1
-            damage_counter += 1
+    counter = 1
+
+    with stage("rdf", "build"):
+        for result in data["inference_results"]:
+            for det in result["detections"]:
+                add_detection(g, det, counter)
+                counter += 1
 
     # Serialize RDF to TTL
-    g.serialize(rdf_output, format="turtle")
+    with stage("rdf", "serialize", triples=len(g)):
+        g.serialize(rdf_output, format="turtle")
     print(f"Full RDF ontology saved to {rdf_output}")
 
 
+#################################################################
+# Streaming mode: N-Triples / N-Quads, converted in parallel chunks
+#################################################################
+STREAM_FORMATS = {"nt": "nt", "ntriples": "nt", "nq": "nquads", "nquads": "nquads"}
+
+
+def _serialize_chunk(g, rdf_format, graph_uri):
+    if rdf_format == "nquads":
+        ds = Dataset()
+        named = ds.graph(URIRef(graph_uri))
+        for triple in g:
+            named.add(triple)
+        return ds.serialize(format="nquads")
+    return g.serialize(format="nt")
+
+
+def _convert_chunk(task):
+    # Runs in a worker process: a small, short-lived graph per chunk keeps
+    # memory bounded by the chunk size instead of the campaign size.
+    start_counter, detections, rdf_format, graph_uri = task
+    g = Graph()
+    for offset, det in enumerate(detections):
+        add_detection(g, det, start_counter + offset)
+    return _serialize_chunk(g, rdf_format, graph_uri)
+
+
+def _iter_detection_chunks(json_file, chunk_size, rdf_format, graph_uri, index=None):
+    counter = 1
+    chunk = []
+    with open(json_file, "rb") as f:
+        for result in ijson.items(f, "inference_results.item", use_float=True):
+            for det in result["detections"]:
+                chunk.append(det)
+                if len(chunk) >= chunk_size:
+                    if index is not None:
+                        assign_detections(chunk, index)
+                    yield counter, chunk, rdf_format, graph_uri
+                    counter += len(chunk)
+                    chunk = []
+    if chunk:
+        if index is not None:
+            assign_detections(chunk, index)
+        yield counter, chunk, rdf_format, graph_uri
+
+
+def json_to_rdf_stream(json_file, rdf_output, rdf_format="nt", compress=None,
+                       workers=None, chunk_size=2000, graph_uri=str(EX), ifc_model=None):
+    """Streaming counterpart of ``json_to_rdf`` for very large inference files.
+
+    Writes the ontology header once, then converts ``inference_results`` in
+    chunks of ``chunk_size`` detections across a process pool and appends each
+    chunk, in order, as N-Triples (``rdf_format="nt"``) or N-Quads
+    (``"nq"``, in named graph ``graph_uri``). Output is gzip-compressed when
+    ``compress`` is true or ``rdf_output`` ends in ``.gz``. Subjects and
+    triples are identical to ``json_to_rdf``; only blank node labels differ.
+    With ``ifc_model``, each chunk's missing elements are assigned through
+    the model's spatial index before conversion.
+    """
+    rdf_format = STREAM_FORMATS[rdf_format]
+    if compress is None:
+        compress = rdf_output.endswith(".gz")
+    opener = gzip.open if compress else open
+
+    header = Graph()
+    add_ontology_header(header)
+    index = None
+    if ifc_model:
+        with stage("rdf", "spatial_index"):
+            index = load_spatial_index(ifc_model)
+
+    chunks = 0
+    with stage("rdf", "stream", format=rdf_format), opener(rdf_output, "wt", encoding="utf-8") as out:
+        out.write(_serialize_chunk(header, rdf_format, graph_uri))
+        with Pool(workers) as pool:
+            # Pool.imap would drain the whole input into its task queue; keep
+            # a bounded window of chunks in flight and write them in order.
+            max_in_flight = 2 * (workers or os.cpu_count() or 1)
+            pending = deque()
+            for task in _iter_detection_chunks(json_file, chunk_size, rdf_format, graph_uri, index):
+                pending.append(pool.apply_async(_convert_chunk, (task,)))
+                if len(pending) >= max_in_flight:
+                    out.write(pending.popleft().get())
+                    chunks += 1
+            while pending:
+                out.write(pending.popleft().get())
+                chunks += 1
+
+    print(f"Streamed RDF ({rdf_format}, {chunks} chunks) saved to {rdf_output}")
+
+
 if __name__ == "__main__":
-    json_to_rdf("inference_data.json", "ontology_output.ttl")
+    parser = argparse.ArgumentParser(description="Convert inference JSON to RDF")
+    parser.add_argument("json_file", nargs="?", default="inference_data.json")
+    parser.add_argument("rdf_output", nargs="?", default="ontology_output.ttl")
+    parser.add_argument("--stream", action="store_true", help="stream N-Triples/N-Quads in parallel chunks")
+    parser.add_argument("--format", default="nt", choices=sorted(STREAM_FORMATS))
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--ifc-model", default=None, help="assign detections without ifc_guid to this model's elements")
+    args = parser.parse_args()
+
+    if args.stream:
+        json_to_rdf_stream(args.json_file, args.rdf_output, args.format, args.gzip or None,
+                           args.workers, args.chunk_size, ifc_model=args.ifc_model)
+    else:
+        json_to_rdf(args.json_file, args.rdf_output, args.ifc_model)
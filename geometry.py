@@ -0,0 +1,150 @@
+import json
+import numpy as np
+
+# --- Epoch geometry as native Neo4j properties ---
+# Position_3D_Axis is stored as three float lists (Position_3D_Axis_X/_Y/_Z)
+# and Max_Width_3D_Position as a cartesian-3D point, which the point index in
+# schema.py makes searchable by bounding box.
+AXES = ("x", "y", "z")
+POSITION_PROPERTIES = tuple(f"Position_3D_Axis_{axis.upper()}" for axis in AXES)
+
+
+def position_axes(position):
+    """``{"x": [...], "y": [...], "z": [...]}`` -> ``{"Position_3D_Axis_X": [floats], ...}``.
+
+    Neo4j lists must be homogeneous and null-free, so missing axes become None
+    (the property is not stored) and values are coerced to float.
+    """
+    position = position or {}
+    axes = {}
+    for axis, prop in zip(AXES, POSITION_PROPERTIES):
+        values = position.get(axis)
+        axes[prop] = [float(v) for v in values] if values and None not in values else None
+    return axes
+
+
+def max_width_point(position):
+    """``{"x", "y", "z"}`` -> map accepted by Cypher ``point()``, or None if incomplete."""
+    if not position or any(position.get(axis) is None for axis in AXES):
+        return None
+    return {axis: float(position[axis]) for axis in AXES}
+
+
+# --- Bounding-box search ---
+EPOCHS_IN_BBOX_QUERY = """
+MATCH (e:Epoch)
+WHERE point.withinBBox(e.Max_Width_3D_Position, point($lower), point($upper))
+MATCH (d:Damage)-[:HAS_EPOCH]->(e)
+WHERE $damage_type IS NULL OR d.DamageType = $damage_type
+RETURN e {.*, Damage_ID: d.Damage_ID, DamageType: d.DamageType} AS epoch
+ORDER BY e.epoch_id
+LIMIT $limit
+"""
+
+
+async def epochs_in_bbox(tx, lower, upper, damage_type=None, limit=1000):
+    result = await tx.run(EPOCHS_IN_BBOX_QUERY, lower=lower, upper=upper,
+                          damage_type=damage_type, limit=limit)
+    return [record["epoch"] async for record in result]
+
+
+# --- NumPy read path ---
+EPOCH_GEOMETRY_QUERY = """
+MATCH (d:Damage)-[:HAS_EPOCH]->(e:Epoch)
+WHERE d.Damage_ID IN $damage_ids
+RETURN e.epoch_id AS epoch_id,
+       e.Position_3D_Axis_X AS x, e.Position_3D_Axis_Y AS y, e.Position_3D_Axis_Z AS z,
+       e.Max_Width_3D_Position AS max_width
+ORDER BY d.Damage_ID, e.Epoch
+"""
+
+
+async def load_epoch_geometry(tx, damage_ids):
+    """Return ``{epoch_id: {"positions": (n, 3) array, "max_width": (3,) array}}``.
+
+    The driver already decodes the lists into Python floats; np.asarray turns
+    them into contiguous float64 buffers in C without a Python-level loop.
+    """
+    result = await tx.run(EPOCH_GEOMETRY_QUERY, damage_ids=list(damage_ids))
+    geometry = {}
+    async for record in result:
+        axes = [record[axis] or () for axis in AXES]
+        length = min(len(values) for values in axes)
+        positions = np.empty((length, 3), dtype=np.float64)
+        for column, values in enumerate(axes):
+            positions[:, column] = np.asarray(values[:length], dtype=np.float64)
+        max_width = record["max_width"]
+        geometry[record["epoch_id"]] = {
+            "positions": positions,
+            "max_width": np.asarray(max_width, dtype=np.float64) if max_width is not None else None,
+        }
+    return geometry
+
+
+def describe_epoch_geometry(geometry):
+    """JSON-ready rows for ``load_epoch_geometry`` output, with each polyline's length and centroid."""
+    items = []
+    for epoch_id, epoch in geometry.items():
+        positions = epoch["positions"]
+        items.append({
+            "epoch_id": epoch_id,
+            "positions": positions.tolist(),
+            "max_width": epoch["max_width"].tolist() if epoch["max_width"] is not None else None,
+            "polyline_length": float(np.linalg.norm(np.diff(positions, axis=0), axis=1).sum()),
+            "centroid": positions.mean(axis=0).tolist() if len(positions) else None,
+        })
+    return items
+
+
+# --- Migration of epochs written with json.dumps(...) strings ---
+LEGACY_EPOCHS_QUERY = """
+MATCH (e:Epoch)
+WHERE e.epoch_id IS NOT NULL
+  AND (e.Position_3D_Axis IS :: STRING OR e.Max_Width_3D_Position IS :: STRING)
+RETURN e.epoch_id AS epoch_id,
+       e.Position_3D_Axis AS position,
+       e.Max_Width_3D_Position AS max_width
+LIMIT $batch
+"""
+
+MIGRATE_EPOCHS_QUERY = """
+UNWIND $rows AS row
+MATCH (e:Epoch {epoch_id: row.epoch_id})
+SET e.Position_3D_Axis_X = row.Position_3D_Axis_X,
+    e.Position_3D_Axis_Y = row.Position_3D_Axis_Y,
+    e.Position_3D_Axis_Z = row.Position_3D_Axis_Z,
+    e.Max_Width_3D_Position = CASE WHEN row.Max_Width_3D_Position IS NULL THEN null
+                                   ELSE point(row.Max_Width_3D_Position) END
+REMOVE e.Position_3D_Axis
+"""
+
+
+def _legacy_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def migrate_epoch_geometry(db, batch=5000):
+    """Rewrite legacy string-encoded epoch geometry in place; returns the number of epochs migrated."""
+    migrated = 0
+    while True:
+        legacy = db.query(LEGACY_EPOCHS_QUERY, {"batch": batch})
+        if not legacy:
+            return migrated
+        rows = []
+        for record in legacy:
+            row = {"epoch_id": record["epoch_id"]}
+            row.update(position_axes(_legacy_json(record["position"])))
+            row["Max_Width_3D_Position"] = max_width_point(_legacy_json(record["max_width"]))
+            rows.append(row)
+        db.query(MIGRATE_EPOCHS_QUERY, {"rows": rows})
+        migrated += len(rows)
+
+
+if __name__ == "__main__":
+    from database import Neo4jConnection, driver_config, uri, user, pwd
+
+    db = Neo4jConnection(uri, user, pwd, **driver_config())
+    try:
+        print(f"Migrated {migrate_epoch_geometry(db)} epochs to native geometry")
+    finally:
+        db.close()
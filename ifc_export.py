@@ -0,0 +1,288 @@
+"""Export damages from Neo4j straight into the IFC model they reference.
+
+Damage nodes carry ``IFC_Filepath`` and ``IFC_GUID``; this module pages
+through the damages of one model (with each damage's latest epoch) and
+attaches them to their host elements with the same emitters as
+RDF_to_IFC_link, without the JSON -> TTL -> rdflib round trip.
+
+    python ifc_export.py example.ifc -o example_with_damages.ifc --group-by-element
+"""
+import argparse
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import ifcopenshell
+
+from instrumentation import STAGE_SECONDS
+from RDF_to_IFC_link import emit_grouped, emit_per_damage
+
+# --- Export settings ---
+# Damages fetched per read transaction.
+EXPORT_BATCH_SIZE = int(os.getenv('ifc_export_batch_size', 1000))
+# Parsed models kept in memory; each one holds the whole IFC file.
+IFC_MODEL_CACHE_SIZE = int(os.getenv('ifc_model_cache_size', 4))
+# Relative IFC_Filepath values are resolved against this directory.
+IFC_MODELS_DIR = os.getenv('ifc_models_dir', '.')
+
+
+# --- Cypher ---
+# Keyset pagination on Damage_ID; the latest epoch is picked per damage in a
+# subquery so damages without epochs are exported too. Epochs without an
+# Epoch number are skipped: DESC sorts nulls first.
+EXPORT_BATCH_QUERY = """
+MATCH (d:Damage)
+WHERE d.IFC_Filepath = $ifc_filepath
+  AND ($ifc_guid IS NULL OR d.IFC_GUID = $ifc_guid)
+  AND ($damage_type IS NULL OR d.DamageType = $damage_type)
+  AND ($after IS NULL OR d.Damage_ID > $after)
+WITH d
+ORDER BY d.Damage_ID
+LIMIT $limit
+CALL {
+  WITH d
+  OPTIONAL MATCH (d)-[:HAS_EPOCH]->(e:Epoch)
+  WHERE e.Epoch IS NOT NULL
+  RETURN e AS latest
+  ORDER BY e.Epoch DESC
+  LIMIT 1
+}
+RETURN d.Damage_ID AS damage_id,
+       d.DamageType AS damage_type,
+       d.IFC_GUID AS ifc_guid,
+       latest.Epoch AS epoch,
+       latest.Width_mm AS width_mm,
+       latest.Length_m AS length_m,
+       CASE WHEN latest.Max_Width_3D_Position IS NULL THEN null
+            ELSE [latest.Max_Width_3D_Position.x, latest.Max_Width_3D_Position.y, latest.Max_Width_3D_Position.z]
+       END AS max_width_position
+ORDER BY damage_id
+"""
+
+
+def fetch_export_batch(tx, ifc_filepath, ifc_guid=None, damage_type=None, after=None, limit=EXPORT_BATCH_SIZE):
+    result = tx.run(EXPORT_BATCH_QUERY, ifc_filepath=ifc_filepath, ifc_guid=ifc_guid,
+                    damage_type=damage_type, after=after, limit=limit)
+    return [record.data() for record in result]
+
+
+async def fetch_export_batch_async(tx, ifc_filepath, ifc_guid=None, damage_type=None, after=None,
+                                   limit=EXPORT_BATCH_SIZE):
+    result = await tx.run(EXPORT_BATCH_QUERY, ifc_filepath=ifc_filepath, ifc_guid=ifc_guid,
+                          damage_type=damage_type, after=after, limit=limit)
+    return [record.data() async for record in result]
+
+
+# --- Parsed model cache ---
+class _CachedModel:
+    def __init__(self, path, mtime_ns):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.model = ifcopenshell.open(path)
+        self.elements_by_guid = {entity.GlobalId: entity for entity in self.model.by_type("IfcRoot")}
+        # ifcopenshell hands out contiguous ids and never reuses them, so the
+        # entities of the next export are exactly next_id, next_id + 1, ...
+        self.next_id = max((entity.id() for entity in self.model), default=0) + 1
+        # An export mutates the model until it is rolled back
+        self.lock = threading.Lock()
+
+    def rollback(self):
+        """Remove every entity the last export added, newest first."""
+        added = []
+        while True:
+            try:
+                added.append(self.model.by_id(self.next_id))
+            except RuntimeError:
+                break
+            self.next_id += 1
+
+        self.model.batch()
+        for entity in reversed(added):
+            self.model.remove(entity)
+        self.model.unbatch()
+
+
+class IfcModelCache:
+    """LRU of parsed ifcopenshell models keyed by real path; a changed mtime forces a re-parse."""
+
+    def __init__(self, maxsize=IFC_MODEL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        """Returns ``(entry, hit)``; raises FileNotFoundError for a missing file."""
+        path = os.path.realpath(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._models.get(path)
+            if entry is not None and entry.mtime_ns == mtime_ns:
+                self._models.move_to_end(path)
+                self.hits += 1
+                return entry, True
+            self.misses += 1
+
+        entry = _CachedModel(path, mtime_ns)
+        with self._lock:
+            self._models[path] = entry
+            self._models.move_to_end(path)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+        return entry, False
+
+    def stats(self):
+        with self._lock:
+            root = os.path.realpath(IFC_MODELS_DIR)
+            models = [os.path.relpath(path, root) for path in self._models]
+            return {"models": models, "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def resolve_model_path(ifc_filepath):
+    """Real path of ``ifc_filepath`` under IFC_MODELS_DIR; raises ValueError for a path that leaves it.
+
+    Absolute paths, ``..`` segments and symlinks are resolved first, so none
+    of them can reach a file outside the directory.
+    """
+    root = os.path.realpath(IFC_MODELS_DIR)
+    path = os.path.realpath(os.path.join(root, ifc_filepath))
+    if os.path.commonpath([root, path]) != root:
+        raise ValueError(f"IFC model '{ifc_filepath}' is outside the models directory")
+    return path
+
+
+# --- Export ---
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, list):
+        return ", ".join(_format(v) for v in value)
+    return value
+
+
+def _records(rows, elements_by_guid, report):
+    """Neo4j rows -> the ``damage_records`` tuples the RDF_to_IFC_link emitters consume."""
+    for row in rows:
+        ifc_element = elements_by_guid.get(row["ifc_guid"]) if row["ifc_guid"] else None
+        if not ifc_element:
+            report["missing_elements"] += 1
+            continue
+
+        damage_class = row["damage_type"] or "Unknown"
+        properties = [
+            ("DamageClass", damage_class),
+            ("Damage_ID", row["damage_id"]),
+            ("Epoch", row["epoch"]),
+            ("Width_mm", row["width_mm"]),
+            ("Length_m", row["length_m"]),
+            ("Max_Width_3D_Position", row["max_width_position"]),
+        ]
+        properties = [(name, _format(value)) for name, value in properties if value is not None]
+        report["damages_exported"] += 1
+        yield row["damage_id"], ifc_element, row["damage_id"], damage_class, properties
+
+
+def _iter_rows(fetch_batch, batch_size, report):
+    after = None
+    while True:
+        start = time.perf_counter()
+        rows = fetch_batch(after, batch_size)
+        report["timings"]["fetch"] += time.perf_counter() - start
+        if not rows:
+            return
+        report["batches"] += 1
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = rows[-1]["damage_id"]
+
+
+def export_damages(fetch_batch, model_path, output_path, models, group_by_element=False,
+                   batch_size=EXPORT_BATCH_SIZE):
+    """Write the damages returned by ``fetch_batch(after, limit)`` into a copy of ``model_path``.
+
+    Batches are pulled lazily while entities are emitted, so only one batch of
+    rows is held at a time. The cached model is restored afterwards.
+    """
+    report = {"damages_exported": 0, "missing_elements": 0, "batches": 0,
+              "timings": {"parse": 0.0, "fetch": 0.0, "emit": 0.0, "write": 0.0}}
+
+    start = time.perf_counter()
+    entry, hit = models.get(model_path)
+    report["model_cache"] = "hit" if hit else "miss"
+    report["timings"]["parse"] = time.perf_counter() - start
+
+    emit = emit_grouped if group_by_element else emit_per_damage
+    with entry.lock:
+        try:
+            start = time.perf_counter()
+            emit(entry.model, _records(_iter_rows(fetch_batch, batch_size, report), entry.elements_by_guid, report),
+                 description="Damage instance from Neo4j")
+            report["timings"]["emit"] = time.perf_counter() - start - report["timings"]["fetch"]
+
+            start = time.perf_counter()
+            entry.model.write(output_path)
+            report["timings"]["write"] = time.perf_counter() - start
+        finally:
+            start = time.perf_counter()
+            entry.rollback()
+            report["timings"]["rollback"] = time.perf_counter() - start
+
+    for stage, seconds in report["timings"].items():
+        STAGE_SECONDS.observe(seconds, pipeline="ifc_export", stage=stage)
+    report["timings"] = {stage: round(seconds, 4) for stage, seconds in report["timings"].items()}
+    return report
+
+
+def export_damages_from_db(db, ifc_filepath, output_path, models, ifc_guid=None, damage_type=None,
+                           group_by_element=False, batch_size=EXPORT_BATCH_SIZE, model_path=None):
+    """Export with a synchronous ``Neo4jConnection``."""
+    def fetch_batch(after, limit):
+        return db.execute_read(fetch_export_batch, ifc_filepath, ifc_guid, damage_type, after, limit)
+
+    return export_damages(fetch_batch, model_path or resolve_model_path(ifc_filepath), output_path,
+                          models, group_by_element, batch_size)
+
+
+async def export_damages_from_db_async(db, ifc_filepath, output_path, models, ifc_guid=None, damage_type=None,
+                                       group_by_element=False, batch_size=EXPORT_BATCH_SIZE, model_path=None):
+    """Export with an ``AsyncNeo4jConnection``.
+
+    The IFC work runs in a worker thread; each batch is read on the event
+    loop, which stays free for other requests in between.
+    """
+    loop = asyncio.get_running_loop()
+
+    def fetch_batch(after, limit):
+        read = db.execute_read(fetch_export_batch_async, ifc_filepath, ifc_guid, damage_type, after, limit)
+        return asyncio.run_coroutine_threadsafe(read, loop).result()
+
+    return await asyncio.to_thread(export_damages, fetch_batch, model_path or resolve_model_path(ifc_filepath),
+                                   output_path, models, group_by_element, batch_size)
+
+
+if __name__ == "__main__":
+    from database import Neo4jConnection, driver_config, uri, user, pwd
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("ifc_filepath", help="IFC_Filepath value stored on the Damage nodes")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--model", default=None, help="model on disk (default: ifc_filepath under ifc_models_dir)")
+    parser.add_argument("--ifc-guid", default=None)
+    parser.add_argument("--damage-type", default=None)
+    parser.add_argument("--group-by-element", action="store_true",
+                        help="one label pset and one aggregate relationship per host element")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = Neo4jConnection(uri, user, pwd, **driver_config())
+    try:
+        report = export_damages_from_db(db, args.ifc_filepath, args.output, IfcModelCache(), args.ifc_guid,
+                                        args.damage_type, args.group_by_element, args.batch_size, args.model)
+    finally:
+        db.close()
+    print(f"Exported {report['damages_exported']} damages to {args.output} "
+          f"({report['missing_elements']} without a matching element) in {report['timings']}")
@@ -0,0 +1,384 @@
+import os
+import time
+
+import ijson
+
+from geometry import max_width_point, position_axes
+from instrumentation import record_rows_written, stage
+from relations import RelationResolver, group_relation_rows
+from summaries import (previous_guids, previous_guids_async, refresh_summaries, refresh_summaries_async,
+                       touched_guids)
+
+# --- Ingestion settings ---
+# Number of rows sent per UNWIND statement. Large enough to amortise the Bolt
+# round trip, small enough to keep each statement's memory footprint modest.
+DEFAULT_CHUNK_SIZE = int(os.getenv('ingest_chunk_size', 1000))
+# Number of top-level damage entries buffered per transaction in streaming mode.
+DEFAULT_STREAM_BATCH_SIZE = int(os.getenv('ingest_stream_batch_size', 500))
+
+
+# --- Cypher statements (one per stage, each fed a list of rows) ---
+# Every statement is an upsert keyed on the ids covered by the uniqueness
+# constraints in schema.py, so re-ingesting the same file changes nothing.
+DAMAGE_QUERY = """
+UNWIND $rows AS row
+MERGE (d:Damage {Damage_ID: row.Damage_ID})
+SET d.DamageType = row.DamageType,
+    d.Image_Filename = row.Image_Filename,
+    d.IFC_Filepath = row.IFC_Filepath,
+    d.IFC_Data = row.IFC_Data,
+    d.IFC_Element = row.IFC_Element,
+    d.IFC_GUID = row.IFC_GUID
+"""
+
+EPOCH_QUERY = """
+UNWIND $rows AS row
+MERGE (e:Epoch {epoch_id: row.epoch_id})
+SET e.Epoch = row.Epoch,
+    e.Storage_Path = row.Storage_Path,
+    e.ReferenceCoOrdinateSystem = row.ReferenceCoOrdinateSystem,
+    e.Length_m = row.Length_m,
+    e.Width_mm = row.Width_mm,
+    e.Position_3D_Axis_X = row.Position_3D_Axis_X,
+    e.Position_3D_Axis_Y = row.Position_3D_Axis_Y,
+    e.Position_3D_Axis_Z = row.Position_3D_Axis_Z,
+    e.Max_Width_3D_Position = CASE WHEN row.Max_Width_3D_Position IS NULL THEN null
+                                   ELSE point(row.Max_Width_3D_Position) END
+REMOVE e.Position_3D_Axis
+"""
+
+HAS_EPOCH_QUERY = """
+UNWIND $rows AS row
+MATCH (d:Damage {Damage_ID: row.Damage_ID}),
+      (e:Epoch {epoch_id: row.epoch_id})
+MERGE (d)-[:HAS_EPOCH]->(e)
+"""
+
+NEXT_EPOCH_QUERY = """
+UNWIND $rows AS row
+MATCH (e1:Epoch {epoch_id: row.e1}),
+      (e2:Epoch {epoch_id: row.e2})
+MERGE (e1)-[:NEXT_EPOCH]->(e2)
+"""
+
+# Damage-to-damage relations need one statement per relationship type, so
+# that stage has no single query (see _statements).
+STAGES = (
+    ("damages", DAMAGE_QUERY),
+    ("epochs", EPOCH_QUERY),
+    ("has_epoch", HAS_EPOCH_QUERY),
+    ("next_epoch", NEXT_EPOCH_QUERY),
+    ("relations", None),
+)
+
+
+# --- Payload -> parameter lists ---
+def new_ingestion_params():
+    return {stage: [] for stage, _ in STAGES}
+
+
+NOT_AN_OBJECT = 'Invalid structure. Expected an object of damages: { "Damage_001": { Metadata, Epochs } }.'
+
+
+def check_upload(data):
+    """Raises ValueError unless ``data`` is the top-level object of an upload."""
+    if not isinstance(data, dict):
+        raise ValueError(NOT_AN_OBJECT)
+
+
+def add_damage_params(params, damage_key, damage_obj, relations=None):
+    """Validate one ``"Damage_001": { Metadata, Epochs }`` entry and append its rows to ``params``.
+
+    An optional ``damage_relations`` list next to Metadata/Epochs is resolved
+    through ``relations`` (a RelationResolver shared by the whole upload).
+    Raises ValueError if the entry is missing Metadata or Epochs, either has
+    the wrong JSON type, or the entry has an invalid relation.
+    """
+    if not isinstance(damage_obj, dict) or "Metadata" not in damage_obj or "Epochs" not in damage_obj:
+        raise ValueError(
+            f"Invalid structure under '{damage_key}'. Required: Metadata + Epochs."
+        )
+    if not isinstance(damage_obj["Metadata"], dict):
+        raise ValueError(f"Invalid structure under '{damage_key}'. Metadata must be an object.")
+    if not isinstance(damage_obj["Epochs"], list) or not all(isinstance(ep, dict) for ep in damage_obj["Epochs"]):
+        raise ValueError(f"Invalid structure under '{damage_key}'. Epochs must be a list of objects.")
+
+    metadata = damage_obj["Metadata"]
+    damage_id = metadata.get("Damage_ID", damage_key)
+
+    params["damages"].append({
+        "Damage_ID": damage_id,
+        "DamageType": metadata.get("DamageType"),
+        "Image_Filename": metadata.get("Image_Filename"),
+        "IFC_Filepath": metadata.get("IFC_Filepath"),
+        "IFC_Data": metadata.get("IFC_Data"),
+        "IFC_Element": metadata.get("IFC_Element"),
+        "IFC_GUID": metadata.get("IFC_GUID")
+    })
+
+    prev_epoch_id = None
+    for ep in damage_obj["Epochs"]:
+        epoch_num = ep.get("Epoch")
+        epoch_id = f"{damage_id}_epoch_{epoch_num}"
+
+        epoch_row = {
+            "epoch_id": epoch_id,
+            "Epoch": epoch_num,
+            "Storage_Path": ep.get("Storage_Path"),
+            "ReferenceCoOrdinateSystem": ep.get("ReferenceCoOrdinateSystem"),
+            "Length_m": ep.get("Length_m"),
+            "Width_mm": ep.get("Width_mm"),
+            "Max_Width_3D_Position": max_width_point(ep.get("Max_Width_3D_Position"))
+        }
+        epoch_row.update(position_axes(ep.get("Position_3D_Axis")))
+        params["epochs"].append(epoch_row)
+        params["has_epoch"].append({"Damage_ID": damage_id, "epoch_id": epoch_id})
+
+        if prev_epoch_id:
+            params["next_epoch"].append({"e1": prev_epoch_id, "e2": epoch_id})
+        prev_epoch_id = epoch_id
+
+    if relations is None:
+        relations = RelationResolver()
+    relations.add(params["relations"], damage_id, damage_obj.get("damage_relations"))
+
+
+def build_ingestion_params(data):
+    """Flatten ``{ "Damage_001": { Metadata, Epochs } }`` into one row list per stage.
+
+    Raises ValueError if ``data`` is not an object or a ``related_to_indices``
+    entry points past the last damage.
+    """
+    check_upload(data)
+    params = new_ingestion_params()
+    relations = RelationResolver()
+    for damage_key, damage_obj in data.items():
+        add_damage_params(params, damage_key, damage_obj, relations)
+    if relations.unresolved:
+        raise ValueError(
+            f"{relations.unresolved} damage_relations point past the {len(relations.damage_ids)} damages in the upload."
+        )
+    return params
+
+
+def _chunks(rows, chunk_size):
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def _statements(stage, query, rows, chunk_size):
+    if query is not None:
+        return [(query, chunk) for chunk in _chunks(rows, chunk_size)]
+    return [(rel_query, chunk) for rel_query, group in group_relation_rows(rows)
+            for chunk in _chunks(group, chunk_size)]
+
+
+# --- Transaction function ---
+def write_ingestion_params(tx, params, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Run every stage as chunked UNWIND statements inside ``tx``, then refresh
+    the summaries of the elements the damages are on or have left (summaries.py).
+
+    Returns ``(timings, relations_created)``: the wall-clock seconds spent
+    per stage, and the damage-to-damage relationships the relations stage
+    actually created (rows naming an unknown damage, or repeating an
+    existing relationship, create none).
+    """
+    start = time.perf_counter()
+    relations_created = 0
+    # Read before the damages stage overwrites IFC_GUID
+    with stage("ingest", "summaries", rows=len(params["damages"])):
+        guids = previous_guids(tx, params["damages"], chunk_size)
+    timings = {"summaries": time.perf_counter() - start}
+    for name, query in STAGES:
+        start = time.perf_counter()
+        with stage("ingest", name, rows=len(params[name])):
+            for statement, chunk in _statements(name, query, params[name], chunk_size):
+                summary = tx.run(statement, rows=chunk).consume()
+                if query is None:
+                    relations_created += summary.counters.relationships_created
+        timings[name] = time.perf_counter() - start
+    start = time.perf_counter()
+    guids |= touched_guids(params)
+    with stage("ingest", "summaries", elements=len(guids)):
+        refresh_summaries(tx, guids, chunk_size)
+    timings["summaries"] += time.perf_counter() - start
+    return timings, relations_created
+
+
+async def write_ingestion_params_async(tx, params, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Async counterpart of ``write_ingestion_params`` for ``AsyncNeo4jConnection``."""
+    start = time.perf_counter()
+    with stage("ingest", "summaries", rows=len(params["damages"])):
+        guids = await previous_guids_async(tx, params["damages"], chunk_size)
+    timings = {"summaries": time.perf_counter() - start}
+    relations_created = 0
+    for name, query in STAGES:
+        start = time.perf_counter()
+        with stage("ingest", name, rows=len(params[name])):
+            for statement, chunk in _statements(name, query, params[name], chunk_size):
+                result = await tx.run(statement, rows=chunk)
+                summary = await result.consume()
+                if query is None:
+                    relations_created += summary.counters.relationships_created
+        timings[name] = time.perf_counter() - start
+    start = time.perf_counter()
+    guids |= touched_guids(params)
+    with stage("ingest", "summaries", elements=len(guids)):
+        await refresh_summaries_async(tx, guids, chunk_size)
+    timings["summaries"] += time.perf_counter() - start
+    return timings, relations_created
+
+
+def _report(params, timings, relations_created, start):
+    timings["total"] = time.perf_counter() - start
+    return {
+        "damage_nodes_created": len(params["damages"]) + len(params["epochs"]),
+        "relationships_created": len(params["next_epoch"]),
+        "damage_relations_created": relations_created,
+        "timings": {stage: round(seconds, 6) for stage, seconds in timings.items()},
+    }
+
+
+def ingest_damage_data(db, data, chunk_size=DEFAULT_CHUNK_SIZE, on_commit=None):
+    """Write a parsed damage upload in a single managed write transaction.
+
+    ``on_commit(params)`` is called once the transaction has committed.
+    """
+    start = time.perf_counter()
+    with stage("ingest", "build_params"):
+        params = build_ingestion_params(data)
+    timings = {"build_params": time.perf_counter() - start}
+
+    write_timings, relations_created = db.execute_write(write_ingestion_params, params, chunk_size)
+    timings.update(write_timings)
+    record_rows_written(params, timings)
+    if on_commit:
+        on_commit(params)
+    return _report(params, timings, relations_created, start)
+
+
+async def ingest_damage_data_async(db, data, chunk_size=DEFAULT_CHUNK_SIZE, on_commit=None):
+    """Async variant of ``ingest_damage_data``; yields to the event loop on every round trip."""
+    start = time.perf_counter()
+    with stage("ingest", "build_params"):
+        params = build_ingestion_params(data)
+    timings = {"build_params": time.perf_counter() - start}
+
+    write_timings, relations_created = await db.execute_write(write_ingestion_params_async, params, chunk_size)
+    timings.update(write_timings)
+    record_rows_written(params, timings)
+    if on_commit:
+        on_commit(params)
+    return _report(params, timings, relations_created, start)
+
+
+# --- Streaming ingestion ---
+class _ObjectStream:
+    # kvitems yields nothing for a top-level array or scalar, which would pass
+    # as an empty upload; the first non-blank byte tells them apart.
+    def __init__(self, stream):
+        self._stream = stream
+        self._checked = False
+
+    async def read(self, size=-1):
+        data = await self._stream.read(size)
+        if not self._checked and data.strip():
+            if not data.lstrip().startswith(b"{"):
+                raise ValueError(NOT_AN_OBJECT)
+            self._checked = True
+        return data
+
+
+async def iter_damage_batches(stream, batch_size=DEFAULT_STREAM_BATCH_SIZE, relations=None, prepare=None):
+    """Parse top-level damage entries one at a time from an async byte stream.
+
+    Yields validated parameter lists holding at most ``batch_size`` damages, so
+    only one batch of the upload is ever materialised as Python objects. Pass
+    a RelationResolver as ``relations`` to inspect its ``unresolved`` count
+    once the stream is exhausted. ``prepare``, if given, is awaited with each
+    batch's raw damage objects before they are validated and may edit them.
+    """
+    relations = relations if relations is not None else RelationResolver()
+    entries = []
+    async for damage_key, damage_obj in ijson.kvitems_async(_ObjectStream(stream), "", use_float=True):
+        entries.append((damage_key, damage_obj))
+        if len(entries) >= batch_size:
+            yield await _batch_params(entries, relations, prepare)
+            entries = []
+    if entries:
+        yield await _batch_params(entries, relations, prepare)
+
+
+async def _batch_params(entries, relations, prepare):
+    if prepare is not None:
+        with stage("ingest", "prepare", damages=len(entries)):
+            await prepare([damage_obj for _, damage_obj in entries])
+    with stage("ingest", "build_params", damages=len(entries)):
+        params = new_ingestion_params()
+        for damage_key, damage_obj in entries:
+            add_damage_params(params, damage_key, damage_obj, relations)
+    return params
+
+
+class PartialUploadError(ValueError):
+    """A streamed upload stopped at an invalid entry after some batches were committed.
+
+    ``report`` describes what was written before the error, as
+    ``ingest_damage_stream_async`` would have returned it.
+    """
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+async def ingest_damage_stream_async(db, stream, chunk_size=DEFAULT_CHUNK_SIZE,
+                                     batch_size=DEFAULT_STREAM_BATCH_SIZE, on_commit=None, prepare=None):
+    """Stream an upload into Neo4j, committing one write transaction per batch of damages.
+
+    Invalid JSON or an invalid entry raises ValueError (ijson.JSONError for
+    malformed JSON); once batches have been committed it raises
+    PartialUploadError instead, which reports them.
+    """
+    start = time.perf_counter()
+    counts = {stage: 0 for stage, _ in STAGES}
+    timings = {"parse": 0.0}
+    batches = 0
+    relations_created = 0
+    relations = RelationResolver()
+
+    def report():
+        timings["total"] = time.perf_counter() - start
+        return {
+            "damage_nodes_created": counts["damages"] + counts["epochs"],
+            "relationships_created": counts["next_epoch"],
+            "damage_relations_created": relations_created,
+            "unresolved_relations": relations.unresolved,
+            "batches": batches,
+            "timings": {stage: round(seconds, 6) for stage, seconds in timings.items()},
+        }
+
+    parse_start = time.perf_counter()
+    try:
+        async for params in iter_damage_batches(stream, batch_size, relations, prepare):
+            timings["parse"] += time.perf_counter() - parse_start
+
+            batch_timings, batch_relations = await db.execute_write(write_ingestion_params_async, params, chunk_size)
+            record_rows_written(params, batch_timings)
+            if on_commit:
+                on_commit(params)
+            relations_created += batch_relations
+            for name, seconds in batch_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+            for name, rows in params.items():
+                counts[name] += len(rows)
+            batches += 1
+
+            parse_start = time.perf_counter()
+    except (ValueError, ijson.JSONError) as e:
+        if not batches:
+            raise
+        message = str(e) if isinstance(e, ValueError) else "Invalid JSON format"
+        raise PartialUploadError(message, report()) from e
+    timings["parse"] += time.perf_counter() - parse_start
+    return report()
@@ -0,0 +1,419 @@
+"""Metrics, tracing and the slow-query log for the API and the pipelines.
+
+Metrics live in an in-process registry rendered in the Prometheus text
+format by ``GET /metrics``; nothing here needs prometheus_client. Pipeline
+stages (``with stage("ingest", "epochs"): ...``) are timed into a histogram
+and, if the OpenTelemetry API is installed, wrapped in a span on the
+globally configured tracer provider (a no-op until one is set up). Every
+Cypher statement run through ``database.py`` is timed per statement type;
+statements slower than ``slow_query_threshold_ms`` are logged with their
+text and parameter sizes.
+
+Tests can register an ``InMemoryExporter`` to receive every finished stage
+and query, read values with ``REGISTRY.sample(...)``, or install an
+OpenTelemetry SDK provider with its in-memory span exporter.
+"""
+import bisect
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+try:
+    from opentelemetry import trace as _otel_trace
+except ImportError:  # tracing is optional
+    _otel_trace = None
+
+# --- Instrumentation settings ---
+SLOW_QUERY_THRESHOLD = float(os.getenv('slow_query_threshold_ms', 500)) / 1000
+SLOW_QUERY_LOG_SIZE = int(os.getenv('slow_query_log_size', 200))
+# Cypher text longer than this is cut in the slow-query log
+SLOW_QUERY_TEXT_LIMIT = 2000
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(2 ** k for k in range(10, 32, 2))  # 1 KiB .. 1 GiB
+RATE_BUCKETS = (10, 100, 1000, 5000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+
+slow_query_logger = logging.getLogger("slow_query")
+
+
+# --- Metric types ---
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r'\"').replace("\n", r"\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value!r}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels))
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        counts, _ = self._values.get(self._key(labels), ((), 0.0))
+        return sum(counts)
+
+    def sum(self, **labels):
+        return self._values.get(self._key(labels), ((), 0.0))[1]
+
+    def _render_sample(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(float(bound))
+            le_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [le_label])} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {total!r}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def sample(self, name, **labels):
+        """Counter/gauge value or histogram observation count, for assertions."""
+        metric = self._metrics[name]
+        return metric.count(**labels) if isinstance(metric, Histogram) else metric.value(**labels)
+
+    def reset(self):
+        for metric in self._metrics.values():
+            metric.clear()
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route", "status")))
+UPLOAD_BYTES = REGISTRY.register(Histogram(
+    "upload_size_bytes", "Size of uploaded files.", ("endpoint",), SIZE_BUCKETS))
+ROWS_WRITTEN = REGISTRY.register(Counter(
+    "ingest_rows_written_total", "Rows committed to Neo4j per ingestion stage.", ("stage",)))
+ROWS_PER_SECOND = REGISTRY.register(Histogram(
+    "ingest_rows_per_second", "Write throughput of each committed ingestion stage.", ("stage",), RATE_BUCKETS))
+QUERY_SECONDS = REGISTRY.register(Histogram(
+    "neo4j_query_duration_seconds", "Cypher statement latency (run to fully consumed) by statement type.",
+    ("statement", "access")))
+POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "neo4j_pool_wait_seconds", "Time from requesting a transaction to its work starting (connection acquisition "
+    "and BEGIN).", ("access",)))
+SESSIONS_ACTIVE = REGISTRY.register(Gauge(
+    "neo4j_sessions_active", "Sessions currently open on the shared driver."))
+POOL_CONNECTIONS = REGISTRY.register(Gauge(
+    "neo4j_pool_connections", "Connections in the driver pool by state.", ("address", "state")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "pipeline_stage_duration_seconds", "Duration of pipeline stages.", ("pipeline", "stage")))
+SLOW_QUERIES = REGISTRY.register(Counter(
+    "neo4j_slow_queries_total", "Statements slower than the slow-query threshold.", ("statement",)))
+
+
+# --- Exporters ---
+class InMemoryExporter:
+    """Collects finished stages and queries as dicts; register with ``add_exporter``."""
+
+    def __init__(self):
+        self.stages = []
+        self.queries = []
+
+    def export_stage(self, record):
+        self.stages.append(record)
+
+    def export_query(self, record):
+        self.queries.append(record)
+
+    def clear(self):
+        self.stages.clear()
+        self.queries.clear()
+
+
+_exporters = []
+slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+
+def add_exporter(exporter):
+    _exporters.append(exporter)
+    return exporter
+
+
+def remove_exporter(exporter):
+    _exporters.remove(exporter)
+
+
+# --- Stages and spans ---
+_tracer = _otel_trace.get_tracer("damage_pipeline") if _otel_trace else None
+
+
+@contextmanager
+def stage(pipeline, name, **attributes):
+    """Time a pipeline stage into STAGE_SECONDS and an OpenTelemetry span ``<pipeline>.<name>``."""
+    span_context = (_tracer.start_as_current_span(f"{pipeline}.{name}", attributes=attributes)
+                    if _tracer else nullcontext())
+    start = time.perf_counter()
+    with span_context as span:
+        try:
+            yield span
+        finally:
+            seconds = time.perf_counter() - start
+            STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=name)
+            for exporter in _exporters:
+                exporter.export_stage({"pipeline": pipeline, "stage": name, "seconds": seconds, **attributes})
+
+
+# --- Ingestion throughput ---
+def record_rows_written(params, timings):
+    """Count committed rows per stage; ``timings`` are the writer's per-stage seconds."""
+    for stage_name, rows in params.items():
+        ROWS_WRITTEN.inc(len(rows), stage=stage_name)
+        seconds = timings.get(stage_name)
+        if rows and seconds:
+            ROWS_PER_SECOND.observe(len(rows) / seconds, stage=stage_name)
+
+
+# --- Cypher statements ---
+_SCHEMA_STATEMENT = re.compile(r"\s*(CREATE|DROP|SHOW)\s+(\w+\s+)?(CONSTRAINTS?|INDEX(ES)?)\b", re.IGNORECASE)
+_WRITE_CLAUSE = re.compile(r"\b(MERGE|CREATE|SET|DELETE|REMOVE)\b", re.IGNORECASE)
+_NODE_LABEL = re.compile(r"\(\s*\w*\s*:\s*(\w+)")
+_REL_TYPE = re.compile(r"\[\s*\w*\s*:\s*(\w+)")
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_type(query):
+    """Low-cardinality name for a Cypher text, e.g. ``write:Epoch:NEXT_EPOCH`` or ``read:Damage``."""
+    if _SCHEMA_STATEMENT.match(query):
+        return "schema"
+    op = "write" if _WRITE_CLAUSE.search(query) else "read"
+    parts = [op]
+    for pattern in (_NODE_LABEL, _REL_TYPE):
+        match = pattern.search(query)
+        if match:
+            parts.append(match.group(1))
+    return ":".join(parts)
+
+
+def _parameter_sizes(parameters):
+    return {name: len(value) if isinstance(value, (list, tuple, dict, str)) else None
+            for name, value in (parameters or {}).items()}
+
+
+def observe_query(query, parameters, access, seconds):
+    statement = statement_type(query)
+    QUERY_SECONDS.observe(seconds, statement=statement, access=access)
+    record = {"statement": statement, "access": access, "seconds": seconds,
+              "parameter_sizes": _parameter_sizes(parameters)}
+    for exporter in _exporters:
+        exporter.export_query(record)
+
+    if seconds >= SLOW_QUERY_THRESHOLD:
+        text = " ".join(query.split())[:SLOW_QUERY_TEXT_LIMIT]
+        entry = {**record, "query": text, "at": time.time()}
+        slow_queries.append(entry)
+        SLOW_QUERIES.inc(statement=statement)
+        slow_query_logger.warning("slow %s query (%.3fs, params %s): %s",
+                                  statement, seconds, entry["parameter_sizes"], text)
+
+
+class _Observation:
+    # Recorded once: when the result is consumed or exhausted, else when the work returns
+    def __init__(self, query, parameters, access):
+        self.query, self.parameters, self.access = query, parameters, access
+        self.start = time.perf_counter()
+        self.done = False
+
+    def finish(self):
+        if not self.done:
+            self.done = True
+            observe_query(self.query, self.parameters, self.access, time.perf_counter() - self.start)
+
+
+class _TimedResult:
+    def __init__(self, result, observation):
+        self._result = result
+        self._observation = observation
+
+    def __getattr__(self, name):
+        return getattr(self._result, name)
+
+    def consume(self):
+        try:
+            return self._result.consume()
+        finally:
+            self._observation.finish()
+
+    def __iter__(self):
+        yield from self._result
+        self._observation.finish()
+
+
+class _AsyncTimedResult(_TimedResult):
+    async def consume(self):
+        try:
+            return await self._result.consume()
+        finally:
+            self._observation.finish()
+
+    def __iter__(self):
+        raise TypeError("async result")
+
+    async def __aiter__(self):
+        async for record in self._result:
+            yield record
+        self._observation.finish()
+
+
+class _TimedTransaction:
+    def __init__(self, tx, access):
+        self._tx = tx
+        self._access = access
+        self._observations = []
+
+    def __getattr__(self, name):
+        return getattr(self._tx, name)
+
+    def _observe(self, query, parameters, kwargs):
+        observation = _Observation(query, {**(parameters or {}), **kwargs}, self._access)
+        self._observations.append(observation)
+        return observation
+
+    def run(self, query, parameters=None, **kwargs):
+        observation = self._observe(query, parameters, kwargs)
+        return _TimedResult(self._tx.run(query, parameters, **kwargs), observation)
+
+    def finish(self):
+        for observation in self._observations:
+            observation.finish()
+
+
+class _AsyncTimedTransaction(_TimedTransaction):
+    async def run(self, query, parameters=None, **kwargs):
+        observation = self._observe(query, parameters, kwargs)
+        return _AsyncTimedResult(await self._tx.run(query, parameters, **kwargs), observation)
+
+
+def instrument_work(work, access):
+    """Wrap a transaction function so its statements and pool wait are recorded."""
+    requested = time.perf_counter()
+    waited = []
+
+    def timed_work(tx, *args, **kwargs):
+        if not waited:
+            waited.append(True)
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - requested, access=access)
+        timed_tx = _TimedTransaction(tx, access)
+        try:
+            return work(timed_tx, *args, **kwargs)
+        finally:
+            timed_tx.finish()
+
+    return timed_work
+
+
+def instrument_async_work(work, access):
+    """Async counterpart of ``instrument_work``."""
+    requested = time.perf_counter()
+    waited = []
+
+    async def timed_work(tx, *args, **kwargs):
+        if not waited:
+            waited.append(True)
+            POOL_WAIT_SECONDS.observe(time.perf_counter() - requested, access=access)
+        timed_tx = _AsyncTimedTransaction(tx, access)
+        try:
+            return await work(timed_tx, *args, **kwargs)
+        finally:
+            timed_tx.finish()
+
+    return timed_work
+
+
+def update_pool_gauges(db):
+    stats = db.pool_stats()
+    SESSIONS_ACTIVE.set(stats["sessions_active"])
+    for address, counts in stats["connections"].items():
+        for state in ("in_use", "idle"):
+            POOL_CONNECTIONS.set(counts[state], address=address, state=state)
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+from ingestion import DEFAULT_CHUNK_SIZE, DEFAULT_STREAM_BATCH_SIZE, iter_damage_batches, write_ingestion_params_async
+from instrumentation import record_rows_written
+from relations import RelationResolver
+from spatial_index import ElementAssigner
+
+# --- Job settings ---
+JOBS_DIR = os.getenv('ingest_jobs_dir', 'ingest_jobs')
+JOB_WORKERS = int(os.getenv('ingest_job_workers', 2))
+# Finished jobs (their state.json, and a failed job's upload) are kept this
+# long, and at most this many succeeded jobs
+JOB_RETENTION_S = float(os.getenv('ingest_job_retention_s', 7 * 24 * 3600))
+MAX_FINISHED_JOBS = int(os.getenv('ingest_job_max_finished', 1000))
+
+UPLOAD_FILENAME = "upload.json"
+STATE_FILENAME = "state.json"
+READ_SIZE = 1 << 20
+FINISHED = ("succeeded", "failed")
+
+logger = logging.getLogger("ingest_jobs")
+
+
+class _AsyncFileReader:
+    # ijson's async interface only needs an awaitable read(); reads go to a
+    # worker thread so a slow disk does not stall the event loop.
+    def __init__(self, f):
+        self._f = f
+
+    async def read(self, size=-1):
+        return await asyncio.to_thread(self._f.read, size)
+
+
+# --- Background ingestion jobs ---
+class JobManager:
+    """Spool uploads to disk and ingest them with a bounded pool of worker tasks.
+
+    Each job's progress is checkpointed to ``<jobs_dir>/<job_id>/state.json``
+    after every committed batch. Unfinished jobs found at startup are queued
+    again and skip the batches already committed; since every ingestion
+    statement is an upsert, a batch committed just before a crash but not yet
+    checkpointed is simply written twice.
+
+    A failed job keeps its spooled upload, so ``retry`` can resume it from
+    the last committed batch, e.g. after a Neo4j outage. A succeeded job's
+    upload is deleted at once. Finished jobs are forgotten ``retention_s``
+    seconds after they end; at most ``max_finished`` succeeded jobs are kept.
+    """
+
+    def __init__(self, db, jobs_dir=JOBS_DIR, workers=JOB_WORKERS,
+                 chunk_size=DEFAULT_CHUNK_SIZE, batch_size=DEFAULT_STREAM_BATCH_SIZE, on_commit=None,
+                 spatial_indexes=None, retention_s=JOB_RETENTION_S, max_finished=MAX_FINISHED_JOBS):
+        self.db = db
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.on_commit = on_commit
+        self.spatial_indexes = spatial_indexes
+        self.retention_s = retention_s
+        self.max_finished = max_finished
+        self.jobs = {}
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    # --- Lifecycle ---
+    def start(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._recover()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _recover(self):
+        for job_id in sorted(os.listdir(self.jobs_dir)):
+            path = os.path.join(self.jobs_dir, job_id, STATE_FILENAME)
+            if not os.path.exists(path):
+                continue
+            with open(path) as f:
+                state = json.load(f)
+            self.jobs[job_id] = state
+            if state["status"] in ("queued", "running"):
+                state["status"] = "queued"
+                state["resumed"] = state.get("resumed", 0) + 1
+                self._save(state)
+                self._queue.put_nowait(job_id)
+            elif state["status"] == "succeeded":
+                # Uploads of jobs that finished before uploads were deleted
+                self._remove_upload(job_id)
+        self._prune()
+
+    # --- Public API ---
+    async def submit(self, upload, chunk_size=None, batch_size=None, assign_elements=False, ifc_filepath=None):
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+
+        with open(os.path.join(job_dir, UPLOAD_FILENAME), "wb") as f:
+            await asyncio.to_thread(shutil.copyfileobj, upload.file, f, READ_SIZE)
+
+        state = {
+            "job_id": job_id,
+            "filename": upload.filename,
+            "status": "queued",
+            "chunk_size": chunk_size or self.chunk_size,
+            "batch_size": batch_size or self.batch_size,
+            "assign_elements": assign_elements,
+            "ifc_filepath": ifc_filepath,
+            "batches_committed": 0,
+            "damages_written": 0,
+            "epochs_written": 0,
+            "relationships_written": 0,
+            "damage_relations_written": 0,
+            "unresolved_relations": 0,
+            "errors": [],
+            "resumed": 0,
+            "retries": 0,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "elapsed_s": 0.0,
+        }
+        self.jobs[job_id] = state
+        self._save(state)
+        await self._queue.put(job_id)
+        return job_id
+
+    def retry(self, job_id):
+        """Queue a failed job again; it skips the batches it already committed.
+
+        Returns the job's status, or None for an unknown job. Raises
+        ValueError unless the job failed and its upload is still spooled.
+        """
+        state = self.jobs.get(job_id)
+        if state is None:
+            return None
+        if state["status"] != "failed":
+            raise ValueError(f"Job '{job_id}' is {state['status']}; only failed jobs can be retried.")
+        if not os.path.exists(os.path.join(self.jobs_dir, job_id, UPLOAD_FILENAME)):
+            raise ValueError(f"The upload of job '{job_id}' is no longer kept; upload it again.")
+        state["status"] = "queued"
+        state["retries"] = state.get("retries", 0) + 1
+        state["finished_at"] = None
+        self._save(state)
+        self._queue.put_nowait(job_id)
+        return self.status(job_id)
+
+    def status(self, job_id):
+        state = self.jobs.get(job_id)
+        if state is None:
+            return None
+        report = dict(state)
+        elapsed = state["elapsed_s"]
+        report["damages_per_s"] = round(state["damages_written"] / elapsed, 2) if elapsed else 0.0
+        report["epochs_per_s"] = round(state["epochs_written"] / elapsed, 2) if elapsed else 0.0
+        return report
+
+    # --- Workers ---
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(self.jobs[job_id])
+            except Exception as e:
+                # e.g. state.json could not be written: fail this job, keep serving the queue
+                logger.exception("Ingestion job %s stopped outside its batches", job_id)
+                self._mark_failed(job_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, state):
+        state["status"] = "running"
+        state["started_at"] = state["started_at"] or time.time()
+        state.setdefault("damage_relations_written", 0)  # jobs spooled before relations existed
+        self._save(state)
+
+        skip = state["batches_committed"]
+        run_start = time.perf_counter()
+        elapsed_before = state["elapsed_s"]
+        path = os.path.join(self.jobs_dir, state["job_id"], UPLOAD_FILENAME)
+
+        try:
+            relations = RelationResolver()
+            assigner = None
+            if state.get("assign_elements") and self.spatial_indexes is not None:
+                assigner = ElementAssigner(self.spatial_indexes, state.get("ifc_filepath"))
+            with open(path, "rb") as f:
+                batch_index = 0
+                async for params in iter_damage_batches(_AsyncFileReader(f), state["batch_size"], relations, assigner):
+                    batch_index += 1
+                    if batch_index <= skip:
+                        continue
+
+                    timings, relations_created = await self.db.execute_write(
+                        write_ingestion_params_async, params, state["chunk_size"])
+                    record_rows_written(params, timings)
+                    if self.on_commit:
+                        self.on_commit(params)
+
+                    state["batches_committed"] = batch_index
+                    state["damages_written"] += len(params["damages"])
+                    state["epochs_written"] += len(params["epochs"])
+                    state["relationships_written"] += len(params["next_epoch"])
+                    state["damage_relations_written"] += relations_created
+                    state["elapsed_s"] = elapsed_before + time.perf_counter() - run_start
+                    self._save(state)
+
+            state["unresolved_relations"] = relations.unresolved
+            if assigner:
+                state["elements_assigned"] = assigner.counts
+            state["status"] = "succeeded"
+        except Exception as e:
+            state["status"] = "failed"
+            state["errors"].append({"batch": state["batches_committed"] + 1, "error": str(e)})
+
+        state["elapsed_s"] = elapsed_before + time.perf_counter() - run_start
+        state["finished_at"] = time.time()
+        self._save(state)
+        if state["status"] == "succeeded":
+            self._remove_upload(state["job_id"])
+        self._prune()
+
+    # --- Persistence ---
+    def _remove_upload(self, job_id):
+        try:
+            os.remove(os.path.join(self.jobs_dir, job_id, UPLOAD_FILENAME))
+        except FileNotFoundError:
+            pass
+
+    def _mark_failed(self, job_id, error):
+        state = self.jobs.get(job_id)
+        if state is None or state["status"] in FINISHED:
+            return
+        state["status"] = "failed"
+        state["errors"].append({"batch": state["batches_committed"] + 1, "error": str(error)})
+        state["finished_at"] = time.time()
+        try:
+            self._save(state)
+        except OSError:
+            # Still "running" on disk, so the next start resumes it
+            logger.exception("Could not record the failure of ingestion job %s", job_id)
+
+    def _prune(self):
+        """Forget finished jobs past the retention age, and succeeded jobs beyond the newest ``max_finished``."""
+        cutoff = time.time() - self.retention_s
+        succeeded = sorted((state for state in self.jobs.values() if state["status"] == "succeeded"),
+                           key=lambda state: state.get("finished_at") or 0, reverse=True)
+        expired = {state["job_id"] for state in succeeded[self.max_finished:]}
+        expired.update(state["job_id"] for state in self.jobs.values()
+                       if state["status"] in FINISHED and (state.get("finished_at") or 0) < cutoff)
+        for job_id in expired:
+            del self.jobs[job_id]
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+    def _save(self, state):
+        job_dir = os.path.join(self.jobs_dir, state["job_id"])
+        tmp_path = os.path.join(job_dir, STATE_FILENAME + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, os.path.join(job_dir, STATE_FILENAME))
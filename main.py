@@ -1,40 +1,94 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from neo4j import GraphDatabase
+from contextlib import asynccontextmanager
 from typing import Annotated
-from dotenv import load_dotenv
-import os, json
+import json
+import os
+import tempfile
+import time
+import ijson
 
-# --- Load environment variables ---
-load_dotenv()
-uri = os.getenv('uri')
-user = os.getenv('user')
-pwd = os.getenv('pwd')
+from database import AsyncNeo4jConnection, driver_config, uri, user, pwd
+from ingestion import (
+    DEFAULT_CHUNK_SIZE, DEFAULT_STREAM_BATCH_SIZE, PartialUploadError,
+    check_upload, ingest_damage_data_async, ingest_damage_stream_async,
+)
+from analytics import analyze_growth, fetch_epoch_series
+from cache import TTLCache
+from geometry import describe_epoch_geometry, epochs_in_bbox, load_epoch_geometry
+from ifc_export import EXPORT_BATCH_SIZE, IfcModelCache, export_damages_from_db_async, resolve_model_path
+from instrumentation import REGISTRY, REQUEST_SECONDS, UPLOAD_BYTES, slow_queries, stage, update_pool_gauges
+from jobs import JobManager
+from queries import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, EPOCHS_TAG, SUMMARIES_TAG,
+    get_damage_with_epochs, list_damages, list_epochs, get_element_summary, list_element_summaries,
+    damage_list_tags, cache_tags_for_params,
+)
+from relations import MAX_TRAVERSAL_DEPTH, causal_chain
+from schema import try_bootstrap_schema_async
+from spatial_index import ElementAssigner, SpatialIndexCache
+from upload_archive import ARCHIVE_BATCH_SIZE, archive_format, archive_status, ingest_archive_async
 
-# --- Neo4j Driver Wrapper ---
-class Neo4jConnection:
-    def __init__(self, uri, user, pwd):
-        self.driver = GraphDatabase.driver(uri, auth=(user, pwd))
+# --- Shared driver lifecycle ---
+# One driver (and so one connection pool) per process, reused by every request.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.db = AsyncNeo4jConnection(uri, user, pwd, **driver_config())
+    await try_bootstrap_schema_async(app.state.db)
+    app.state.cache = TTLCache()
+    app.state.ifc_models = IfcModelCache()
+    app.state.spatial_indexes = SpatialIndexCache()
+    app.state.jobs = JobManager(app.state.db, on_commit=lambda params: invalidate_cache(app, params),
+                                spatial_indexes=app.state.spatial_indexes)
+    app.state.jobs.start()
+    try:
+        yield
+    finally:
+        await app.state.jobs.stop()
+        await app.state.db.close()
 
-    def close(self):
-        self.driver.close()
+# Dependency injection
+def get_db(request: Request):
+    return request.app.state.db
 
-    def query(self, query, parameters=None, db=None):
-        with self.driver.session(database=db) if db else self.driver.session() as session:
-            result = session.run(query, parameters)
-            return [record.data() for record in result]
+def get_cache(request: Request):
+    return request.app.state.cache
 
-# Dependency injection
-def get_db():
-    db = Neo4jConnection(uri, user, pwd)
-    try:
-        yield db
-    finally:
-        db.close()
+def get_ifc_models(request: Request):
+    return request.app.state.ifc_models
+
+# Drop cached reads made stale by a committed write
+def invalidate_cache(app, params):
+    app.state.cache.invalidate(cache_tags_for_params(params))
+
+# An ifc_filepath parameter must name a model inside the IFC models directory
+def check_model_path(ifc_filepath):
+    if ifc_filepath is not None:
+        try:
+            resolve_model_path(ifc_filepath)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
 # --- FastAPI Setup ---
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+
+# --- Request metrics ---
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Route templates, not raw paths, keep the label set bounded
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method,
+                                route=route.path if route else "unmatched", status=status)
 
 
 # --- Root / Health Check ---
@@ -43,131 +97,352 @@ async def root():
     return {"message": "FastAPI + Neo4j API is running!"}
 
 
+# --- Connection Pool Stats ---
+@app.get("/db/pool")
+async def db_pool(db: Annotated[AsyncNeo4jConnection, Depends(get_db)]):
+    return db.pool_stats()
+
+
+# --- Metrics (Prometheus text format) ---
+@app.get("/metrics")
+async def metrics(db: Annotated[AsyncNeo4jConnection, Depends(get_db)]):
+    update_pool_gauges(db)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/slow_queries")
+async def get_slow_queries():
+    return {"items": list(slow_queries)}
+
+
 # --- Upload JSON Format ---
 @app.post("/upload_damage_json")
 async def upload_damage_json(
+    request: Request,
     file: UploadFile = File(...),
-    db: Annotated[Neo4jConnection, Depends(get_db)] = None
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)] = None,
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, gt=0),
+    stream: bool = False,
+    batch_size: int = Query(DEFAULT_STREAM_BATCH_SIZE, gt=0),
+    background: bool = False,
+    assign_elements: bool = False,
+    ifc_filepath: str | None = None
 ):
     if not file.filename.endswith(".json"):
         raise HTTPException(status_code=400, detail="Only JSON files are allowed")
+    if file.size is not None:
+        UPLOAD_BYTES.observe(file.size, endpoint="upload_damage_json")
+
+    check_model_path(ifc_filepath)
+    if background:
+        # Spool to disk and hand off to the job workers; poll /jobs/{job_id}
+        job_id = await request.app.state.jobs.submit(file, chunk_size, batch_size, assign_elements, ifc_filepath)
+        return JSONResponse(status_code=202, content={"status": "queued", "job_id": job_id})
 
     try:
-        contents = await file.read()
-        data = json.loads(contents.decode("utf-8"))
+        # Expect: { "Damage_001": { Metadata, Epochs } }
+        on_commit = lambda params: invalidate_cache(request.app, params)
+        # Damages without IFC_GUID get the element their latest epoch lies in (or nearest to)
+        assigner = ElementAssigner(request.app.state.spatial_indexes, ifc_filepath) if assign_elements else None
+        if stream:
+            # Parse entry by entry and commit every `batch_size` damages
+            report = await ingest_damage_stream_async(db, file, chunk_size, batch_size, on_commit, assigner)
+        else:
+            with stage("ingest", "parse"):
+                contents = await file.read()
+                data = json.loads(contents.decode("utf-8"))
+            check_upload(data)
+            if assigner:
+                await assigner(data.values())
+            report = await ingest_damage_data_async(db, data, chunk_size, on_commit)
 
-        created_nodes = []
-        created_relationships = []
+        if assigner:
+            report["elements_assigned"] = assigner.counts
+        return {"status": "success", **report}
 
-        # Expect: { "Damage_001": { Metadata, Epochs } }
-        for damage_key, damage_obj in data.items():
-
-            if "Metadata" not in damage_obj or "Epochs" not in damage_obj:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid structure under '{damage_key}'. Required: Metadata + Epochs."
-                )
-
-            metadata = damage_obj["Metadata"]
-            epochs = damage_obj["Epochs"]
-
-            # ---------------------------------------
-            # CREATE DAMAGE NODE (STATIC METADATA)
-            # ---------------------------------------
-            damage_id = metadata.get("Damage_ID", damage_key)
-
-            damage_query = """
-            MERGE (d:Damage {
-                Damage_ID: $Damage_ID
-            })
-            SET d.DamageType = $DamageType,
-                d.Image_Filename = $Image_Filename,
-                d.IFC_Filepath = $IFC_Filepath,
-                d.IFC_Data = $IFC_Data,
-                d.IFC_Element = $IFC_Element,
-                d.IFC_GUID = $IFC_GUID
-            RETURN d
-            """
-
-            damage_params = {
-                "Damage_ID": damage_id,
-                "DamageType": metadata.get("DamageType"),
-                "Image_Filename": metadata.get("Image_Filename"),
-                "IFC_Filepath": metadata.get("IFC_Filepath"),
-                "IFC_Data": metadata.get("IFC_Data"),
-                "IFC_Element": metadata.get("IFC_Element"),
-                "IFC_GUID": metadata.get("IFC_GUID")
-            }
-
-            damage_result = db.query(damage_query, damage_params)
-            created_nodes.append(damage_result)
-
-            # ---------------------------------------
-            # CREATE EPOCH NODES
-            # ---------------------------------------
-            prev_epoch_id = None
-
-            for ep in epochs:
-                epoch_num = ep.get("Epoch")
-                epoch_id = f"{damage_id}_epoch_{epoch_num}"
-
-                epoch_query = """
-                CREATE (e:Epoch {
-                    epoch_id: $epoch_id,
-                    Epoch: $Epoch,
-                    Storage_Path: $Storage_Path,
-                    ReferenceCoOrdinateSystem: $ReferenceCoOrdinateSystem,
-                    Length_m: $Length_m,
-                    Width_mm: $Width_mm,
-                    Position_3D_Axis: $Position_3D_Axis,
-                    Max_Width_3D_Position: $Max_Width_3D_Position
-                })
-                RETURN e
-                """
-
-                epoch_params = {
-                    "epoch_id": epoch_id,
-                    "Epoch": epoch_num,
-                    "Storage_Path": ep.get("Storage_Path"),
-                    "ReferenceCoOrdinateSystem": ep.get("ReferenceCoOrdinateSystem"),
-                    "Length_m": ep.get("Length_m"),
-                    "Width_mm": ep.get("Width_mm"),
-                    "Position_3D_Axis": json.dumps(ep.get("Position_3D_Axis")),
-                    "Max_Width_3D_Position": json.dumps(ep.get("Max_Width_3D_Position"))
-                }
-
-                epoch_result = db.query(epoch_query, epoch_params)
-                created_nodes.append(epoch_result)
-
-                # Relationship: Damage -> Epoch
-                rel_query = """
-                MATCH (d:Damage {Damage_ID: $Damage_ID}),
-                      (e:Epoch {epoch_id: $epoch_id})
-                MERGE (d)-[:HAS_EPOCH]->(e)
-                """
-                db.query(rel_query, {"Damage_ID": damage_id, "epoch_id": epoch_id})
-
-                # Link epoch → next epoch
-                if prev_epoch_id:
-                    next_rel_query = """
-                    MATCH (e1:Epoch {epoch_id: $e1}),
-                          (e2:Epoch {epoch_id: $e2})
-                    MERGE (e1)-[:NEXT_EPOCH]->(e2)
-                    """
-                    db.query(next_rel_query, {"e1": prev_epoch_id, "e2": epoch_id})
-                    created_relationships.append(
-                        {"from": prev_epoch_id, "to": epoch_id, "type": "NEXT_EPOCH"}
-                    )
-
-                prev_epoch_id = epoch_id
-
-        return {
-            "status": "success",
-            "damage_nodes_created": len(created_nodes),
-            "relationships_created": len(created_relationships),
-        }
-
-    except json.JSONDecodeError:
+    except PartialUploadError as e:
+        # The batches before the invalid entry are committed; say which
+        raise HTTPException(status_code=400, detail={"error": str(e), "status": "partial", **e.report})
+    except (json.JSONDecodeError, ijson.JSONError):
         raise HTTPException(status_code=400, detail="Invalid JSON format")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Multi-file upload (compressed NDJSON or tar of JSON files) ---
+@app.post("/upload_damage_archive")
+async def upload_damage_archive(
+    request: Request,
+    file: UploadFile = File(...),
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)] = None,
+    chunk_size: int = Query(DEFAULT_CHUNK_SIZE, gt=0),
+    batch_size: int = Query(ARCHIVE_BATCH_SIZE, gt=0),
+    assign_elements: bool = False,
+    ifc_filepath: str | None = None
+):
+    try:
+        archive_format(file.filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if file.size is not None:
+        UPLOAD_BYTES.observe(file.size, endpoint="upload_damage_archive")
+    check_model_path(ifc_filepath)
+
+    try:
+        # One line or tar member per damage file; failed files are listed, the rest is written
+        on_commit = lambda params: invalidate_cache(request.app, params)
+        assigner = ElementAssigner(request.app.state.spatial_indexes, ifc_filepath) if assign_elements else None
+        report = await ingest_archive_async(db, file.file, file.filename, chunk_size, batch_size, on_commit, assigner)
+        if assigner:
+            report["elements_assigned"] = assigner.counts
+        return {"status": archive_status(report), **report}
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- Background Job Status ---
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, request: Request):
+    status = request.app.state.jobs.status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return status
+
+
+@app.post("/jobs/{job_id}/retry")
+async def retry_job(job_id: str, request: Request):
+    # A failed job resumes after its last committed batch, from the upload spooled at submit
+    try:
+        status = request.app.state.jobs.retry(job_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    return JSONResponse(status_code=202, content=status)
+
+
+# --- Read API ---
+@app.get("/damages/{damage_id}")
+async def get_damage(
+    damage_id: str,
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    cache: Annotated[TTLCache, Depends(get_cache)]
+):
+    key = ("damage", damage_id)
+    damage = cache.get(key)
+    if damage is None:
+        damage = await db.execute_read(get_damage_with_epochs, damage_id)
+        if damage is None:
+            raise HTTPException(status_code=404, detail=f"Unknown damage '{damage_id}'")
+        cache.set(key, damage, tags={("Damage", damage_id)})
+    return damage
+
+
+@app.get("/damages/{damage_id}/geometry")
+async def get_damage_geometry(
+    damage_id: str,
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    cache: Annotated[TTLCache, Depends(get_cache)]
+):
+    # Epoch polylines read as NumPy arrays, oldest epoch first
+    key = ("damage_geometry", damage_id)
+    epochs = cache.get(key)
+    if epochs is None:
+        epochs = describe_epoch_geometry(await db.execute_read(load_epoch_geometry, [damage_id]))
+        if not epochs:
+            raise HTTPException(status_code=404, detail=f"No epochs for damage '{damage_id}'")
+        cache.set(key, epochs, tags={("Damage", damage_id)})
+    return {"damage_id": damage_id, "epochs": epochs}
+
+
+@app.get("/damages/{damage_id}/causal_chain")
+async def get_causal_chain(
+    damage_id: str,
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    direction: str = Query("downstream", pattern="^(downstream|upstream)$"),
+    relation_type: Annotated[list[str] | None, Query()] = None,
+    max_depth: int = Query(5, ge=1, le=MAX_TRAVERSAL_DEPTH),
+    limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+):
+    # Damages caused by (downstream) or causing (upstream) this one, nearest first
+    try:
+        items = await db.execute_read(causal_chain, damage_id, direction == "downstream",
+                                      relation_type, max_depth, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"damage_id": damage_id, "direction": direction, "max_depth": max_depth, "items": items}
+
+
+@app.get("/damages")
+async def get_damages(
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    cache: Annotated[TTLCache, Depends(get_cache)],
+    ifc_guid: str | None = None,
+    damage_type: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+):
+    key = ("damages", ifc_guid, damage_type, cursor, limit)
+    page = cache.get(key)
+    if page is None:
+        try:
+            page = await db.execute_read(list_damages, ifc_guid, damage_type, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        cache.set(key, page, tags=damage_list_tags(ifc_guid, damage_type, page))
+    return page
+
+
+@app.get("/epochs")
+async def get_epochs(
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    cache: Annotated[TTLCache, Depends(get_cache)],
+    min_epoch: int = 0,
+    max_epoch: int = 2**31 - 1,
+    damage_id: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+):
+    key = ("epochs", min_epoch, max_epoch, damage_id, cursor, limit)
+    page = cache.get(key)
+    if page is None:
+        try:
+            page = await db.execute_read(list_epochs, min_epoch, max_epoch, damage_id, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        cache.set(key, page, tags={EPOCHS_TAG})
+    return page
+
+
+@app.get("/epochs/within_bbox")
+async def get_epochs_within_bbox(
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    min_x: float, min_y: float, min_z: float,
+    max_x: float, max_y: float, max_z: float,
+    damage_type: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+):
+    # Epochs whose Max_Width_3D_Position lies in the box, answered by the point index
+    lower = {"x": min_x, "y": min_y, "z": min_z}
+    upper = {"x": max_x, "y": max_y, "z": max_z}
+    epochs = await db.execute_read(epochs_in_bbox, lower, upper, damage_type, limit)
+    return {"items": epochs}
+
+
+# --- Element Summaries (maintained on upload, see summaries.py) ---
+@app.get("/elements/summaries")
+async def get_element_summaries(
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    cache: Annotated[TTLCache, Depends(get_cache)],
+    damage_type: str | None = None,
+    min_width: float | None = None,
+    cursor: str | None = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+):
+    key = ("element_summaries", damage_type, min_width, cursor, limit)
+    page = cache.get(key)
+    if page is None:
+        try:
+            page = await db.execute_read(list_element_summaries, damage_type, min_width, cursor, limit)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        cache.set(key, page, tags={SUMMARIES_TAG})
+    return page
+
+
+@app.get("/elements/{ifc_guid}/summary")
+async def get_summary(
+    ifc_guid: str,
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    cache: Annotated[TTLCache, Depends(get_cache)]
+):
+    key = ("element_summary", ifc_guid)
+    summary = cache.get(key)
+    if summary is None:
+        summary = await db.execute_read(get_element_summary, ifc_guid)
+        if summary is None:
+            raise HTTPException(status_code=404, detail=f"No damages on element '{ifc_guid}'")
+        cache.set(key, summary, tags={SUMMARIES_TAG})
+    return summary
+
+
+# --- Crack Growth Analytics ---
+@app.get("/analytics/growth")
+async def get_growth(
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    damage_id: Annotated[list[str] | None, Query()] = None,
+    ifc_guid: str | None = None,
+    damage_type: str | None = None,
+    metric: str = "Width_mm",
+    threshold: float | None = None,
+    top: int | None = Query(None, gt=0),
+    include_series: bool = False
+):
+    # One bulk query for the whole selection, then a single vectorised NumPy pass
+    rows = await db.execute_read(fetch_epoch_series, damage_id, ifc_guid, damage_type)
+    try:
+        ranked = analyze_growth(rows, metric, threshold, top, include_series)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"metric": metric, "threshold": threshold, "damages_analyzed": len(rows), "items": ranked}
+
+
+# --- IFC Export ---
+@app.get("/export/ifc")
+async def export_ifc(
+    db: Annotated[AsyncNeo4jConnection, Depends(get_db)],
+    models: Annotated[IfcModelCache, Depends(get_ifc_models)],
+    ifc_filepath: str,
+    model: str,
+    ifc_guid: str | None = None,
+    damage_type: str | None = None,
+    group_by_element: bool = False,
+    batch_size: int = Query(EXPORT_BATCH_SIZE, gt=0)
+):
+    # Damages whose IFC_Filepath is `ifc_filepath` (latest epoch each) written straight into a
+    # copy of `model`, a file under the IFC models directory
+    try:
+        model_path = resolve_model_path(model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    fd, output_path = tempfile.mkstemp(suffix=".ifc")
+    os.close(fd)
+    try:
+        report = await export_damages_from_db_async(db, ifc_filepath, output_path, models, ifc_guid,
+                                                    damage_type, group_by_element, batch_size, model_path)
+    except FileNotFoundError:
+        os.remove(output_path)
+        raise HTTPException(status_code=404, detail=f"IFC model '{model}' not found")
+    except Exception as e:
+        os.remove(output_path)
+        # Details stay in the server log; they can name files and internals
+        print(f"Error: IFC export of '{ifc_filepath}' failed: {e!r}")
+        raise HTTPException(status_code=500, detail="IFC export failed")
+
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return FileResponse(
+        output_path,
+        media_type="application/x-step",
+        filename=f"{stem}_with_damages.ifc",
+        headers={
+            "X-Damages-Exported": str(report["damages_exported"]),
+            "X-Missing-Elements": str(report["missing_elements"]),
+            "X-Model-Cache": report["model_cache"],
+        },
+        background=BackgroundTask(os.remove, output_path),
+    )
+
+
+@app.get("/export/ifc/models")
+async def ifc_model_cache_stats(models: Annotated[IfcModelCache, Depends(get_ifc_models)]):
+    return models.stats()
+
+
+@app.get("/cache/stats")
+async def cache_stats(cache: Annotated[TTLCache, Depends(get_cache)]):
+    return cache.stats()
@@ -0,0 +1,173 @@
+import base64
+import json
+
+# --- Read settings ---
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Cache tags for responses that any upload can change (unfiltered listings).
+DAMAGES_TAG = ("Damage", "*")
+EPOCHS_TAG = ("Epoch", "*")
+# Element summaries change when damages move between elements, too
+SUMMARIES_TAG = ("ElementSummary", "*")
+
+
+# --- Cypher (all lookups start from an indexed property, see schema.py) ---
+DAMAGE_WITH_EPOCHS_QUERY = """
+MATCH (d:Damage {Damage_ID: $damage_id})
+OPTIONAL MATCH (d)-[:HAS_EPOCH]->(head:Epoch)
+WHERE NOT (:Epoch)-[:NEXT_EPOCH]->(head)
+OPTIONAL MATCH chain = (head)-[:NEXT_EPOCH*0..]->(tail:Epoch)
+WHERE NOT (tail)-[:NEXT_EPOCH]->(:Epoch)
+WITH d, chain
+ORDER BY length(chain) DESC
+LIMIT 1
+RETURN d {.*} AS damage,
+       CASE WHEN chain IS NULL THEN [] ELSE [e IN nodes(chain) | e {.*}] END AS epochs
+"""
+
+LIST_DAMAGES_QUERY = """
+MATCH (d:Damage)
+WHERE ($ifc_guid IS NULL OR d.IFC_GUID = $ifc_guid)
+  AND ($damage_type IS NULL OR d.DamageType = $damage_type)
+  AND ($after IS NULL OR d.Damage_ID > $after)
+RETURN d {.*} AS damage
+ORDER BY d.Damage_ID
+LIMIT $limit
+"""
+
+LIST_EPOCHS_QUERY = """
+MATCH (e:Epoch)
+WHERE e.Epoch >= $min_epoch AND e.Epoch <= $max_epoch
+  AND ($after_epoch IS NULL
+       OR e.Epoch > $after_epoch
+       OR (e.Epoch = $after_epoch AND e.epoch_id > $after_id))
+MATCH (d:Damage)-[:HAS_EPOCH]->(e)
+WHERE $damage_id IS NULL OR d.Damage_ID = $damage_id
+RETURN e {.*, Damage_ID: d.Damage_ID} AS epoch
+ORDER BY e.Epoch, e.epoch_id
+LIMIT $limit
+"""
+
+# Precomputed per-element summaries (summaries.py): one node per element, no epoch walk
+ELEMENT_SUMMARY_QUERY = """
+MATCH (s:ElementSummary {IFC_GUID: $ifc_guid})
+RETURN s {.*} AS summary
+"""
+
+LIST_ELEMENT_SUMMARIES_QUERY = """
+MATCH (s:ElementSummary)
+WHERE ($damage_type IS NULL OR $damage_type IN s.DamageTypes)
+  AND ($min_width IS NULL OR s.Max_Width_mm >= $min_width)
+  AND ($after IS NULL OR s.IFC_GUID > $after)
+RETURN s {.*} AS summary
+ORDER BY s.IFC_GUID
+LIMIT $limit
+"""
+
+
+# --- Keyset cursors ---
+# Cursors are opaque to clients: the sort key of the last row, base64-encoded.
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def _is_id_key(key):
+    return isinstance(key, str)
+
+
+def _is_epoch_key(key):
+    # [Epoch, epoch_id]
+    return (isinstance(key, list) and len(key) == 2 and isinstance(key[1], str)
+            and isinstance(key[0], (int, float)) and not isinstance(key[0], bool))
+
+
+def decode_cursor(cursor, is_key=_is_id_key):
+    """Raises ValueError on a cursor this module did not produce.
+
+    ``is_key`` checks the shape of the decoded key; a key of null is no cursor.
+    """
+    if cursor is None:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    if key is not None and not is_key(key):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return key
+
+
+def _page(rows, limit, field, key):
+    # One extra row is fetched to know whether another page exists.
+    items = [row[field] for row in rows[:limit]]
+    next_cursor = encode_cursor(key(items[-1])) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# --- Async read transaction functions ---
+async def _fetch(tx, query, **params):
+    result = await tx.run(query, **params)
+    return [record.data() async for record in result]
+
+
+async def get_damage_with_epochs(tx, damage_id):
+    rows = await _fetch(tx, DAMAGE_WITH_EPOCHS_QUERY, damage_id=damage_id)
+    return rows[0] if rows else None
+
+
+async def list_damages(tx, ifc_guid=None, damage_type=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    after = decode_cursor(cursor)
+    rows = await _fetch(tx, LIST_DAMAGES_QUERY, ifc_guid=ifc_guid, damage_type=damage_type,
+                        after=after, limit=limit + 1)
+    return _page(rows, limit, "damage", lambda damage: damage["Damage_ID"])
+
+
+async def list_epochs(tx, min_epoch, max_epoch, damage_id=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    after_epoch, after_id = decode_cursor(cursor, _is_epoch_key) or (None, None)
+    rows = await _fetch(tx, LIST_EPOCHS_QUERY, min_epoch=min_epoch, max_epoch=max_epoch,
+                        damage_id=damage_id, after_epoch=after_epoch, after_id=after_id,
+                        limit=limit + 1)
+    return _page(rows, limit, "epoch", lambda epoch: [epoch["Epoch"], epoch["epoch_id"]])
+
+
+def _element_summary(summary):
+    # The parallel DamageTypes/DamageTypeCounts lists are stored because node properties cannot be maps
+    summary["DamageCounts"] = dict(zip(summary.pop("DamageTypes", []), summary.pop("DamageTypeCounts", [])))
+    return summary
+
+
+async def get_element_summary(tx, ifc_guid):
+    rows = await _fetch(tx, ELEMENT_SUMMARY_QUERY, ifc_guid=ifc_guid)
+    return _element_summary(rows[0]["summary"]) if rows else None
+
+
+async def list_element_summaries(tx, damage_type=None, min_width=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    after = decode_cursor(cursor)
+    rows = await _fetch(tx, LIST_ELEMENT_SUMMARIES_QUERY, damage_type=damage_type, min_width=min_width,
+                        after=after, limit=limit + 1)
+    for row in rows:
+        _element_summary(row["summary"])
+    return _page(rows, limit, "summary", lambda summary: summary["IFC_GUID"])
+
+
+# --- Cache tags ---
+def damage_list_tags(ifc_guid, damage_type, page):
+    tags = {("Damage", damage["Damage_ID"]) for damage in page["items"]}
+    if ifc_guid is not None:
+        tags.add(("IFC_GUID", ifc_guid))
+    if damage_type is not None:
+        tags.add(("DamageType", damage_type))
+    if ifc_guid is None and damage_type is None:
+        tags.add(DAMAGES_TAG)
+    return tags
+
+
+def cache_tags_for_params(params):
+    """Tags made stale by writing ``params`` (see ingestion.build_ingestion_params)."""
+    tags = {DAMAGES_TAG, EPOCHS_TAG, SUMMARIES_TAG}
+    for row in params["damages"]:
+        tags.add(("Damage", row["Damage_ID"]))
+        tags.add(("IFC_GUID", row["IFC_GUID"]))
+        tags.add(("DamageType", row["DamageType"]))
+    return tags
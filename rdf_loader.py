@@ -0,0 +1,345 @@
+"""Load damage RDF (Turtle, N-Triples, N-Quads) into Neo4j.
+
+Maps the triples generate_RDF writes onto the graph /upload_damage_json
+builds, so a damage uploaded as JSON and the same damage loaded from RDF end
+up as one node:
+
+  ex:crack_001 a cdo:Crack               (:Damage {Damage_ID: "crack_001", DamageType: "crack"})
+  ex:crack_001 cdo:damageLocatedOn ex:e  IFC_GUID and IFC_Element of element ex:e,
+  ex:e cdo:ifcGlobalId "3fD9Khs8..."     wherever in the input ex:e is described
+  ex:crack_001 cdo:causes ex:rust_001    (:Damage)-[:CAUSES]->(:Damage), damage_relations vocabulary
+
+Line-based files (.nt, .nq, optionally .gz) are read and parsed in chunks of
+--chunk-lines lines, so memory does not grow with the file; Turtle is not
+line-oriented and is parsed a whole file at a time. Every chunk is upserted
+with batched UNWIND statements in one write transaction. Damages whose
+element is described in a later file, and all relationships, are written in
+a final pass once every Damage node exists.
+
+    python rdf_loader.py ontology_output.ttl
+    python rdf_loader.py rdf_archive/ --workers 8 --pattern "*.nt.gz"
+"""
+import argparse
+import glob
+import gzip
+import os
+import re
+import time
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool, util
+
+from rdflib import Dataset, Graph, RDF, URIRef
+
+from ingestion import DEFAULT_CHUNK_SIZE
+from instrumentation import stage
+from relations import group_relation_rows, relationship_type
+
+CDO = "https://w3id.org/damagemodels/cdo#"
+DAMAGE_LOCATED_ON = URIRef(CDO + "damageLocatedOn")
+IFC_GLOBAL_ID = URIRef(CDO + "ifcGlobalId")
+
+# --- Loader settings ---
+# Lines of N-Triples/N-Quads parsed and written per transaction (triples for Turtle).
+DEFAULT_CHUNK_LINES = int(os.getenv('rdf_load_chunk_lines', 50_000))
+
+# cdo: classes of building elements (plus every cdo:Ifc* class); any other
+# cdo: class on an instance is its damage class.
+ELEMENT_CLASSES = frozenset({"BuildingElement", "Beam", "Column", "Slab", "Wall"})
+# Metaclasses: their instances are damage classes, not damages (RDF_schema.ttl)
+SCHEMA_CLASSES = frozenset({"DamageClass"})
+
+LINE_FORMATS = {".nt": "nt", ".nq": "nquads"}
+_PASSES = {RDF.type: 0, IFC_GLOBAL_ID: 1}
+
+
+# --- Cypher ---
+# Same Damage_ID key as ingestion.DAMAGE_QUERY; properties the RDF does not
+# state are left as they are, so loading never erases what an upload wrote.
+RDF_DAMAGE_QUERY = """
+UNWIND $rows AS row
+MERGE (d:Damage {Damage_ID: row.Damage_ID})
+SET d.DamageType = coalesce(row.DamageType, d.DamageType),
+    d.IFC_GUID = coalesce(row.IFC_GUID, d.IFC_GUID),
+    d.IFC_Element = coalesce(row.IFC_Element, d.IFC_Element)
+"""
+
+
+def write_damage_rows(tx, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    for start in range(0, len(rows), chunk_size):
+        tx.run(RDF_DAMAGE_QUERY, rows=rows[start:start + chunk_size]).consume()
+
+
+def write_relation_rows(tx, rows, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Returns the number of relationships created; rows naming an unknown damage create nothing."""
+    created = 0
+    for query, group in group_relation_rows(rows):
+        for start in range(0, len(group), chunk_size):
+            summary = tx.run(query, rows=group[start:start + chunk_size]).consume()
+            created += summary.counters.relationships_created
+    return created
+
+
+# --- Triples -> rows ---
+def local_name(term):
+    """``http://example.org/damageInstances#crack_001`` -> ``crack_001`` (the JSON Damage_ID)."""
+    text = str(term)
+    return text[max(text.rfind("#"), text.rfind("/")) + 1:]
+
+
+def _snake_case(name):
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+class DamageTripleMapper:
+    """Turns cdo: triples into Damage rows and relation rows, across chunks and files.
+
+    The GUID and class of every element seen are kept (one small dict per
+    element), so a damage is resolved as soon as both of its triples have
+    been read, in whichever order; until then it waits in ``waiting``.
+    IFC_Element is filled in when the element's class is known by then.
+    Relation rows are only collected here and written at the end.
+    """
+
+    def __init__(self):
+        self.elements = {}
+        self.waiting = {}
+        self.relations = []
+        self.unmapped_links = 0
+
+    @property
+    def unresolved(self):
+        return sum(len(damage_ids) for damage_ids in self.waiting.values())
+
+    def add(self, triples):
+        """Damage rows for one chunk of triples, at most one per Damage_ID."""
+        rows = {}
+
+        def row(damage_id):
+            return rows.setdefault(damage_id, {"Damage_ID": damage_id})
+
+        # Serializers write triples in any order: classes and GUIDs first, then what points at them
+        for s, p, o in sorted(triples, key=lambda triple: _PASSES.get(triple[1], 2)):
+            # Statements about the ontology itself (cdo:Crack a owl:Class, ...) are not instance data
+            if not isinstance(s, URIRef) or str(s).startswith(CDO):
+                continue
+            if p == RDF.type:
+                if not isinstance(o, URIRef) or not str(o).startswith(CDO):
+                    continue
+                name = str(o)[len(CDO):]
+                if name in ELEMENT_CLASSES or name.startswith("Ifc"):
+                    self.elements.setdefault(s, {})["IFC_Element"] = name
+                elif name not in SCHEMA_CLASSES:
+                    row(local_name(s))["DamageType"] = name.lower()
+            elif p == DAMAGE_LOCATED_ON:
+                damage_id = local_name(s)
+                element = self.elements.get(o)
+                if element and "IFC_GUID" in element:
+                    row(damage_id).update(element)
+                else:
+                    row(damage_id)
+                    self.waiting.setdefault(o, []).append(damage_id)
+            elif p == IFC_GLOBAL_ID:
+                element = self.elements.setdefault(s, {})
+                element["IFC_GUID"] = str(o)
+                for damage_id in self.waiting.pop(s, ()):
+                    row(damage_id).update(element)
+            elif isinstance(o, URIRef) and str(p).startswith(CDO):
+                try:
+                    rel_type = relationship_type(_snake_case(str(p)[len(CDO):]))
+                except ValueError:
+                    # Object properties outside the vocabulary (cdo:coexistsWith, ...)
+                    self.unmapped_links += 1
+                    continue
+                self.relations.append({"source": local_name(s), "target": local_name(o), "relation_type": rel_type})
+        return list(rows.values())
+
+    def merge(self, other):
+        """Take over the state a worker's mapper ended a file with."""
+        for element, info in other["elements"].items():
+            self.elements.setdefault(element, {}).update(info)
+        for element, damage_ids in other["waiting"].items():
+            self.waiting.setdefault(element, []).extend(damage_ids)
+        self.relations.extend(other["relations"])
+        self.unmapped_links += other["unmapped_links"]
+
+    def resolve_waiting(self):
+        """Rows for waiting damages whose element has since been described (in another file)."""
+        rows = []
+        for element, damage_ids in list(self.waiting.items()):
+            info = self.elements.get(element)
+            if info and "IFC_GUID" in info:
+                rows.extend({"Damage_ID": damage_id, **info} for damage_id in damage_ids)
+                del self.waiting[element]
+        return rows
+
+
+# --- Reading ---
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def iter_triple_chunks(path, chunk_lines=DEFAULT_CHUNK_LINES):
+    """Lists of the triples in ``path`` that mention the cdo: namespace."""
+    line_format = LINE_FORMATS.get(os.path.splitext(path.removesuffix(".gz"))[1])
+    if line_format is None:
+        g = Graph()
+        with _open(path, "rb") as f:
+            g.parse(file=f, format="turtle")
+        relevant = (triple for triple in g if any(CDO in str(term) for term in triple[1:]))
+        yield from _batched(relevant, chunk_lines)
+        return
+
+    with _open(path, "rt") as f:
+        for lines in _batched(f, chunk_lines):
+            # Every triple the mapper uses has a cdo: predicate or class
+            data = "".join(line for line in lines if CDO in line)
+            if not data:
+                continue
+            if line_format == "nquads":
+                ds = Dataset()
+                ds.parse(data=data, format="nquads")
+                yield [(s, p, o) for s, p, o, _ in ds.quads()]
+            else:
+                g = Graph()
+                g.parse(data=data, format="nt")
+                yield list(g)
+
+
+# --- Loading ---
+def load_file(db, path, mapper, chunk_lines=DEFAULT_CHUNK_LINES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Upsert the damages of one file, a transaction per chunk; returns its counts."""
+    counts = Counter()
+    for triples in iter_triple_chunks(path, chunk_lines):
+        rows = mapper.add(triples)
+        counts["triples"] += len(triples)
+        counts["chunks"] += 1
+        if rows:
+            with stage("rdf_load", "write", rows=len(rows)):
+                db.execute_write(write_damage_rows, rows, chunk_size)
+            counts["damage_rows"] += len(rows)
+    return counts
+
+
+_worker_db = None
+_worker_settings = None
+
+
+def _init_worker(chunk_lines, chunk_size):
+    # One driver per process, closed when the worker exits
+    global _worker_db, _worker_settings
+    from database import Neo4jConnection, driver_config, uri, user, pwd
+
+    _worker_db = Neo4jConnection(uri, user, pwd, **driver_config())
+    _worker_settings = (chunk_lines, chunk_size)
+    util.Finalize(None, _worker_db.close, exitpriority=10)
+
+
+def _load_in_worker(path):
+    mapper = DamageTripleMapper()
+    try:
+        counts = load_file(_worker_db, path, mapper, *_worker_settings)
+    except Exception as e:
+        return path, e
+    return path, {"counts": counts, "elements": mapper.elements, "waiting": mapper.waiting,
+                  "relations": mapper.relations, "unmapped_links": mapper.unmapped_links}
+
+
+def load_rdf(db, paths, workers=1, chunk_lines=DEFAULT_CHUNK_LINES, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Load ``paths`` in order (``workers=1``) or across a process pool; returns a summary dict.
+
+    A file that fails to parse or load is reported and skipped; chunks it
+    already wrote stay, and loading it again is safe since every write is
+    an upsert.
+    """
+    mapper = DamageTripleMapper()
+    totals = Counter()
+    failures = []
+
+    start = time.perf_counter()
+    if workers == 1:
+        for path in paths:
+            try:
+                totals.update(load_file(db, path, mapper, chunk_lines, chunk_size))
+            except Exception as e:
+                failures.append({"file": path, "error": str(e)})
+    else:
+        pool = Pool(workers, initializer=_init_worker, initargs=(chunk_lines, chunk_size))
+        try:
+            for path, result in pool.imap_unordered(_load_in_worker, paths):
+                if isinstance(result, Exception):
+                    failures.append({"file": path, "error": str(result)})
+                    continue
+                totals.update(result["counts"])
+                mapper.merge(result)
+        finally:
+            pool.close()
+            pool.join()
+
+    # Links across files, then relationships once every Damage node exists
+    late_rows = mapper.resolve_waiting()
+    if late_rows:
+        db.execute_write(write_damage_rows, late_rows, chunk_size)
+    relationships = db.execute_write(write_relation_rows, mapper.relations, chunk_size) if mapper.relations else 0
+    elapsed = time.perf_counter() - start
+
+    return {
+        "files": len(paths),
+        "failed_files": failures,
+        "triples": totals["triples"],
+        "chunks": totals["chunks"],
+        "damage_rows": totals["damage_rows"] + len(late_rows),
+        "late_links_resolved": len(late_rows),
+        "unresolved_locations": mapper.unresolved,
+        "relations": len(mapper.relations),
+        "relationships_created": relationships,
+        "unmapped_links": mapper.unmapped_links,
+        "elapsed_s": round(elapsed, 3),
+        "triples_per_s": round(totals["triples"] / elapsed, 1) if elapsed else None,
+    }
+
+
+def collect_paths(target, pattern="*"):
+    if os.path.isdir(target):
+        return sorted(path for path in glob.glob(os.path.join(target, "**", pattern), recursive=True)
+                      if os.path.isfile(path))
+    return [target]
+
+
+if __name__ == "__main__":
+    from database import Neo4jConnection, driver_config, uri, user, pwd
+    from schema import bootstrap_schema
+    from summaries import rebuild_summaries
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("target", help="an RDF file or a directory of them")
+    parser.add_argument("--pattern", default="*.*", help="file pattern inside a directory")
+    parser.add_argument("--workers", type=int, default=None, help="processes for a directory (default: CPU count)")
+    parser.add_argument("--chunk-lines", type=int, default=DEFAULT_CHUNK_LINES)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per UNWIND statement")
+    args = parser.parse_args()
+
+    paths = collect_paths(args.target, args.pattern)
+    workers = 1 if len(paths) == 1 else args.workers
+    db = Neo4jConnection(uri, user, pwd, **driver_config())
+    try:
+        bootstrap_schema(db)
+        summary = load_rdf(db, paths, workers, args.chunk_lines, args.chunk_size)
+        # The loader bypasses ingestion, which keeps element summaries current
+        rebuilt = rebuild_summaries(db)
+    finally:
+        db.close()
+    for failure in summary["failed_files"]:
+        print(f"Warning: skipped {failure['file']}: {failure['error']}")
+    print(f"{summary['files']} files, {summary['triples']} cdo: triples -> {summary['damage_rows']} damage rows, "
+          f"{summary['relationships_created']} relationships in {summary['elapsed_s']}s "
+          f"= {summary['triples_per_s']} triples/s")
+    if summary["unresolved_locations"]:
+        print(f"{summary['unresolved_locations']} damages located on elements without cdo:ifcGlobalId")
+    print(f"{rebuilt['elements']} element summaries rebuilt in {rebuilt['elapsed_s']}s")
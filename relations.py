@@ -0,0 +1,143 @@
+# --- Damage-to-damage relations (json_template.json: damage_relations) ---
+# The vocabulary of json_template.json; each term is stored as its own
+# relationship type (causes -> CAUSES) between Damage nodes.
+RELATION_VOCABULARY = (
+    "adjacent_to", "causes", "consequence_of", "overlaps", "extends_into",
+    "propagates_from", "intersects_with", "part_of", "similar_to",
+)
+# Spellings found in real inference output
+RELATION_ALIASES = {"adjacent": "adjacent_to"}
+
+# Causal relation types by the direction that points downstream:
+# (a)-[:CAUSES]->(b) puts b downstream of a, (a)-[:PROPAGATES_FROM]->(b) puts a downstream of b.
+CAUSAL_FORWARD = ("causes", "extends_into")
+CAUSAL_BACKWARD = ("consequence_of", "propagates_from")
+MAX_TRAVERSAL_DEPTH = 10
+
+
+def relationship_type(relation_type):
+    """``"propagates_from"`` -> ``"PROPAGATES_FROM"``; raises ValueError outside the vocabulary."""
+    name = str(relation_type).strip().lower().replace("-", "_").replace(" ", "_")
+    name = RELATION_ALIASES.get(name, name)
+    if name not in RELATION_VOCABULARY:
+        raise ValueError(
+            f"Unknown relation_type '{relation_type}'. Expected one of {', '.join(RELATION_VOCABULARY)}."
+        )
+    return name.upper()
+
+
+# Relationship types cannot be parameters, so there is one statement per
+# type, built from the fixed vocabulary above (never from request input).
+RELATION_QUERY = """
+UNWIND $rows AS row
+MATCH (a:Damage {{Damage_ID: row.source}}),
+      (b:Damage {{Damage_ID: row.target}})
+MERGE (a)-[:{rel_type}]->(b)
+"""
+
+RELATION_QUERIES = {
+    name.upper(): RELATION_QUERY.format(rel_type=name.upper()) for name in RELATION_VOCABULARY
+}
+
+
+def group_relation_rows(rows):
+    """Relation rows -> ``[(query, rows), ...]``, one entry per relationship type present."""
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row["relation_type"], []).append(row)
+    return [(RELATION_QUERIES[rel_type], group) for rel_type, group in grouped.items()]
+
+
+class RelationResolver:
+    """Turns ``damage_relations`` into ``{source, target, relation_type}`` rows.
+
+    ``related_to_indices`` are 0-based positions of entries in the upload, as
+    in the detection format; ``related_to`` lists Damage_IDs directly (also of
+    damages from earlier uploads). A relation to an entry that has not been
+    parsed yet is held back and emitted together with that entry, so streamed
+    batches only ever reference damages that are written in the same or an
+    earlier transaction.
+    """
+
+    def __init__(self):
+        self.damage_ids = []
+        self.pending = {}
+
+    @property
+    def unresolved(self):
+        return sum(len(rows) for rows in self.pending.values())
+
+    def add(self, rows, damage_id, damage_relations):
+        index = len(self.damage_ids)
+        self.damage_ids.append(damage_id)
+        for row in self.pending.pop(index, ()):
+            rows.append({**row, "target": damage_id})
+
+        if not isinstance(damage_relations or [], list):
+            raise ValueError(f"Invalid damage_relations under '{damage_id}'. Expected a list.")
+        for relation in damage_relations or ():
+            if not isinstance(relation, dict) or "relation_type" not in relation:
+                raise ValueError(f"Invalid damage_relations entry under '{damage_id}'. Required: relation_type.")
+            rel_type = relationship_type(relation["relation_type"])
+            for field in ("related_to", "related_to_indices"):
+                if not isinstance(relation.get(field, []), list):
+                    raise ValueError(f"Invalid {field} under '{damage_id}'. Expected a list.")
+
+            for target in relation.get("related_to", ()):
+                if not isinstance(target, str):
+                    raise ValueError(f"Invalid related_to value {target!r} under '{damage_id}'. Expected a Damage_ID.")
+                rows.append({"source": damage_id, "target": target, "relation_type": rel_type})
+            for target_index in relation.get("related_to_indices", ()):
+                if not isinstance(target_index, int) or isinstance(target_index, bool) or target_index < 0:
+                    raise ValueError(f"Invalid related_to_indices value {target_index!r} under '{damage_id}'.")
+                row = {"source": damage_id, "relation_type": rel_type}
+                if target_index < len(self.damage_ids):
+                    rows.append({**row, "target": self.damage_ids[target_index]})
+                else:
+                    self.pending.setdefault(target_index, []).append(row)
+
+
+# --- Causal chain traversal ---
+# Breadth-first, one statement per depth level: each level expands only the
+# damages first reached on the previous one, so every damage is expanded at
+# most once and the cost grows with the reachable subgraph, not with the
+# number of paths through it. Each hop's direction is checked against the
+# relationship type while expanding.
+CAUSAL_STEP_QUERY = """
+UNWIND $frontier AS damage_id
+MATCH (a:Damage {{Damage_ID: damage_id}})-[r:{rel_types}]-(b:Damage)
+WHERE type(r) IN $types AND (type(r) IN $outgoing) = (startNode(r) = a)
+RETURN DISTINCT b.Damage_ID AS damage_id,
+       b.DamageType AS damage_type,
+       b.IFC_GUID AS ifc_guid
+"""
+
+
+async def causal_chain(tx, damage_id, downstream=True, relation_types=None, max_depth=5, limit=1000):
+    """Damages reachable from ``damage_id`` along causal relations, nearest first.
+
+    Each damage is reported once, at its shortest depth; ties are ordered by
+    Damage_ID. Raises ValueError for a non-causal relation type or a depth
+    outside 1..MAX_TRAVERSAL_DEPTH.
+    """
+    causal = [name.upper() for name in CAUSAL_FORWARD + CAUSAL_BACKWARD]
+    types = [relationship_type(name) for name in relation_types] if relation_types else causal
+    if any(rel_type not in causal for rel_type in types):
+        raise ValueError(f"Causal traversal follows only {', '.join(CAUSAL_FORWARD + CAUSAL_BACKWARD)}.")
+    if not 1 <= max_depth <= MAX_TRAVERSAL_DEPTH:
+        raise ValueError(f"max_depth must be between 1 and {MAX_TRAVERSAL_DEPTH}.")
+
+    # Types followed along their stored direction; the others are walked backwards
+    outgoing = [name.upper() for name in (CAUSAL_FORWARD if downstream else CAUSAL_BACKWARD)]
+    query = CAUSAL_STEP_QUERY.format(rel_types="|".join(causal))
+    seen, frontier, items = {damage_id}, [damage_id], []
+    for depth in range(1, max_depth + 1):
+        if not frontier or len(items) >= limit:
+            break
+        result = await tx.run(query, frontier=frontier, types=types, outgoing=outgoing)
+        level = [record.data() async for record in result]
+        level = sorted((row for row in level if row["damage_id"] not in seen), key=lambda row: row["damage_id"])
+        seen.update(row["damage_id"] for row in level)
+        frontier = [row["damage_id"] for row in level]
+        items.extend({**row, "depth": depth} for row in level)
+    return items[:limit]
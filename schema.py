@@ -0,0 +1,87 @@
+import os
+
+from neo4j.exceptions import DriverError, Neo4jError
+
+# --- Duplicate cleanup ---
+# Epochs used to be written with CREATE, so re-uploads left duplicates behind.
+# Every duplicate received the same HAS_EPOCH/NEXT_EPOCH links (those were
+# MATCHed by id), so keeping one node per id and detaching the rest is lossless.
+# The copy kept is the newest one (highest internal id): it holds the values
+# of the latest re-upload, which MERGE/SET now treats as authoritative.
+# Only ids are collected; the deletes run in batches of their own
+# transactions, so a large backlog of duplicates does not have to fit in
+# one transaction's memory.
+# This has to run before the uniqueness constraints can be created, and only
+# then: once a constraint exists duplicates cannot reappear.
+DEDUPLICATE_BATCH_SIZE = int(os.getenv('schema_dedup_batch_size', 10000))
+
+DEDUPLICATE_QUERY = """
+MATCH (n:{label})
+WHERE n.{key} IS NOT NULL
+WITH n.{key} AS key, collect(id(n)) AS ids
+WHERE size(ids) > 1
+WITH ids, reduce(newest = -1, node_id IN ids | CASE WHEN node_id > newest THEN node_id ELSE newest END) AS newest
+UNWIND [node_id IN ids WHERE node_id <> newest] AS duplicate_id
+CALL {{
+  WITH duplicate_id
+  MATCH (duplicate) WHERE id(duplicate) = duplicate_id
+  DETACH DELETE duplicate
+}} IN TRANSACTIONS OF {batch_size} ROWS
+"""
+
+UNIQUE_KEYS = (
+    ("damage_id_unique", "Damage", "Damage_ID"),
+    ("epoch_id_unique", "Epoch", "epoch_id"),
+    ("element_summary_ifc_guid_unique", "ElementSummary", "IFC_GUID"),
+)
+
+EXISTING_CONSTRAINTS_QUERY = "SHOW CONSTRAINTS YIELD name RETURN name"
+
+# --- Constraints and indexes ---
+# Uniqueness constraints are backed by range indexes, so they also serve the
+# MATCH/MERGE lookups on Damage_ID, epoch_id and ElementSummary.IFC_GUID.
+SCHEMA_STATEMENTS = (
+    "CREATE CONSTRAINT damage_id_unique IF NOT EXISTS FOR (d:Damage) REQUIRE d.Damage_ID IS UNIQUE",
+    "CREATE CONSTRAINT epoch_id_unique IF NOT EXISTS FOR (e:Epoch) REQUIRE e.epoch_id IS UNIQUE",
+    "CREATE CONSTRAINT element_summary_ifc_guid_unique IF NOT EXISTS "
+    "FOR (s:ElementSummary) REQUIRE s.IFC_GUID IS UNIQUE",
+    "CREATE INDEX damage_ifc_guid IF NOT EXISTS FOR (d:Damage) ON (d.IFC_GUID)",
+    "CREATE INDEX damage_ifc_filepath IF NOT EXISTS FOR (d:Damage) ON (d.IFC_Filepath)",
+    "CREATE INDEX damage_type IF NOT EXISTS FOR (d:Damage) ON (d.DamageType)",
+    "CREATE INDEX epoch_number IF NOT EXISTS FOR (e:Epoch) ON (e.Epoch)",
+    "CREATE POINT INDEX epoch_max_width_position IF NOT EXISTS FOR (e:Epoch) ON (e.Max_Width_3D_Position)",
+)
+
+
+def _deduplicate_statements(existing_rows):
+    existing = {row["name"] for row in existing_rows}
+    return [
+        DEDUPLICATE_QUERY.format(label=label, key=key, batch_size=DEDUPLICATE_BATCH_SIZE)
+        for name, label, key in UNIQUE_KEYS
+        if name not in existing
+    ]
+
+
+def bootstrap_schema(db):
+    """Create constraints and indexes (idempotent) on a ``Neo4jConnection``."""
+    for statement in _deduplicate_statements(db.query(EXISTING_CONSTRAINTS_QUERY)):
+        db.query(statement)
+    for statement in SCHEMA_STATEMENTS:
+        db.query(statement)
+
+
+async def bootstrap_schema_async(db):
+    """Async counterpart of ``bootstrap_schema`` for ``AsyncNeo4jConnection``."""
+    for statement in _deduplicate_statements(await db.query(EXISTING_CONSTRAINTS_QUERY)):
+        await db.query(statement)
+    for statement in SCHEMA_STATEMENTS:
+        await db.query(statement)
+
+
+async def try_bootstrap_schema_async(db):
+    # Startup should not fail just because the database is briefly unavailable;
+    # the statements are idempotent and run again on the next start.
+    try:
+        await bootstrap_schema_async(db)
+    except (Neo4jError, DriverError) as e:
+        print(f"Warning: schema bootstrap skipped: {e}")
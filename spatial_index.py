@@ -0,0 +1,396 @@
+"""Assign detections to IFC elements through a bounding-box index.
+
+Element geometry is triangulated once with ``ifcopenshell.geom`` and reduced
+to world-space axis-aligned bounding boxes, which are organised as a flat
+NumPy bounding volume hierarchy. A whole batch of points is answered in one
+vectorised query: the containing element (the smallest box, if several
+contain the point) or else the nearest one. Indexes are saved as ``.npz``
+files named after the SHA-256 of the IFC file, so a model is only
+triangulated again when its content changes.
+
+    python spatial_index.py model.ifc inference_data.json -o inference_assigned.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# --- Spatial index settings ---
+SPATIAL_INDEX_DIR = os.getenv('spatial_index_dir', 'spatial_index')
+# Indexes kept in memory by the API, keyed by model path and mtime.
+SPATIAL_INDEX_CACHE_SIZE = int(os.getenv('spatial_index_cache_size', 8))
+# Detections farther than this from every element (model units, metres by
+# default) are left unassigned.
+MAX_ASSIGN_DISTANCE = float(os.getenv('spatial_max_distance', 0.5))
+LEAF_SIZE = 8
+# Element types whose boxes never host a damage
+EXCLUDED_TYPES = ("IfcOpeningElement", "IfcVirtualElement")
+INDEX_VERSION = 1
+
+
+def file_hash(path, block_size=2**20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_element_boxes(model_path, workers=None):
+    """``(guids, types, bounds)`` for every element with geometry; ``bounds`` is (n, 6) min/max xyz."""
+    import ifcopenshell
+    import ifcopenshell.geom
+
+    model = ifcopenshell.open(model_path)
+    elements = [e for e in model.by_type("IfcElement") if not any(e.is_a(t) for t in EXCLUDED_TYPES)]
+    settings = ifcopenshell.geom.settings()
+    settings.set("use-world-coords", True)
+
+    guids, types, bounds = [], [], []
+    if elements:
+        iterator = ifcopenshell.geom.iterator(settings, model, workers or os.cpu_count() or 1, include=elements)
+        if iterator.initialize():
+            while True:
+                shape = iterator.get()
+                verts = np.asarray(shape.geometry.verts, dtype=np.float64).reshape(-1, 3)
+                if len(verts):
+                    guids.append(shape.guid)
+                    types.append(shape.type)
+                    bounds.append(np.concatenate([verts.min(axis=0), verts.max(axis=0)]))
+                if not iterator.next():
+                    break
+    return guids, types, np.array(bounds, dtype=np.float64).reshape(-1, 6)
+
+
+def _box_distance_sq(points, lo, hi):
+    gap = np.maximum(np.maximum(lo - points, points - hi), 0.0)
+    return np.einsum("...i,...i->...", gap, gap)
+
+
+class SpatialIndex:
+    """Bounding volume hierarchy over element boxes, stored as flat arrays.
+
+    Node ``k`` covers ``node_lo[k]``..``node_hi[k]``; inner nodes have two
+    children, leaves list up to LEAF_SIZE box indices in ``leaf_boxes[k]``
+    (padded with -1).
+    """
+
+    def __init__(self, guids, types, bounds, leaf_size=LEAF_SIZE, nodes=None):
+        self.guids = np.asarray(guids, dtype=str)
+        self.types = np.asarray(types, dtype=str)
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 6)
+        self.volumes = np.prod(self.bounds[:, 3:] - self.bounds[:, :3], axis=1)
+        if nodes is None:
+            nodes = self._build(leaf_size)
+        self.node_lo, self.node_hi, self.children, self.leaf_boxes = nodes
+
+    def __len__(self):
+        return len(self.guids)
+
+    def _build(self, leaf_size):
+        n = len(self.bounds)
+        centers = (self.bounds[:, :3] + self.bounds[:, 3:]) / 2
+        lo, hi, children, leaves = [], [], [], []
+        stack = [(np.arange(n), -1, 0)]
+        while stack:
+            boxes, parent, side = stack.pop()
+            node = len(lo)
+            if parent >= 0:
+                children[parent][side] = node
+            if len(boxes):
+                lo.append(self.bounds[boxes, :3].min(axis=0))
+                hi.append(self.bounds[boxes, 3:].max(axis=0))
+            else:
+                lo.append(np.full(3, np.inf))
+                hi.append(np.full(3, -np.inf))
+            children.append([-1, -1])
+
+            if len(boxes) <= leaf_size:
+                leaves.append(np.pad(boxes, (0, leaf_size - len(boxes)), constant_values=-1))
+                continue
+            leaves.append(np.full(leaf_size, -1))
+            # Median split on the longest axis of the box centres
+            spread = centers[boxes].max(axis=0) - centers[boxes].min(axis=0)
+            order = boxes[np.argsort(centers[boxes, np.argmax(spread)], kind="stable")]
+            half = len(order) // 2
+            stack.append((order[half:], node, 1))
+            stack.append((order[:half], node, 0))
+
+        return (np.array(lo).reshape(-1, 3), np.array(hi).reshape(-1, 3),
+                np.array(children, dtype=np.int64).reshape(-1, 2),
+                np.array(leaves, dtype=np.int64).reshape(-1, leaf_size))
+
+    # --- Queries ---
+    def _leaf_candidates(self, point_ids, nodes, points):
+        boxes = self.leaf_boxes[nodes]
+        valid = boxes >= 0
+        rows = np.repeat(point_ids, boxes.shape[1]).reshape(boxes.shape)[valid]
+        boxes = boxes[valid]
+        distance = _box_distance_sq(points[rows], self.bounds[boxes, :3], self.bounds[boxes, 3:])
+        return rows, boxes, distance
+
+    def query(self, points):
+        """Containing-or-nearest box for every row of ``points`` (m, 3).
+
+        Returns ``(indices, distances)``; distance 0 means the point lies in
+        (or on) the box. Among boxes at the same distance the smallest wins.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        m = len(points)
+        if m == 0 or len(self) == 0:
+            return np.full(m, -1), np.full(m, np.inf)
+
+        # 1. Greedy descent towards the closer child gives an upper bound per point
+        ids = np.arange(m)
+        node = np.zeros(m, dtype=np.int64)
+        inner = self.children[node, 0] >= 0
+        while inner.any():
+            left, right = self.children[node[inner]].T
+            p = points[inner]
+            go_right = (_box_distance_sq(p, self.node_lo[right], self.node_hi[right])
+                        < _box_distance_sq(p, self.node_lo[left], self.node_hi[left]))
+            node[inner] = np.where(go_right, right, left)
+            inner = self.children[node, 0] >= 0
+        rows, boxes, distance = self._leaf_candidates(ids, node, points)
+        bound = np.full(m, np.inf)
+        np.minimum.at(bound, rows, distance)
+
+        # 2. Level-by-level traversal of every (point, node) pair that can beat the bound
+        found = []
+        pair_points, pair_nodes = ids, np.zeros(m, dtype=np.int64)
+        while len(pair_points):
+            near = _box_distance_sq(points[pair_points], self.node_lo[pair_nodes],
+                                    self.node_hi[pair_nodes]) <= bound[pair_points]
+            pair_points, pair_nodes = pair_points[near], pair_nodes[near]
+            leaf = self.children[pair_nodes, 0] < 0
+            rows, boxes, distance = self._leaf_candidates(pair_points[leaf], pair_nodes[leaf], points)
+            keep = distance <= bound[rows]
+            found.append((rows[keep], boxes[keep], distance[keep]))
+            pair_points = np.repeat(pair_points[~leaf], 2)
+            pair_nodes = self.children[pair_nodes[~leaf]].reshape(-1)
+
+        # 3. Per point: nearest first, then the smallest box
+        rows, boxes, distance = (np.concatenate(parts) for parts in zip(*found))
+        order = np.lexsort((self.volumes[boxes], distance, rows))
+        rows, boxes, distance = rows[order], boxes[order], distance[order]
+        first = np.ones(len(rows), dtype=bool)
+        first[1:] = rows[1:] != rows[:-1]
+
+        indices = np.full(m, -1)
+        distances = np.full(m, np.inf)
+        indices[rows[first]] = boxes[first]
+        distances[rows[first]] = np.sqrt(distance[first])
+        return indices, distances
+
+    def assign(self, points, max_distance=MAX_ASSIGN_DISTANCE):
+        """``[{"ifc_guid", "ifc_element", "distance"} | None, ...]`` for ``points``."""
+        indices, distances = self.query(points)
+        return [
+            None if i < 0 or d > max_distance else
+            {"ifc_guid": str(self.guids[i]), "ifc_element": str(self.types[i]), "distance": float(d)}
+            for i, d in zip(indices, distances)
+        ]
+
+    # --- Persistence ---
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, version=INDEX_VERSION, guids=self.guids, types=self.types, bounds=self.bounds,
+                 node_lo=self.node_lo, node_hi=self.node_hi, children=self.children, leaf_boxes=self.leaf_boxes)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != INDEX_VERSION:
+                raise ValueError(f"Spatial index {path} has an outdated layout")
+            nodes = (data["node_lo"], data["node_hi"], data["children"], data["leaf_boxes"])
+            return cls(data["guids"], data["types"], data["bounds"], nodes=nodes)
+
+
+def load_spatial_index(model_path, index_dir=SPATIAL_INDEX_DIR, workers=None):
+    """Index for ``model_path``, read from ``index_dir`` or built and saved there."""
+    path = os.path.join(index_dir, f"{file_hash(model_path)}.npz")
+    if os.path.exists(path):
+        try:
+            return SpatialIndex.load(path)
+        except (ValueError, KeyError, OSError):
+            pass  # rebuilt below
+    index = SpatialIndex(*load_element_boxes(model_path, workers))
+    os.makedirs(index_dir, exist_ok=True)
+    index.save(path)
+    return index
+
+
+class SpatialIndexCache:
+    """In-process LRU over ``load_spatial_index``; a changed mtime re-checks the disk cache."""
+
+    def __init__(self, maxsize=SPATIAL_INDEX_CACHE_SIZE, index_dir=SPATIAL_INDEX_DIR):
+        self.maxsize = maxsize
+        self.index_dir = index_dir
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_path):
+        """Raises FileNotFoundError for a missing model."""
+        path = os.path.realpath(model_path)
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            if key in self._indexes:
+                self._indexes.move_to_end(key)
+                return self._indexes[key]
+
+        index = load_spatial_index(path, self.index_dir)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.maxsize:
+                self._indexes.popitem(last=False)
+        return index
+
+
+# --- Assignment of the two payload formats ---
+def _centroid(points):
+    xyz = [(p.get("x"), p.get("y"), p.get("z")) for p in points or () if isinstance(p, dict)]
+    xyz = [p for p in xyz if None not in p]
+    return np.mean(np.array(xyz, dtype=np.float64), axis=0) if xyz else None
+
+
+def _assign_points(index, targets, points, max_distance):
+    assigned = 0
+    if targets:
+        for target, match in zip(targets, index.assign(np.array(points), max_distance)):
+            if match is not None:
+                target(match)
+                assigned += 1
+    return {"assigned": assigned, "unassigned": len(targets) - assigned}
+
+
+def assign_detections(detections, index, overwrite=False, max_distance=MAX_ASSIGN_DISTANCE):
+    """Fill ``ifc_guid``/``ifc_element`` of inference detections from the centroid of ``damage_location_3D``.
+
+    Detections that already name an element are kept unless ``overwrite``.
+    Returns assigned/unassigned counts.
+    """
+    targets, points = [], []
+    for det in detections:
+        if det.get("ifc_guid") and not overwrite:
+            continue
+        point = _centroid(det.get("damage_location_3D"))
+        if point is not None:
+            targets.append(lambda match, det=det: det.update(
+                ifc_guid=match["ifc_guid"], ifc_element=match["ifc_element"]))
+            points.append(point)
+    return _assign_points(index, targets, points, max_distance)
+
+
+def _damage_point(damage_obj):
+    # The latest epoch's max-width position, else the centre of its crack polyline
+    # Runs before validation: malformed epochs are skipped here and rejected by ingestion
+    epochs = damage_obj.get("Epochs")
+    epochs = [ep for ep in epochs if isinstance(ep, dict)] if isinstance(epochs, list) else []
+    if not epochs:
+        return None
+    latest = max(epochs, key=lambda ep: ep.get("Epoch") or 0)
+    point = _centroid([latest.get("Max_Width_3D_Position")])
+    if point is None:
+        axis = latest.get("Position_3D_Axis") or {}
+        point = _centroid([{"x": x, "y": y, "z": z}
+                           for x, y, z in zip(axis.get("x") or (), axis.get("y") or (), axis.get("z") or ())])
+    return point
+
+
+def assign_damage_entries(entries, index_for, overwrite=False, max_distance=MAX_ASSIGN_DISTANCE):
+    """Fill Metadata IFC_GUID/IFC_Element of ``{ "Damage_001": { Metadata, Epochs } }`` values.
+
+    ``index_for(metadata)`` returns the SpatialIndex of the damage's model, or
+    None if there is no usable model; entries are grouped per index so each
+    model is queried once. Returns assigned/unassigned counts, where
+    unassigned also covers damages without a usable model or position.
+    """
+    groups = {}
+    unassigned = 0
+    for damage_obj in entries:
+        metadata = damage_obj.get("Metadata") if isinstance(damage_obj, dict) else None
+        if not isinstance(metadata, dict) or (metadata.get("IFC_GUID") and not overwrite):
+            continue
+        index = index_for(metadata)
+        point = _damage_point(damage_obj)
+        if index is None or point is None:
+            unassigned += 1
+            continue
+        targets, points = groups.setdefault(id(index), (index, [], []))[1:]
+        targets.append(lambda match, metadata=metadata: metadata.update(
+            IFC_GUID=match["ifc_guid"], IFC_Element=match["ifc_element"]))
+        points.append(point)
+
+    counts = {"assigned": 0, "unassigned": unassigned}
+    for index, targets, points in groups.values():
+        for key, value in _assign_points(index, targets, points, max_distance).items():
+            counts[key] += value
+    return counts
+
+
+class ElementAssigner:
+    """``prepare`` hook for ingestion: assigns upload entries in a worker thread.
+
+    Each damage is matched against the model named by its Metadata
+    IFC_Filepath, or against ``ifc_filepath`` (which is then also recorded as
+    the damage's IFC_Filepath). Model paths are client input: one that leaves
+    the IFC models directory or does not exist is never opened, and its
+    damages count as unassigned. Running totals are kept in ``counts``.
+    """
+
+    def __init__(self, cache, ifc_filepath=None, overwrite=False, max_distance=MAX_ASSIGN_DISTANCE):
+        self.cache = cache
+        self.ifc_filepath = ifc_filepath
+        self.overwrite = overwrite
+        self.max_distance = max_distance
+        self.counts = {"assigned": 0, "unassigned": 0}
+
+    def _index_for(self, metadata):
+        from ifc_export import resolve_model_path
+
+        ifc_filepath = metadata.get("IFC_Filepath")
+        if not isinstance(ifc_filepath, str) or not ifc_filepath:
+            return None
+        try:
+            return self.cache.get(resolve_model_path(ifc_filepath))
+        except (ValueError, FileNotFoundError):
+            return None
+
+    def _assign(self, entries):
+        if self.ifc_filepath:
+            for damage_obj in entries:
+                metadata = damage_obj.get("Metadata") if isinstance(damage_obj, dict) else None
+                if isinstance(metadata, dict) and not metadata.get("IFC_Filepath"):
+                    metadata["IFC_Filepath"] = self.ifc_filepath
+        return assign_damage_entries(entries, self._index_for, self.overwrite, self.max_distance)
+
+    async def __call__(self, entries):
+        counts = await asyncio.to_thread(self._assign, list(entries))
+        for key, value in counts.items():
+            self.counts[key] += value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("ifc_model")
+    parser.add_argument("json_file", help="inference file with inference_results[].detections")
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--overwrite", action="store_true", help="reassign detections that already name an element")
+    parser.add_argument("--max-distance", type=float, default=MAX_ASSIGN_DISTANCE)
+    args = parser.parse_args()
+
+    with open(args.json_file) as f:
+        data = json.load(f)
+    index = load_spatial_index(args.ifc_model)
+    detections = [det for result in data["inference_results"] for det in result["detections"]]
+    counts = assign_detections(detections, index, args.overwrite, args.max_distance)
+    with open(args.output, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"{counts['assigned']} detections assigned, {counts['unassigned']} left unassigned "
+          f"({len(index)} elements indexed)")
@@ -0,0 +1,193 @@
+"""Per-element damage summaries for overview dashboards.
+
+One ``ElementSummary`` node per IFC_GUID holds what the building overview
+needs, so reading it costs one node per element instead of a walk over
+every damage and its epochs:
+
+  DamageCount                      damages on the element
+  DamageTypes, DamageTypeCounts    counts by DamageType (parallel lists, sorted by type)
+  Latest_Epoch, Latest_Width_mm,   the newest epoch among the element's damages
+  Latest_Length_m
+  Max_Width_mm, Max_Length_m       the largest value among each damage's latest epoch
+
+Every ingestion write (ingestion.write_ingestion_params) refreshes the
+summaries of the elements its damages are on, or were on before the upload
+moved them, in the same transaction. A refresh recomputes only those
+elements, from their own damages, so it is idempotent under re-uploads and
+corrections. Writers that bypass ingestion leave summaries behind:
+rdf_loader.py rebuilds them when it is done, and after a bulk_import.py
+import they are rebuilt with
+
+    python summaries.py
+"""
+import argparse
+import os
+import time
+
+# --- Summary settings ---
+# Elements per write transaction when rebuilding
+SUMMARY_REBUILD_BATCH_SIZE = int(os.getenv('summary_rebuild_batch_size', 1000))
+# DamageType recorded for damages without one
+UNKNOWN_DAMAGE_TYPE = "unknown"
+
+
+# --- Cypher ---
+# Elements that damages in the upload are about to leave; read before the
+# damages stage overwrites IFC_GUID.
+PREVIOUS_GUIDS_QUERY = """
+UNWIND $rows AS row
+MATCH (d:Damage {Damage_ID: row.Damage_ID})
+WHERE d.IFC_GUID IS NOT NULL AND d.IFC_GUID <> coalesce(row.IFC_GUID, '')
+RETURN DISTINCT d.IFC_GUID AS guid
+"""
+
+# Recompute the summary of each element from its damages' latest epochs
+# (ignoring epochs without an Epoch number, which DESC would sort first); an
+# element left without damages loses its summary.
+# The summary node is MERGEd and written first, which takes its write lock
+# before any damage is read: a concurrent upload touching the same element
+# waits until this transaction commits, and then aggregates a snapshot that
+# includes these damages. Aggregating first would let the later commit
+# overwrite the summary with counts that miss the other upload's damages.
+# Callers pass GUIDs in sorted order, so locks are always taken in the same
+# order.
+REFRESH_SUMMARIES_QUERY = f"""
+UNWIND $guids AS guid
+MERGE (s:ElementSummary {{IFC_GUID: guid}})
+SET s._lock = true
+WITH s, guid
+CALL {{
+  WITH guid
+  OPTIONAL MATCH (d:Damage {{IFC_GUID: guid}})
+  CALL {{
+    WITH d
+    OPTIONAL MATCH (d)-[:HAS_EPOCH]->(e:Epoch)
+    WHERE e.Epoch IS NOT NULL
+    RETURN e AS latest
+    ORDER BY e.Epoch DESC
+    LIMIT 1
+  }}
+  WITH coalesce(d.DamageType, '{UNKNOWN_DAMAGE_TYPE}') AS damage_type, count(d) AS damages,
+       max(latest.Width_mm) AS max_width, max(latest.Length_m) AS max_length, collect(latest) AS latest_epochs
+  ORDER BY damage_type
+  WITH collect(damage_type) AS types, collect(damages) AS counts, sum(damages) AS total,
+       max(max_width) AS max_width, max(max_length) AS max_length, collect(latest_epochs) AS latest_by_type
+  RETURN types, counts, total, max_width, max_length,
+         reduce(newest = null, e IN reduce(flat = [], epochs IN latest_by_type | flat + epochs) |
+                CASE WHEN newest IS NULL OR e.Epoch > newest.Epoch THEN e ELSE newest END) AS newest
+}}
+SET s.DamageCount = total,
+    s.DamageTypes = types,
+    s.DamageTypeCounts = counts,
+    s.Latest_Epoch = newest.Epoch,
+    s.Latest_Width_mm = newest.Width_mm,
+    s.Latest_Length_m = newest.Length_m,
+    s.Max_Width_mm = max_width,
+    s.Max_Length_m = max_length
+REMOVE s._lock
+WITH s, total
+WHERE total = 0
+DELETE s
+"""
+
+# Keyset page over the elements that carry damages (served by the damage_ifc_guid index)
+DAMAGED_ELEMENTS_QUERY = """
+MATCH (d:Damage)
+WHERE d.IFC_GUID > $after
+RETURN DISTINCT d.IFC_GUID AS guid
+ORDER BY guid
+LIMIT $limit
+"""
+
+ORPHAN_SUMMARIES_QUERY = """
+MATCH (s:ElementSummary)
+WHERE NOT EXISTS { MATCH (:Damage {IFC_GUID: s.IFC_GUID}) }
+DELETE s
+RETURN count(*) AS removed
+"""
+
+
+def touched_guids(params):
+    """IFC_GUIDs the damages of ``params`` (see ingestion.build_ingestion_params) are on."""
+    return {row["IFC_GUID"] for row in params["damages"] if row.get("IFC_GUID")}
+
+
+def _guid_rows(rows):
+    return [{"Damage_ID": row["Damage_ID"], "IFC_GUID": row.get("IFC_GUID")} for row in rows]
+
+
+def _chunks(items, chunk_size):
+    # Sets of GUIDs are sorted: summaries are locked in a consistent order
+    items = sorted(items) if isinstance(items, (set, frozenset)) else items
+    for start in range(0, len(items), chunk_size):
+        yield items[start:start + chunk_size]
+
+
+# --- Transaction functions ---
+def previous_guids(tx, rows, chunk_size):
+    """Elements the damage ``rows`` are on now and will not be after they are written."""
+    guids = set()
+    for chunk in _chunks(_guid_rows(rows), chunk_size):
+        guids.update(record["guid"] for record in tx.run(PREVIOUS_GUIDS_QUERY, rows=chunk))
+    return guids
+
+
+async def previous_guids_async(tx, rows, chunk_size):
+    guids = set()
+    for chunk in _chunks(_guid_rows(rows), chunk_size):
+        result = await tx.run(PREVIOUS_GUIDS_QUERY, rows=chunk)
+        guids.update([record["guid"] async for record in result])
+    return guids
+
+
+def refresh_summaries(tx, guids, chunk_size):
+    for chunk in _chunks(guids, chunk_size):
+        tx.run(REFRESH_SUMMARIES_QUERY, guids=chunk).consume()
+
+
+async def refresh_summaries_async(tx, guids, chunk_size):
+    for chunk in _chunks(guids, chunk_size):
+        result = await tx.run(REFRESH_SUMMARIES_QUERY, guids=chunk)
+        await result.consume()
+
+
+# --- Rebuild ---
+def _damaged_elements(tx, after, limit):
+    return [record["guid"] for record in tx.run(DAMAGED_ELEMENTS_QUERY, after=after, limit=limit)]
+
+
+def rebuild_summaries(db, batch_size=SUMMARY_REBUILD_BATCH_SIZE):
+    """Recompute every summary on a ``Neo4jConnection``, one write transaction per ``batch_size`` elements.
+
+    Summaries are overwritten in place, so readers never see them missing
+    while this runs.
+    """
+    start = time.perf_counter()
+    elements, after = 0, ""
+    while True:
+        guids = db.execute_read(_damaged_elements, after, batch_size)
+        if not guids:
+            break
+        db.execute_write(refresh_summaries, guids, batch_size)
+        elements += len(guids)
+        after = guids[-1]
+    removed = db.query(ORPHAN_SUMMARIES_QUERY)[0]["removed"]
+    return {"elements": elements, "removed": removed, "elapsed_s": round(time.perf_counter() - start, 2)}
+
+
+if __name__ == "__main__":
+    from database import Neo4jConnection, driver_config, uri, user, pwd
+    from schema import bootstrap_schema
+
+    parser = argparse.ArgumentParser(description="Rebuild every per-element damage summary.")
+    parser.add_argument("--batch-size", type=int, default=SUMMARY_REBUILD_BATCH_SIZE, help="elements per transaction")
+    args = parser.parse_args()
+
+    db = Neo4jConnection(uri, user, pwd, **driver_config())
+    try:
+        bootstrap_schema(db)
+        report = rebuild_summaries(db, args.batch_size)
+    finally:
+        db.close()
+    print(f"{report['elements']} element summaries rebuilt, {report['removed']} orphans removed "
+          f"in {report['elapsed_s']}s")
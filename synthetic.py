@@ -0,0 +1,200 @@
+"""Seeded synthetic workloads at production scale.
+
+Every generator takes a ``seed`` and produces the same output for the same
+arguments, so benchmark runs on different commits see identical input:
+
+  damage upload   {"Damage_00001": {Metadata, Epochs}, ...} for /upload_damage_json
+  inference file  {"inference_results": [...]} for generate_RDF
+  damage TTL      cdo: damage triples in the form RDF_to_IFC_link reads
+  IFC model       N IfcWall elements, optionally with geometry on a grid
+
+    python synthetic.py out/ --elements 10000 --damages 50000 --epochs 5 --detections 100000
+"""
+import argparse
+import json
+import os
+import random
+import uuid
+
+import numpy as np
+import ifcopenshell
+import ifcopenshell.api
+import ifcopenshell.guid
+
+DAMAGE_TYPES = ("crack", "spalling", "corrosion", "efflorescence")
+ELEMENTS = ("IfcWall", "IfcBeam", "IfcColumn", "IfcSlab")
+SEVERITIES = ("low", "medium", "high", "critical")
+IFC_FILEPATH = "synthetic/model.ifc"
+
+
+def new_guid(rng):
+    return ifcopenshell.guid.compress(uuid.UUID(int=rng.getrandbits(128)).hex)
+
+
+# --- IFC models ---
+def write_ifc_model(path, elements, seed=0, geometry=False, spacing=5.0):
+    """Write ``elements`` walls and return their GlobalIds.
+
+    Without ``geometry`` the walls are bare entities (fast to write, enough
+    for GUID lookups); with it each wall gets a 4 x 0.2 x 3 m body on a grid
+    ``spacing`` apart, as the spatial index needs.
+    """
+    rng = random.Random(seed)
+    if not geometry:
+        model = ifcopenshell.file(schema="IFC4")
+        guids = []
+        for i in range(elements):
+            guid = new_guid(rng)
+            model.create_entity("IfcWall", GlobalId=guid, Name=f"Wall {i}")
+            guids.append(guid)
+        model.write(path)
+        return guids
+
+    model = ifcopenshell.file(schema="IFC4")
+    ifcopenshell.api.run("root.create_entity", model, ifc_class="IfcProject")
+    ifcopenshell.api.run("unit.assign_unit", model)
+    context = ifcopenshell.api.run("context.add_context", model, context_type="Model")
+    body = ifcopenshell.api.run("context.add_context", model, context_type="Model", context_identifier="Body",
+                                target_view="MODEL_VIEW", parent=context)
+    side = int(np.ceil(np.sqrt(elements)))
+    guids = []
+    for i in range(elements):
+        wall = ifcopenshell.api.run("root.create_entity", model, ifc_class="IfcWall")
+        wall.GlobalId = new_guid(rng)
+        matrix = np.eye(4)
+        matrix[:3, 3] = [(i % side) * spacing, (i // side) * spacing, 0.0]
+        ifcopenshell.api.run("geometry.edit_object_placement", model, product=wall, matrix=matrix)
+        representation = ifcopenshell.api.run("geometry.add_wall_representation", model, context=body,
+                                              length=4, height=3, thickness=0.2)
+        ifcopenshell.api.run("geometry.assign_representation", model, product=wall, representation=representation)
+        guids.append(wall.GlobalId)
+    model.write(path)
+    return guids
+
+
+# --- Damage uploads (Metadata + Epochs) ---
+def damage_upload(damages, epochs, seed=0, guids=None, id_prefix="synthetic", relation_rate=0.0,
+                  ifc_filepath=IFC_FILEPATH):
+    """An upload document with ``damages`` entries of ``epochs`` epochs each.
+
+    Damages are spread over ``guids`` (or 1000 made-up GUIDs); with
+    ``relation_rate`` > 0 that share of damages gets a ``causes`` relation to
+    an earlier entry of the same upload.
+    """
+    rng = random.Random(seed)
+    guids = guids or [new_guid(rng) for _ in range(1000)]
+    payload = {}
+    for i in range(damages):
+        x, y, z = rng.uniform(0, 50), rng.uniform(0, 50), rng.uniform(0, 3)
+        length, width = rng.uniform(0.1, 2.0), rng.uniform(0.05, 2.0)
+        damage_epochs = []
+        for e in range(1, epochs + 1):
+            # Damages grow monotonically from epoch to epoch
+            length *= rng.uniform(1.0, 1.1)
+            width *= rng.uniform(1.0, 1.1)
+            damage_epochs.append({
+                "Epoch": e,
+                "Storage_Path": f"/data/damages/{id_prefix}_{i:06d}/epoch_{e:02d}/",
+                "ReferenceCoOrdinateSystem": "Site-Local-XYZ",
+                "Length_m": round(length, 3),
+                "Width_mm": round(width, 3),
+                "Position_3D_Axis": {"x": [round(x + k * 0.05, 3) for k in range(3)],
+                                     "y": [round(y + k * 0.05, 3) for k in range(3)],
+                                     "z": [round(z, 3)] * 3},
+                "Max_Width_3D_Position": {"x": round(x + 0.05, 3), "y": round(y + 0.05, 3), "z": round(z, 3)},
+            })
+        entry = {
+            "Metadata": {
+                "DamageType": rng.choice(DAMAGE_TYPES),
+                "Damage_ID": f"{id_prefix}_{i:06d}",
+                "Image_Filename": f"{id_prefix}_{i:06d}_img.png",
+                "IFC_Filepath": ifc_filepath,
+                "IFC_Element": "IfcWall",
+                "IFC_GUID": rng.choice(guids),
+            },
+            "Epochs": damage_epochs,
+        }
+        if i and rng.random() < relation_rate:
+            entry["damage_relations"] = [{"relation_type": "causes", "related_to_indices": [rng.randrange(i)]}]
+        payload[f"Damage_{i:06d}"] = entry
+    return payload
+
+
+def write_damage_upload(path, damages, epochs, seed=0, guids=None, **kwargs):
+    with open(path, "w") as f:
+        json.dump(damage_upload(damages, epochs, seed, guids, **kwargs), f)
+
+
+# --- Inference results (generate_RDF input) ---
+def write_inference_file(path, detections, seed=0, per_image=20, guids=None):
+    rng = random.Random(seed)
+    results = []
+    for image in range(0, detections, per_image):
+        dets = []
+        for _ in range(min(per_image, detections - image)):
+            x, y, z = rng.uniform(0, 50), rng.uniform(0, 50), rng.uniform(0, 10)
+            dets.append({
+                "damage_class": rng.choice(DAMAGE_TYPES),
+                "damage_parameters": {
+                    "length_mm": round(rng.uniform(10, 900), 1),
+                    "width_mm": round(rng.uniform(0.1, 5), 2),
+                    "severity_level": rng.choice(SEVERITIES),
+                },
+                "damage_location_3D": [{"x": x + i * 0.1, "y": y + i * 0.1, "z": z} for i in range(3)],
+                "ifc_element": rng.choice(ELEMENTS),
+                "ifc_guid": rng.choice(guids) if guids else f"guid_{rng.randrange(10000):05d}",
+                "damage_relations": [],
+            })
+        results.append({"image_filename": f"img_{image:07d}.jpg", "detections": dets})
+    with open(path, "w") as f:
+        json.dump({"inference_results": results}, f)
+
+
+# --- Damage triples (RDF_to_IFC_link input) ---
+def write_damage_ttl(path, guids, damages, seed=0, hosts=None):
+    """Turtle with one element per GUID and ``damages`` damages on the first ``hosts`` of them."""
+    rng = random.Random(seed)
+    hosts = min(hosts or len(guids), len(guids))
+    with open(path, "w") as f:
+        f.write("@prefix cdo: <https://w3id.org/damagemodels/cdo#> .\n")
+        f.write("@prefix ex: <http://example.org/damageInstances#> .\n\n")
+        for i, guid in enumerate(guids):
+            f.write(f'ex:element_{i} cdo:ifcGlobalId "{guid}" .\n')
+        for i in range(damages):
+            element = rng.randrange(hosts)
+            f.write(
+                f'ex:damage_{i} cdo:Crack cdo:CrackType ; cdo:Spalling cdo:SpallingType ;\n'
+                f'    cdo:hasName "Damage {i}" ; cdo:hasWidth {rng.uniform(0.1, 5):.3f} ;\n'
+                f'    cdo:hasDepth {rng.uniform(1, 50):.2f} ; cdo:hasSeverity "medium" ;\n'
+                f'    cdo:damageLocatedOn ex:element_{element} .\n'
+            )
+
+
+def write_workload(directory, elements, damages, epochs, detections, link_damages, seed=0, geometry=False):
+    """All four inputs in ``directory``, sharing one set of element GUIDs; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = {name: os.path.join(directory, filename) for name, filename in (
+        ("ifc", "model.ifc"), ("upload", "damages.json"), ("inference", "inference.json"), ("ttl", "damages.ttl"))}
+    guids = write_ifc_model(paths["ifc"], elements, seed, geometry)
+    write_damage_upload(paths["upload"], damages, epochs, seed, guids)
+    write_inference_file(paths["inference"], detections, seed, guids=guids)
+    write_damage_ttl(paths["ttl"], guids, link_damages, seed)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--elements", type=int, default=1000)
+    parser.add_argument("--damages", type=int, default=10_000, help="damages in the upload file")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--detections", type=int, default=10_000)
+    parser.add_argument("--link-damages", type=int, default=10_000, help="damages in the TTL file")
+    parser.add_argument("--geometry", action="store_true", help="give the walls geometry (slow for large models)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_workload(args.directory, args.elements, args.damages, args.epochs, args.detections,
+                           args.link_damages, args.seed, args.geometry)
+    for name, path in paths.items():
+        print(f"{name:>9}: {path} ({os.path.getsize(path) / 2**20:.1f} MB)")
@@ -0,0 +1,142 @@
+"""Shared fixtures: a recording stand-in for the async Neo4j connection and an in-memory exporter.
+
+The modules live at the repository root, so it is put on ``sys.path`` here.
+"""
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from instrumentation import InMemoryExporter, add_exporter, remove_exporter  # noqa: E402
+
+
+# --- Stand-in database ---
+class Record(dict):
+    def data(self):
+        return dict(self)
+
+
+class StandInResult:
+    def __init__(self, records=(), relationships_created=0):
+        self._records = iter([Record(record) for record in records])
+        self.counters = types.SimpleNamespace(relationships_created=relationships_created)
+
+    async def consume(self):
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._records)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class StandInTx:
+    def __init__(self, db):
+        self.db = db
+
+    async def run(self, query, parameters=None, **kwargs):
+        params = {**(parameters or {}), **kwargs}
+        await self.db.before_run(query, params)
+        self.db.statements.append((query, params))
+        records, created = self.db.respond(query, params)
+        return StandInResult(records, created)
+
+
+class StandInDB:
+    """Records every statement as ``(query, params)``; reads return what ``respond`` gives.
+
+    ``respond(query, params)`` returns ``(records, relationships_created)``. By
+    default nothing is found and every relation row creates a relationship.
+    ``before_run`` can be replaced to block or fail a statement.
+    """
+
+    def __init__(self, respond=None):
+        self.statements = []
+        self.respond = respond or self.default_respond
+        self.writes = 0
+
+    @staticmethod
+    def default_respond(query, params):
+        created = len(params.get("rows", ())) if "MERGE (a)-[:" in query else 0
+        return [], created
+
+    async def before_run(self, query, params):
+        return None
+
+    async def execute_write(self, work, *args, **kwargs):
+        self.writes += 1
+        return await work(StandInTx(self), *args, **kwargs)
+
+    async def execute_read(self, work, *args, **kwargs):
+        return await work(StandInTx(self), *args, **kwargs)
+
+    def rows_sent(self, marker):
+        """Every row sent by statements containing ``marker``."""
+        return [row for query, params in self.statements if marker in query for row in params.get("rows", ())]
+
+
+@pytest.fixture
+def db():
+    return StandInDB()
+
+
+@pytest.fixture
+def exporter():
+    exporter = add_exporter(InMemoryExporter())
+    yield exporter
+    remove_exporter(exporter)
+
+
+@pytest.fixture
+def client_app(db):
+    """``main.app`` wired to the stand-in database and a fresh cache (the lifespan handler does not run)."""
+    import main
+    from cache import TTLCache
+
+    main.app.dependency_overrides[main.get_db] = lambda: db
+    main.app.state.cache = TTLCache()
+    yield main.app
+    main.app.dependency_overrides.clear()
+
+
+# --- Real Neo4j (integration tests) ---
+# Locking and Cypher semantics need a server; point these at a disposable
+# database to run the tests that use ``neo4j_db`` (they delete what they write).
+NEO4J_TEST_URI = os.getenv('neo4j_test_uri')
+NEO4J_TEST_USER = os.getenv('neo4j_test_user', 'neo4j')
+NEO4J_TEST_PWD = os.getenv('neo4j_test_pwd')
+
+TEST_ID_PREFIX = "it_"
+
+CLEANUP_QUERY = f"""
+MATCH (n)
+WHERE n:Damage AND n.Damage_ID STARTS WITH '{TEST_ID_PREFIX}'
+   OR n:Epoch AND n.epoch_id STARTS WITH '{TEST_ID_PREFIX}'
+   OR n:ElementSummary AND n.IFC_GUID STARTS WITH '{TEST_ID_PREFIX}'
+DETACH DELETE n
+"""
+
+
+@pytest.fixture
+def neo4j_db():
+    """A ``Neo4jConnection`` with the schema bootstrapped; nodes with ids starting ``it_`` are removed around each test."""
+    if not NEO4J_TEST_URI:
+        pytest.skip("set neo4j_test_uri to run against Neo4j")
+    from database import Neo4jConnection
+    from schema import bootstrap_schema
+
+    db = Neo4jConnection(NEO4J_TEST_URI, NEO4J_TEST_USER, NEO4J_TEST_PWD)
+    try:
+        bootstrap_schema(db)
+        db.query(CLEANUP_QUERY)
+        yield db
+        db.query(CLEANUP_QUERY)
+    finally:
+        db.close()
@@ -0,0 +1,101 @@
+import csv
+import json
+import os
+
+from bulk_import import MANIFESTS, convert_directory
+from synthetic import damage_upload
+
+
+def write_upload(path, upload):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(upload, f)
+
+
+def read_rows(output_dir, name):
+    with open(os.path.join(output_dir, name), newline="") as f:
+        return list(csv.reader(f))
+
+
+def test_delta_import_emits_only_new_nodes(tmp_path):
+    input_dir, output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+    first = damage_upload(4, 2, id_prefix="first")
+    write_upload(os.path.join(input_dir, "a", "first.json"), first)
+
+    summary = convert_directory(input_dir, output_dir, workers=1)
+    assert summary["written"]["damages"] == 4
+    assert summary["written"]["epochs"] == 8
+    assert "import full" in summary["import_command"]
+
+    # Re-uploaded damages keep their ids; the new file adds damages related to old ones
+    second = damage_upload(3, 3, id_prefix="second")
+    second["Damage_000000"]["damage_relations"] = [{"relation_type": "causes", "related_to": ["first_000001"]}]
+    write_upload(os.path.join(input_dir, "b", "second.json"), second)
+    write_upload(os.path.join(input_dir, "b", "again.json"), first)
+
+    summary = convert_directory(input_dir, output_dir, workers=2, delta=True)
+    assert summary["written"]["damages"] == 3
+    assert summary["written"]["epochs"] == 9
+    assert summary["written"]["has_epoch"] == 9
+    assert summary["written"]["next_epoch"] == 6
+    assert summary["written"]["relations"] == 1
+    assert summary["duplicates_skipped"] == 2 * (4 + 8)
+    assert "import incremental --force" in summary["import_command"]
+
+    damages = read_rows(output_dir, "delta_damages.csv")
+    assert sorted(row[0] for row in damages) == ["second_000000", "second_000001", "second_000002"]
+    assert read_rows(output_dir, "delta_relations.csv") == [["second_000000", "first_000001", "CAUSES"]]
+    # The full import's files are left as they were
+    assert len(read_rows(output_dir, "damages.csv")) == 4
+
+    with open(os.path.join(output_dir, MANIFESTS["damages"])) as f:
+        assert len(f.read().split()) == 7
+
+    # Nothing is new on a second delta run
+    summary = convert_directory(input_dir, output_dir, workers=1, delta=True)
+    assert summary["written"]["damages"] == summary["written"]["epochs"] == 0
+    assert read_rows(output_dir, "delta_damages.csv") == []
+
+
+def test_unreadable_files_are_reported(tmp_path):
+    input_dir, output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+    write_upload(os.path.join(input_dir, "good.json"), damage_upload(1, 1))
+    write_upload(os.path.join(input_dir, "bad.json"), {"x": {"Metadata": {}}})
+
+    summary = convert_directory(input_dir, output_dir, workers=1)
+    assert [os.path.basename(failure["file"]) for failure in summary["failed_files"]] == ["bad.json"]
+    assert summary["written"]["damages"] == 1
+
+
+def test_the_last_file_wins_for_duplicate_ids(tmp_path):
+    input_dir = str(tmp_path / "in")
+    for name, damage_type, width in (("a.json", "crack", 0.1), ("b.json", "spalling", 0.7), ("c.json", None, None)):
+        upload = damage_upload(2, 1, id_prefix="shared") if damage_type else damage_upload(1, 1, id_prefix="other")
+        for damage_obj in upload.values():
+            if damage_type:
+                damage_obj["Metadata"]["DamageType"] = damage_type
+                damage_obj["Epochs"][0]["Width_mm"] = width
+        write_upload(os.path.join(input_dir, name), upload)
+
+    for run in range(3):
+        output_dir = str(tmp_path / f"out_{run}")
+        summary = convert_directory(input_dir, output_dir, workers=3)
+        assert summary["written"]["damages"] == 3
+        assert summary["duplicates_skipped"] == 2 + 2
+        damages = {row[0]: row for row in read_rows(output_dir, "damages.csv")}
+        assert [damages[f"shared_{i:06d}"][1] for i in range(2)] == ["spalling", "spalling"]
+        epochs = read_rows(output_dir, "epochs.csv")
+        assert sorted(row[5] for row in epochs if row[0].startswith("shared")) == ["0.7", "0.7"]
+        assert len(read_rows(output_dir, "has_epoch.csv")) == 3
+
+
+def test_unresolved_relations_are_counted(tmp_path):
+    input_dir, output_dir = str(tmp_path / "in"), str(tmp_path / "out")
+    upload = damage_upload(2, 1)
+    upload["Damage_000000"]["damage_relations"] = [{"relation_type": "causes", "related_to_indices": [1, 7]}]
+    upload["Damage_000001"]["damage_relations"] = [{"relation_type": "adjacent", "related_to_indices": [9]}]
+    write_upload(os.path.join(input_dir, "upload.json"), upload)
+
+    summary = convert_directory(input_dir, output_dir, workers=1)
+    assert summary["unresolved_relations"] == 2
+    assert read_rows(output_dir, "relations.csv") == [["synthetic_000000", "synthetic_000001", "CAUSES"]]
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import httpx
+
+from cache import TTLCache
+from ingestion import build_ingestion_params
+from queries import DAMAGES_TAG, SUMMARIES_TAG, cache_tags_for_params, damage_list_tags
+from synthetic import damage_upload
+
+
+def test_invalidate_drops_only_tagged_entries():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("a", 1, tags={("Damage", "a"), DAMAGES_TAG})
+    cache.set("b", 2, tags={("Damage", "b")})
+    cache.set("summary", 3, tags={SUMMARIES_TAG})
+
+    cache.invalidate({("Damage", "a"), ("Damage", "missing")})
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.get("summary") == 3
+    # Its other tags no longer refer to the dropped entry
+    cache.set("a", 4)
+    cache.invalidate({DAMAGES_TAG})
+    assert cache.get("a") == 4
+
+
+def test_entries_expire_and_are_evicted_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+    expired = TTLCache(maxsize=2, ttl=-1)
+    expired.set("a", 1, tags={("Damage", "a")})
+    assert expired.get("a") is None
+    assert expired.stats()["size"] == 0
+
+
+def test_written_params_name_every_response_they_change():
+    upload = damage_upload(2, 1, guids=["guid_1"])
+    params = build_ingestion_params(upload)
+    tags = cache_tags_for_params(params)
+
+    page = {"items": [{"Damage_ID": "synthetic_000000"}]}
+    assert damage_list_tags(None, None, page) <= tags
+    assert damage_list_tags("guid_1", None, page) <= tags
+    damage_type = params["damages"][0]["DamageType"]
+    assert ("DamageType", damage_type) in damage_list_tags(None, damage_type, page) & tags
+    assert SUMMARIES_TAG in tags
+    assert damage_list_tags("guid_2", None, {"items": []}).isdisjoint(tags)
+
+
+def test_upload_invalidates_the_cached_damage(client_app, db):
+    def respond(query, params):
+        if "damage_id" in params:
+            return [{"Damage_ID": params["damage_id"], "DamageType": "crack", "Epochs": []}], 0
+        return db.default_respond(query, params)
+
+    db.respond = respond
+    body = json.dumps(damage_upload(1, 1)).encode()
+
+    async def run():
+        transport = httpx.ASGITransport(app=client_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            reads = []
+            for _ in range(2):
+                await client.get("/damages/synthetic_000000")
+                reads.append(len(db.statements))
+            response = await client.post("/upload_damage_json",
+                                         files={"file": ("upload.json", body, "application/json")})
+            assert response.status_code == 200
+            written = len(db.statements)
+            await client.get("/damages/synthetic_000000")
+            reads.append(len(db.statements) - written)
+            return reads
+
+    # The second read is served from the cache; the upload drops it
+    assert asyncio.run(run()) == [1, 1, 1]
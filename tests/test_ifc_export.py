@@ -0,0 +1,175 @@
+import asyncio
+import os
+
+import httpx
+import ifcopenshell
+import pytest
+
+import ifc_export
+from conftest import TEST_ID_PREFIX
+from ifc_export import EXPORT_BATCH_QUERY, IfcModelCache, export_damages, fetch_export_batch, resolve_model_path
+from ingestion import ingest_damage_data
+from synthetic import write_ifc_model
+
+
+@pytest.fixture
+def model(tmp_path):
+    path = str(tmp_path / "model.ifc")
+    return path, write_ifc_model(path, 3)
+
+
+def rows_for(guids, count):
+    return [{"damage_id": f"d{i:03d}", "damage_type": "crack", "ifc_guid": guids[i % len(guids)], "epoch": 1,
+             "width_mm": 0.5, "length_m": 1.25, "max_width_position": [1.0, 2.0, 0.5]} for i in range(count)]
+
+
+def fetcher(rows):
+    def fetch_batch(after, limit):
+        remaining = [row for row in rows if after is None or row["damage_id"] > after]
+        return remaining[:limit]
+    return fetch_batch
+
+
+def entity_ids(entry):
+    return sorted(entity.id() for entity in entry.model)
+
+
+def test_export_restores_the_cached_model(model, tmp_path):
+    path, guids = model
+    models = IfcModelCache()
+    entry, _ = models.get(path)
+    before = entity_ids(entry)
+    rows = rows_for(guids, 5) + [{**rows_for(guids, 1)[0], "damage_id": "d999", "ifc_guid": "unknown"}]
+
+    outputs = []
+    for i in range(2):
+        output = str(tmp_path / f"export_{i}.ifc")
+        report = export_damages(fetcher(rows), path, output, models, batch_size=2)
+        assert entity_ids(entry) == before
+        outputs.append(output)
+        assert report["damages_exported"] == 5
+        assert report["missing_elements"] == 1
+        assert report["batches"] == 3
+    assert report["model_cache"] == "hit"
+
+    # The second export does not carry the first one's damages
+    for output in outputs:
+        exported = ifcopenshell.open(output)
+        damage_ids = sorted(prop.NominalValue.wrappedValue for prop in exported.by_type("IfcPropertySingleValue")
+                            if prop.Name == "Damage_ID")
+        assert damage_ids == [f"d{i:03d}" for i in range(5)]
+
+
+def test_failed_export_is_rolled_back(model, tmp_path):
+    path, guids = model
+    models = IfcModelCache()
+    entry, _ = models.get(path)
+    before = entity_ids(entry)
+    rows = rows_for(guids, 4)
+
+    def failing_fetch(after, limit):
+        if after is not None:
+            raise RuntimeError("connection lost")
+        return rows[:limit]
+
+    with pytest.raises(RuntimeError):
+        export_damages(failing_fetch, path, str(tmp_path / "export.ifc"), models, group_by_element=True, batch_size=2)
+    assert entity_ids(entry) == before
+    assert not os.path.exists(tmp_path / "export.ifc")
+
+
+def test_changed_model_is_parsed_again(model):
+    path, _ = model
+    models = IfcModelCache()
+    first, hit = models.get(path)
+    assert not hit
+    assert models.get(path) == (first, True)
+    write_ifc_model(path, 2, seed=1)
+    os.utime(path, ns=(first.mtime_ns + 10**9, first.mtime_ns + 10**9))
+    second, hit = models.get(path)
+    assert not hit and second is not first
+
+
+def test_model_paths_stay_inside_the_models_directory(tmp_path, monkeypatch):
+    root = tmp_path / "models"
+    (root / "site").mkdir(parents=True)
+    (root / "site" / "a.ifc").write_text("")
+    (tmp_path / "secret.ifc").write_text("")
+    os.symlink(tmp_path / "secret.ifc", root / "link.ifc")
+    monkeypatch.setattr(ifc_export, "IFC_MODELS_DIR", str(root))
+
+    assert resolve_model_path("site/a.ifc") == os.path.realpath(root / "site" / "a.ifc")
+    assert resolve_model_path("site/../site/a.ifc") == os.path.realpath(root / "site" / "a.ifc")
+    for escape in ("../secret.ifc", str(tmp_path / "secret.ifc"), "link.ifc", "site/../../secret.ifc"):
+        with pytest.raises(ValueError, match="outside the models directory"):
+            resolve_model_path(escape)
+
+
+# --- /export/ifc ---
+STORED_FILEPATH = "/ifc/project1/model.ifc"
+
+
+@pytest.fixture
+def export_app(client_app, db, tmp_path, monkeypatch):
+    root = tmp_path / "models"
+    (root / "project1").mkdir(parents=True)
+    guids = write_ifc_model(str(root / "project1" / "model.ifc"), 2)
+    monkeypatch.setattr(ifc_export, "IFC_MODELS_DIR", str(root))
+    client_app.state.ifc_models = IfcModelCache()
+
+    def respond(query, params):
+        # Damages are stored with the absolute IFC_Filepath the samples use
+        if query == EXPORT_BATCH_QUERY and params["ifc_filepath"] == STORED_FILEPATH and params["after"] is None:
+            return rows_for(guids, 3), 0
+        return [], 0
+
+    db.respond = respond
+    return client_app
+
+
+def export(app, **params):
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/export/ifc", params=params)
+
+    return asyncio.run(request())
+
+
+def test_export_of_damages_stored_with_an_absolute_filepath(export_app, db, tmp_path):
+    response = export(export_app, ifc_filepath=STORED_FILEPATH, model="project1/model.ifc")
+
+    assert response.status_code == 200
+    assert response.headers["X-Damages-Exported"] == "3"
+    assert "model_with_damages.ifc" in response.headers["content-disposition"]
+    assert {params["ifc_filepath"] for _, params in db.statements} == {STORED_FILEPATH}
+    path = tmp_path / "export.ifc"
+    path.write_bytes(response.content)
+    exported = ifcopenshell.open(str(path))
+    assert sum(prop.Name == "Damage_ID" for prop in exported.by_type("IfcPropertySingleValue")) == 3
+
+
+@pytest.mark.parametrize("params, status", [
+    ({"ifc_filepath": STORED_FILEPATH}, 422),
+    ({"ifc_filepath": STORED_FILEPATH, "model": STORED_FILEPATH}, 400),
+    ({"ifc_filepath": STORED_FILEPATH, "model": "../secret.ifc"}, 400),
+    ({"ifc_filepath": STORED_FILEPATH, "model": "project1/missing.ifc"}, 404),
+])
+def test_export_model_must_be_a_file_in_the_models_directory(export_app, db, params, status):
+    assert export(export_app, **params).status_code == status
+    assert db.statements == []
+
+
+# --- Against Neo4j (skipped unless neo4j_test_uri is set) ---
+def test_export_takes_the_latest_numbered_epoch(neo4j_db):
+    damage_id = f"{TEST_ID_PREFIX}export"
+    ifc_filepath = f"{TEST_ID_PREFIX}model.ifc"
+    ingest_damage_data(neo4j_db, {damage_id: {
+        "Metadata": {"Damage_ID": damage_id, "DamageType": "crack", "IFC_GUID": f"{TEST_ID_PREFIX}guid",
+                     "IFC_Filepath": ifc_filepath},
+        "Epochs": [{"Epoch": 1, "Width_mm": 0.4, "Length_m": 1.5}, {"Width_mm": 9.9, "Length_m": 9.9}],
+    }})
+
+    with neo4j_db.driver.session() as session:
+        rows = session.execute_read(fetch_export_batch, ifc_filepath)
+    assert [(row["damage_id"], row["epoch"], row["width_mm"]) for row in rows] == [(damage_id, 1, 0.4)]
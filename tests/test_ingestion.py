@@ -0,0 +1,99 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ingestion import (
+    DAMAGE_QUERY, EPOCH_QUERY, _statements, add_damage_params, build_ingestion_params, new_ingestion_params,
+    write_ingestion_params_async,
+)
+from relations import RELATION_QUERIES
+from synthetic import damage_upload
+
+
+def damage(damage_id, epochs=2, **extra):
+    return {
+        "Metadata": {"Damage_ID": damage_id, "DamageType": "crack", "IFC_GUID": "guid_1"},
+        "Epochs": [{"Epoch": e, "Width_mm": 0.1 * e, "Position_3D_Axis": {"x": [0, 1], "y": [0, 1], "z": [0, 0]}}
+                   for e in range(1, epochs + 1)],
+        **extra,
+    }
+
+
+def test_add_damage_params_rows():
+    params = new_ingestion_params()
+    add_damage_params(params, "Damage_001", damage("d1", epochs=3))
+
+    assert [row["Damage_ID"] for row in params["damages"]] == ["d1"]
+    assert [row["epoch_id"] for row in params["epochs"]] == ["d1_epoch_1", "d1_epoch_2", "d1_epoch_3"]
+    assert params["has_epoch"][0] == {"Damage_ID": "d1", "epoch_id": "d1_epoch_1"}
+    assert params["next_epoch"] == [{"e1": "d1_epoch_1", "e2": "d1_epoch_2"}, {"e1": "d1_epoch_2", "e2": "d1_epoch_3"}]
+    assert params["epochs"][0]["Position_3D_Axis_X"] == [0.0, 1.0]
+
+
+def test_damage_key_is_the_default_id():
+    params = new_ingestion_params()
+    add_damage_params(params, "Damage_001", {"Metadata": {}, "Epochs": []})
+    assert params["damages"][0]["Damage_ID"] == "Damage_001"
+    assert params["epochs"] == []
+
+
+@pytest.mark.parametrize("damage_obj, message", [
+    ([], r"Required: Metadata \+ Epochs"),
+    ({"Metadata": {}}, r"Required: Metadata \+ Epochs"),
+    ({"Metadata": [], "Epochs": []}, "Metadata must be an object"),
+    ({"Metadata": {}, "Epochs": {}}, "Epochs must be a list of objects"),
+    ({"Metadata": {}, "Epochs": [1]}, "Epochs must be a list of objects"),
+    ({"Metadata": {}, "Epochs": [], "damage_relations": {"causes": "x"}}, "Expected a list"),
+    ({"Metadata": {}, "Epochs": [], "damage_relations": [{"related_to": ["x"]}]}, "Required: relation_type"),
+    ({"Metadata": {}, "Epochs": [], "damage_relations": [{"relation_type": "unknown"}]}, "unknown"),
+])
+def test_add_damage_params_rejects(damage_obj, message):
+    with pytest.raises(ValueError, match=message):
+        add_damage_params(new_ingestion_params(), "Damage_001", damage_obj)
+
+
+def test_build_ingestion_params_rejects_non_objects():
+    for data in ([], "text", None):
+        with pytest.raises(ValueError, match="Expected an object of damages"):
+            build_ingestion_params(data)
+    with pytest.raises(ValueError, match="point past"):
+        build_ingestion_params({"a": damage("a", damage_relations=[{"relation_type": "causes",
+                                                                    "related_to_indices": [5]}])})
+
+
+def test_statements_are_chunked():
+    params = build_ingestion_params(damage_upload(5, 2))
+    statements = _statements("damages", DAMAGE_QUERY, params["damages"], 2)
+    assert [len(chunk) for _, chunk in statements] == [2, 2, 1]
+    assert _statements("epochs", EPOCH_QUERY, [], 2) == []
+
+
+def test_relation_statements_are_grouped_by_type_and_chunked():
+    rows = ([{"source": f"s{i}", "target": "t", "relation_type": "CAUSES"} for i in range(3)]
+            + [{"source": "s", "target": "t", "relation_type": "ADJACENT_TO"}])
+    statements = _statements("relations", None, rows, 2)
+    assert [(query, len(chunk)) for query, chunk in statements] == [
+        (RELATION_QUERIES["CAUSES"], 2), (RELATION_QUERIES["CAUSES"], 1), (RELATION_QUERIES["ADJACENT_TO"], 1)]
+
+
+def test_writer_sends_every_row_once_in_chunks(db):
+    params = build_ingestion_params(damage_upload(7, 3))
+    timings, relations_created = asyncio.run(db.execute_write(write_ingestion_params_async, params, 3))
+
+    damage_chunks = [params_["rows"] for query, params_ in db.statements if query == DAMAGE_QUERY]
+    assert [len(chunk) for chunk in damage_chunks] == [3, 3, 1]
+    assert db.rows_sent("HAS_EPOCH]") == params["has_epoch"]
+    assert relations_created == 0
+    assert set(timings) == {"summaries", "damages", "epochs", "has_epoch", "next_epoch", "relations"}
+
+
+@pytest.mark.parametrize("body", [b"[]", b'{"a": {"Metadata": {}, "Epochs": {}}}', b'{"a": {"Metadata": []'])
+def test_upload_rejects_bad_bodies_with_400(client_app, body):
+    async def post():
+        transport = httpx.ASGITransport(app=client_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/upload_damage_json",
+                                     files={"file": ("upload.json", body, "application/json")})
+
+    assert asyncio.run(post()).status_code == 400
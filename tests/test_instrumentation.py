@@ -0,0 +1,62 @@
+import asyncio
+
+import instrumentation
+from ingestion import STAGES, build_ingestion_params, ingest_damage_data_async
+from instrumentation import REGISTRY, ROWS_WRITTEN, STAGE_SECONDS, instrument_async_work, stage, statement_type
+from synthetic import damage_upload
+
+
+def test_stage_exports_span_with_attributes(exporter):
+    before = STAGE_SECONDS.count(pipeline="test", stage="work")
+    with stage("test", "work", rows=3):
+        pass
+    assert exporter.stages == [{"pipeline": "test", "stage": "work", "seconds": exporter.stages[0]["seconds"], "rows": 3}]
+    assert exporter.stages[0]["seconds"] >= 0
+    assert STAGE_SECONDS.count(pipeline="test", stage="work") == before + 1
+
+
+def test_stage_is_recorded_when_the_body_raises(exporter):
+    try:
+        with stage("test", "broken"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+    assert [record["stage"] for record in exporter.stages] == ["broken"]
+
+
+def test_ingest_reports_every_stage_and_counts_rows(db, exporter):
+    data = damage_upload(4, 3, relation_rate=1.0)
+    expected = build_ingestion_params(data)
+    before = {name: ROWS_WRITTEN.value(stage=name) for name, _ in STAGES}
+
+    report = asyncio.run(ingest_damage_data_async(db, data, chunk_size=2))
+
+    stages = [record["stage"] for record in exporter.stages if record["pipeline"] == "ingest"]
+    assert stages == ["build_params", "summaries", *(name for name, _ in STAGES), "summaries"]
+    rows = {record["stage"]: record.get("rows") for record in exporter.stages if "rows" in record}
+    for name, _ in STAGES:
+        assert rows[name] == len(expected[name])
+        assert ROWS_WRITTEN.value(stage=name) == before[name] + len(expected[name])
+    assert report["damage_nodes_created"] == 4 + 12
+    assert report["relationships_created"] == 4 * 2
+    assert report["damage_relations_created"] == len(expected["relations"]) == 3
+
+
+def test_queries_are_exported_with_their_statement_type(db, exporter, monkeypatch):
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_THRESHOLD", 0.0)
+
+    async def work(tx):
+        result = await tx.run("MATCH (d:Damage) RETURN d", limit=1)
+        await result.consume()
+        result = await tx.run("MERGE (d:Damage {Damage_ID: $id})", id="a")
+        await result.consume()
+
+    before = REGISTRY.sample("neo4j_slow_queries_total", statement="write:Damage")
+    asyncio.run(db.execute_write(instrument_async_work(work, "write")))
+
+    assert [(query["statement"], query["access"]) for query in exporter.queries] == [
+        ("read:Damage", "write"), ("write:Damage", "write")]
+    assert exporter.queries[0]["parameter_sizes"] == {"limit": None}
+    assert REGISTRY.sample("neo4j_slow_queries_total", statement="write:Damage") == before + 1
+    assert instrumentation.slow_queries[-1]["query"] == "MERGE (d:Damage {Damage_ID: $id})"
+    assert statement_type("CREATE INDEX damage_id IF NOT EXISTS FOR (d:Damage) ON (d.Damage_ID)") == "schema"
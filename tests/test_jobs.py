@@ -0,0 +1,240 @@
+import asyncio
+import io
+import json
+import os
+import time
+import types
+
+import pytest
+
+from conftest import StandInDB
+from ingestion import DAMAGE_QUERY
+from jobs import STATE_FILENAME, UPLOAD_FILENAME, JobManager
+from synthetic import damage_upload
+
+
+def upload(damages, filename="upload.json"):
+    body = json.dumps(damage_upload(damages, 2, relation_rate=0.5)).encode()
+    return types.SimpleNamespace(file=io.BytesIO(body), filename=filename)
+
+
+def written_ids(db):
+    return [row["Damage_ID"] for row in db.rows_sent(DAMAGE_QUERY)]
+
+
+def job_files(jobs_dir, job_id):
+    return sorted(os.listdir(os.path.join(jobs_dir, job_id)))
+
+
+def test_job_runs_to_completion_and_keeps_only_its_state(db, tmp_path):
+    async def run():
+        manager = JobManager(db, str(tmp_path), workers=1, batch_size=4)
+        manager.start()
+        job_id = await manager.submit(upload(10))
+        await manager._queue.join()
+        await manager.stop()
+        return job_id, manager.status(job_id)
+
+    job_id, status = asyncio.run(run())
+    assert status["status"] == "succeeded"
+    assert status["batches_committed"] == 3
+    assert status["damages_written"] == 10
+    assert status["damage_relations_written"] == len(db.rows_sent("MERGE (a)-[:"))
+    assert len(written_ids(db)) == 10
+    assert job_files(tmp_path, job_id) == [STATE_FILENAME]
+
+
+def fail_writes(db, *batches):
+    async def before_run(query, params):
+        if query == DAMAGE_QUERY and db.writes in batches:
+            raise RuntimeError("connection reset")
+    db.before_run = before_run
+
+
+def test_failed_job_keeps_its_upload_and_resumes_on_retry(tmp_path):
+    db = StandInDB()
+    fail_writes(db, 3)
+
+    async def run():
+        manager = JobManager(db, str(tmp_path), workers=1, batch_size=4)
+        manager.start()
+        job_id = await manager.submit(upload(10))
+        await manager._queue.join()
+        failed = manager.status(job_id)
+        assert job_files(tmp_path, job_id) == [STATE_FILENAME, UPLOAD_FILENAME]
+
+        retried = manager.retry(job_id)
+        await manager._queue.join()
+        await manager.stop()
+        return job_id, failed, retried, manager.status(job_id)
+
+    job_id, failed, retried, status = asyncio.run(run())
+    assert failed["status"] == "failed"
+    assert failed["batches_committed"] == 2
+    assert failed["errors"] == [{"batch": 3, "error": "connection reset"}]
+    assert retried["status"] == "queued"
+    assert status["status"] == "succeeded"
+    assert status["retries"] == 1
+    assert status["batches_committed"] == 3
+    assert status["damages_written"] == 10
+    # The retry skips batches 1-2; the failed attempt at batch 3 wrote nothing
+    assert written_ids(db) == [f"synthetic_{i:06d}" for i in range(10)]
+    assert job_files(tmp_path, job_id) == [STATE_FILENAME]
+
+
+def test_only_failed_jobs_with_an_upload_can_be_retried(db, tmp_path):
+    async def run():
+        manager = JobManager(db, str(tmp_path), workers=1)
+        manager.start()
+        job_id = await manager.submit(upload(1))
+        await manager._queue.join()
+        await manager.stop()
+        return manager, job_id
+
+    manager, job_id = asyncio.run(run())
+    assert manager.retry("unknown") is None
+    with pytest.raises(ValueError, match="only failed jobs"):
+        manager.retry(job_id)
+    manager.jobs[job_id]["status"] = "failed"
+    with pytest.raises(ValueError, match="no longer kept"):
+        manager.retry(job_id)
+
+
+def test_worker_survives_a_job_that_fails_outside_its_batches(db, tmp_path):
+    async def run():
+        manager = JobManager(db, str(tmp_path), workers=1)
+        save = manager._save
+        broken = []
+
+        def save_or_fail(state):
+            # The first job's state cannot be written when it starts
+            if not broken and state["status"] == "running":
+                broken.append(state["job_id"])
+                raise OSError("disk full")
+            save(state)
+
+        manager._save = save_or_fail
+        manager.start()
+        first = await manager.submit(upload(1))
+        second = await manager.submit(upload(1))
+        await asyncio.wait_for(manager._queue.join(), 5)
+        await manager.stop()
+        return manager.status(first), manager.status(second)
+
+    first, second = asyncio.run(run())
+    assert first["status"] == "failed"
+    assert first["errors"] == [{"batch": 1, "error": "disk full"}]
+    assert second["status"] == "succeeded"
+
+
+def test_crashed_job_resumes_after_its_last_committed_batch(tmp_path):
+    # The first process dies while the third batch is being written
+    crashed_db = StandInDB()
+
+    async def run_until_crash():
+        third_started = asyncio.Event()
+
+        async def hang_on_third_write(query, params):
+            if query == DAMAGE_QUERY and crashed_db.writes == 3:
+                third_started.set()
+                await asyncio.Event().wait()
+
+        crashed_db.before_run = hang_on_third_write
+        manager = JobManager(crashed_db, str(tmp_path), workers=1, batch_size=4)
+        manager.start()
+        job_id = await manager.submit(upload(10))
+        await third_started.wait()
+        await manager.stop()
+        return job_id
+
+    job_id = asyncio.run(run_until_crash())
+    with open(os.path.join(tmp_path, job_id, STATE_FILENAME)) as f:
+        state = json.load(f)
+    assert state["status"] == "running"
+    assert state["batches_committed"] == 2
+    assert UPLOAD_FILENAME in job_files(tmp_path, job_id)
+
+    resumed_db = StandInDB()
+
+    async def restart():
+        manager = JobManager(resumed_db, str(tmp_path), workers=1, batch_size=4)
+        manager.start()
+        await manager._queue.join()
+        await manager.stop()
+        return manager.status(job_id)
+
+    status = asyncio.run(restart())
+    assert status["status"] == "succeeded"
+    assert status["resumed"] == 1
+    assert status["batches_committed"] == 3
+    assert status["damages_written"] == 10
+    assert written_ids(resumed_db) == [f"synthetic_{i:06d}" for i in (8, 9)]
+    assert written_ids(crashed_db)[:8] == [f"synthetic_{i:06d}" for i in range(8)]
+    assert job_files(tmp_path, job_id) == [STATE_FILENAME]
+
+
+def test_finished_jobs_are_pruned_by_age_and_count(db, tmp_path):
+    async def run():
+        manager = JobManager(db, str(tmp_path), workers=1, max_finished=2)
+        manager.start()
+        job_ids = []
+        for _ in range(3):
+            job_ids.append(await manager.submit(upload(1)))
+            await manager._queue.join()
+        await manager.stop()
+        return manager, job_ids
+
+    manager, job_ids = asyncio.run(run())
+    assert sorted(manager.jobs) == sorted(job_ids[1:])
+    assert sorted(os.listdir(tmp_path)) == sorted(job_ids[1:])
+
+    # Age the newest job past the retention period: it is dropped on the next start
+    path = os.path.join(tmp_path, job_ids[2], STATE_FILENAME)
+    with open(path) as f:
+        state = json.load(f)
+    state["finished_at"] = time.time() - 3600
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+    async def restart():
+        manager = JobManager(db, str(tmp_path), workers=1, retention_s=60)
+        manager.start()
+        await manager.stop()
+        return manager
+
+    assert sorted(asyncio.run(restart()).jobs) == [job_ids[1]]
+
+
+def test_failed_jobs_keep_their_upload_until_retention(tmp_path):
+    db = StandInDB()
+    fail_writes(db, 1)
+
+    async def run():
+        manager = JobManager(db, str(tmp_path), workers=1, retention_s=60, max_finished=0)
+        manager.start()
+        job_id = await manager.submit(upload(1))
+        await manager._queue.join()
+        await manager.stop()
+        return manager.status(job_id)
+
+    status = asyncio.run(run())
+    job_id = status["job_id"]
+    # max_finished limits succeeded jobs only
+    assert status["status"] == "failed"
+    assert job_files(tmp_path, job_id) == [STATE_FILENAME, UPLOAD_FILENAME]
+
+    path = os.path.join(tmp_path, job_id, STATE_FILENAME)
+    with open(path) as f:
+        state = json.load(f)
+    state["finished_at"] = time.time() - 3600
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+    async def restart():
+        manager = JobManager(db, str(tmp_path), workers=1, retention_s=60)
+        manager.start()
+        await manager.stop()
+        return manager
+
+    assert asyncio.run(restart()).jobs == {}
+    assert os.listdir(tmp_path) == []
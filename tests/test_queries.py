@@ -0,0 +1,63 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+
+from queries import decode_cursor, encode_cursor, list_damages, list_epochs
+
+
+def raw_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def get(app, path, **params):
+    async def request():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path, params=params)
+
+    return asyncio.run(request())
+
+
+def test_cursors_round_trip():
+    assert decode_cursor(encode_cursor("Damage_001")) == "Damage_001"
+    assert decode_cursor(raw_cursor(None)) is None
+    assert decode_cursor(None) is None
+
+
+def test_pages_continue_after_the_cursor_key(db):
+    def respond(query, params):
+        epochs = [{"epoch": {"Epoch": e, "epoch_id": f"d_epoch_{e}"}} for e in (1, 2, 3)]
+        return epochs, 0
+
+    db.respond = respond
+    page = asyncio.run(db.execute_read(list_epochs, 0, 10, None, None, 2))
+    assert page["items"] == [{"Epoch": 1, "epoch_id": "d_epoch_1"}, {"Epoch": 2, "epoch_id": "d_epoch_2"}]
+
+    asyncio.run(db.execute_read(list_epochs, 0, 10, None, page["next_cursor"], 2))
+    _, params = db.statements[-1]
+    assert (params["after_epoch"], params["after_id"]) == (2, "d_epoch_2")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24=", raw_cursor(5), raw_cursor([1]), raw_cursor("a"),
+                                    raw_cursor([1, 2]), raw_cursor([True, "a"]), raw_cursor({"a": 1})])
+def test_malformed_epoch_cursors_are_rejected(db, cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        asyncio.run(db.execute_read(list_epochs, 0, 10, None, cursor, 2))
+    assert db.statements == []
+
+
+@pytest.mark.parametrize("cursor", [raw_cursor(5), raw_cursor(["a", "b"])])
+def test_malformed_id_cursors_are_rejected(db, cursor):
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        asyncio.run(db.execute_read(list_damages, None, None, cursor, 2))
+
+
+@pytest.mark.parametrize("path", ["/epochs", "/damages", "/elements/summaries"])
+def test_list_endpoints_answer_bad_cursors_with_400(client_app, path):
+    for cursor in ("NQ==", "%%%"):
+        response = get(client_app, path, cursor=cursor)
+        assert response.status_code == 400
+        assert "Invalid cursor" in response.json()["detail"]
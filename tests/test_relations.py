@@ -0,0 +1,111 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+from conftest import StandInDB
+from ingestion import iter_damage_batches
+from relations import RelationResolver, causal_chain
+
+
+class BytesStream:
+    def __init__(self, data):
+        self._f = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._f.read(size)
+
+
+def entry(damage_id, *relations):
+    return {"Metadata": {"Damage_ID": damage_id}, "Epochs": [], "damage_relations": list(relations)}
+
+
+def test_forward_index_is_held_until_its_target_is_parsed():
+    resolver = RelationResolver()
+    first, second, third = [], [], []
+    resolver.add(first, "a", [{"relation_type": "causes", "related_to_indices": [2]},
+                              {"relation_type": "adjacent", "related_to_indices": [0]}])
+    resolver.add(second, "b", [{"relation_type": "propagates_from", "related_to": ["old_upload_damage"]}])
+    assert resolver.unresolved == 1
+    resolver.add(third, "c", None)
+
+    assert first == [{"source": "a", "relation_type": "ADJACENT_TO", "target": "a"}]
+    assert second == [{"source": "b", "target": "old_upload_damage", "relation_type": "PROPAGATES_FROM"}]
+    assert third == [{"source": "a", "relation_type": "CAUSES", "target": "c"}]
+    assert resolver.unresolved == 0
+
+
+@pytest.mark.parametrize("relation, message", [
+    ({"relation_type": "causes", "related_to": "b"}, "Invalid related_to"),
+    ({"relation_type": "causes", "related_to": [1]}, "Expected a Damage_ID"),
+    ({"relation_type": "causes", "related_to_indices": [-1]}, "Invalid related_to_indices value"),
+    ({"relation_type": "causes", "related_to_indices": [True]}, "Invalid related_to_indices value"),
+])
+def test_invalid_relations_are_rejected(relation, message):
+    with pytest.raises(ValueError, match=message):
+        RelationResolver().add([], "a", [relation])
+
+
+def test_streamed_batches_reference_only_written_damages():
+    upload = {
+        "Damage_0": entry("d0", {"relation_type": "causes", "related_to_indices": [3]}),
+        "Damage_1": entry("d1", {"relation_type": "causes", "related_to_indices": [0]}),
+        "Damage_2": entry("d2"),
+        "Damage_3": entry("d3"),
+        "Damage_4": entry("d4", {"relation_type": "causes", "related_to_indices": [9]}),
+    }
+    resolver = RelationResolver()
+
+    async def collect():
+        stream = BytesStream(json.dumps(upload).encode())
+        return [params async for params in iter_damage_batches(stream, 2, resolver)]
+
+    batches = asyncio.run(collect())
+    written = set()
+    for params in batches:
+        written.update(row["Damage_ID"] for row in params["damages"])
+        for row in params["relations"]:
+            assert {row["source"], row["target"]} <= written
+    relations = [(row["source"], row["target"]) for params in batches for row in params["relations"]]
+    assert relations == [("d1", "d0"), ("d0", "d3")]
+    assert [len(params["relations"]) for params in batches] == [1, 1, 0]
+    assert resolver.unresolved == 1
+
+
+# --- Causal chains ---
+# a -CAUSES-> b -CAUSES-> c, a -CAUSES-> c, d -CONSEQUENCE_OF-> c (so c causes d)
+EDGES = [("a", "CAUSES", "b"), ("b", "CAUSES", "c"), ("a", "CAUSES", "c"), ("d", "CONSEQUENCE_OF", "c")]
+
+
+def graph_respond(query, params):
+    records = []
+    for damage_id in params["frontier"]:
+        for start, rel_type, end in EDGES:
+            if rel_type not in params["types"] or damage_id not in (start, end):
+                continue
+            outgoing = rel_type in params["outgoing"]
+            if (start == damage_id) == outgoing:
+                other = end if start == damage_id else start
+                records.append({"damage_id": other, "damage_type": "crack", "ifc_guid": None})
+    return records, 0
+
+
+def chain(damage_id, **kwargs):
+    db = StandInDB(graph_respond)
+    items = asyncio.run(db.execute_read(causal_chain, damage_id, **kwargs))
+    return [(item["damage_id"], item["depth"]) for item in items], len(db.statements)
+
+
+def test_causal_chain_reports_each_damage_at_its_shortest_depth():
+    assert chain("a") == ([("b", 1), ("c", 1), ("d", 2)], 3)
+    assert chain("d", downstream=False) == ([("c", 1), ("a", 2), ("b", 2)], 3)
+    assert chain("a", max_depth=1) == ([("b", 1), ("c", 1)], 1)
+    assert chain("a", limit=1) == ([("b", 1)], 1)
+
+
+def test_causal_chain_rejects_other_relation_types():
+    with pytest.raises(ValueError, match="Causal traversal"):
+        chain("a", relation_types=["adjacent_to"])
+    with pytest.raises(ValueError, match="max_depth"):
+        chain("a", max_depth=0)
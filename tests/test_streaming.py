@@ -0,0 +1,101 @@
+import asyncio
+import io
+import json
+
+import httpx
+import pytest
+
+from ingestion import (
+    DAMAGE_QUERY, PartialUploadError, build_ingestion_params, ingest_damage_stream_async, iter_damage_batches,
+)
+from synthetic import damage_upload
+
+
+class BytesStream:
+    def __init__(self, data, read_size=7):
+        self._f = io.BytesIO(data)
+        self.read_size = read_size
+
+    async def read(self, size=-1):
+        return self._f.read(self.read_size if size < 0 else min(size, self.read_size))
+
+
+def with_bad_entry(damages, bad_entry):
+    # The invalid entry is written after the valid ones, so it is parsed last
+    body = json.dumps(damage_upload(damages, 2))
+    return body[:-1].encode() + b', "bad": ' + bad_entry + b"}"
+
+
+def test_stream_batches_match_the_whole_upload():
+    data = damage_upload(5, 2)
+
+    async def collect():
+        return [params async for params in iter_damage_batches(BytesStream(json.dumps(data).encode()), 2)]
+
+    batches = asyncio.run(collect())
+    assert [len(params["damages"]) for params in batches] == [2, 2, 1]
+    whole = build_ingestion_params(data)
+    assert [row for params in batches for row in params["epochs"]] == whole["epochs"]
+
+
+@pytest.mark.parametrize("body", [b"[]", b'  \n ["a"]', b"42"])
+def test_stream_rejects_non_objects(body):
+    async def collect():
+        return [params async for params in iter_damage_batches(BytesStream(body), 2)]
+
+    with pytest.raises(ValueError, match="Expected an object of damages"):
+        asyncio.run(collect())
+
+
+def test_invalid_first_batch_is_a_plain_value_error(db):
+    body = with_bad_entry(1, b'{"Metadata": {}, "Epochs": {}}')
+    with pytest.raises(ValueError) as raised:
+        asyncio.run(ingest_damage_stream_async(db, BytesStream(body), batch_size=2))
+    assert not isinstance(raised.value, PartialUploadError)
+    assert db.statements == []
+
+
+@pytest.mark.parametrize("bad_entry, error", [
+    (b'{"Metadata": {}, "Epochs": {}}', "Epochs must be a list of objects"),
+    (b'{"Metadata": {"Damage_ID": ', "Invalid JSON format"),
+])
+def test_later_invalid_batch_reports_what_was_committed(db, bad_entry, error):
+    body = with_bad_entry(5, bad_entry)
+    with pytest.raises(PartialUploadError, match=error) as raised:
+        asyncio.run(ingest_damage_stream_async(db, BytesStream(body), batch_size=2))
+
+    report = raised.value.report
+    assert report["batches"] == 2
+    assert report["damage_nodes_created"] == 4 + 8
+    assert len(db.rows_sent(DAMAGE_QUERY)) == 4
+
+
+def test_stream_upload_error_names_the_committed_batches(client_app, db):
+    body = with_bad_entry(3, b'{"Metadata": []}')
+
+    async def post():
+        transport = httpx.ASGITransport(app=client_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/upload_damage_json", params={"stream": True, "batch_size": 1},
+                                     files={"file": ("upload.json", body, "application/json")})
+
+    response = asyncio.run(post())
+    assert response.status_code == 400
+    detail = response.json()["detail"]
+    assert detail["status"] == "partial"
+    assert "Metadata + Epochs" in detail["error"]
+    assert detail["batches"] == 3
+    assert detail["damage_nodes_created"] == 3 + 6
+
+
+@pytest.mark.parametrize("body", [b"[]", b'{"a": {"Metadata": {}, "Epochs": {}}}', b'{"a": {"Metadata": []'])
+def test_stream_upload_rejects_bad_bodies_with_400(client_app, body):
+    async def post():
+        transport = httpx.ASGITransport(app=client_app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/upload_damage_json", params={"stream": True},
+                                     files={"file": ("upload.json", body, "application/json")})
+
+    response = asyncio.run(post())
+    assert response.status_code == 400
+    assert isinstance(response.json()["detail"], str)
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+from conftest import TEST_ID_PREFIX
+from ingestion import build_ingestion_params, ingest_damage_data, write_ingestion_params, write_ingestion_params_async
+from summaries import REFRESH_SUMMARIES_QUERY, refresh_summaries_async
+
+GUID = f"{TEST_ID_PREFIX}summary_guid"
+
+
+def upload(damage_id, damage_type, epochs=({"Epoch": 1, "Width_mm": 0.4, "Length_m": 1.5},)):
+    return {damage_id: {"Metadata": {"Damage_ID": damage_id, "DamageType": damage_type, "IFC_GUID": GUID},
+                        "Epochs": list(epochs)}}
+
+
+def summary(db):
+    return db.query("MATCH (s:ElementSummary {IFC_GUID: $guid}) RETURN s", {"guid": GUID})[0]["s"]
+
+
+# --- Stand-in DB ---
+def test_guids_are_refreshed_in_sorted_order(db):
+    asyncio.run(db.execute_write(refresh_summaries_async, {"c", "a", "d", "b"}, 3))
+    assert [params["guids"] for _, params in db.statements] == [["a", "b", "c"], ["d"]]
+
+
+def test_ingestion_refreshes_previous_and_touched_elements_in_order(db):
+    def respond(query, params):
+        if "RETURN DISTINCT d.IFC_GUID AS guid" in query:
+            return [{"guid": "z_previous"}, {"guid": "a_previous"}], 0
+        return db.default_respond(query, params)
+
+    db.respond = respond
+    params = build_ingestion_params({**upload("d1", "crack"), **upload("d2", "spalling")})
+    asyncio.run(db.execute_write(write_ingestion_params_async, params, 100))
+    refreshed = [params["guids"] for query, params in db.statements if query == REFRESH_SUMMARIES_QUERY]
+    assert refreshed == [["a_previous", GUID, "z_previous"]]
+
+
+# --- Against Neo4j (skipped unless neo4j_test_uri is set) ---
+def test_overlapping_refreshes_count_both_uploads(neo4j_db):
+    first_written, commit_first = threading.Event(), threading.Event()
+    errors = []
+
+    def write(damage_id, damage_type, written=None, commit=None):
+        try:
+            with neo4j_db.driver.session() as session:
+                tx = session.begin_transaction()
+                write_ingestion_params(tx, build_ingestion_params(upload(damage_id, damage_type)), 100)
+                if written:
+                    written.set()
+                if commit:
+                    commit.wait(30)
+                tx.commit()
+        except Exception as e:
+            errors.append(e)
+            if written:
+                written.set()
+
+    first = threading.Thread(target=write, args=(f"{TEST_ID_PREFIX}a", "crack", first_written, commit_first))
+    second = threading.Thread(target=write, args=(f"{TEST_ID_PREFIX}b", "spalling"))
+    try:
+        first.start()
+        assert first_written.wait(30)
+        second.start()
+        # The second refresh waits for the first transaction's lock on the summary
+        second.join(1)
+        assert second.is_alive()
+    finally:
+        commit_first.set()
+        first.join(30)
+        second.join(30)
+    assert not errors
+
+    element = summary(neo4j_db)
+    assert element["DamageCount"] == 2
+    assert element["DamageTypes"] == ["crack", "spalling"]
+    assert element["DamageTypeCounts"] == [1, 1]
+    assert "_lock" not in element
+
+
+def test_epochs_without_a_number_are_not_the_latest(neo4j_db):
+    epochs = [{"Epoch": 1, "Width_mm": 0.4, "Length_m": 1.5}, {"Width_mm": 9.9, "Length_m": 9.9}]
+    ingest_damage_data(neo4j_db, upload(f"{TEST_ID_PREFIX}a", "crack", epochs))
+
+    element = summary(neo4j_db)
+    assert element["Latest_Epoch"] == 1
+    assert element["Max_Width_mm"] == 0.4
+    assert element["Max_Length_m"] == 1.5
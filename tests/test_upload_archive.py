@@ -0,0 +1,135 @@
+import asyncio
+import gzip
+import io
+import json
+import tarfile
+import threading
+
+import httpx
+import pytest
+
+import upload_archive
+from ingestion import DAMAGE_QUERY
+from synthetic import damage_upload
+from upload_archive import _BatchReader, archive_format, archive_status, ingest_archive_async
+
+
+def ndjson(lines):
+    return b"".join(line + b"\n" for line in lines)
+
+
+def damage_lines(count, prefix="d"):
+    upload = damage_upload(count, 2, id_prefix=prefix)
+    return [json.dumps(damage_obj).encode() for damage_obj in upload.values()]
+
+
+def ingest(db, data, filename, **kwargs):
+    return asyncio.run(ingest_archive_async(db, io.BytesIO(data), filename, **kwargs))
+
+
+def written_ids(db):
+    return [row["Damage_ID"] for row in db.rows_sent(DAMAGE_QUERY)]
+
+
+def test_bad_sources_are_reported_and_the_rest_written(db):
+    lines = damage_lines(4)
+    lines[1:1] = [b"{not json", b"[1, 2]", b'{"x": {"Metadata": {}, "Epochs": {}}}']
+    report = ingest(db, gzip.compress(ndjson(lines)), "upload.ndjson.gz", batch_size=2)
+
+    assert report["complete"] is True
+    assert report["files"] == 7
+    assert report["files_failed"] == 3
+    assert [failure["source"] for failure in report["failures"]] == ["line 2", "line 3", "line 4"]
+    assert "Epochs must be a list" in report["failures"][2]["error"]
+    assert len(written_ids(db)) == 4
+    assert report["damage_nodes_created"] == 4 + 8
+
+
+def test_reported_failures_are_capped(db, monkeypatch):
+    monkeypatch.setattr(upload_archive, "MAX_REPORTED_FAILURES", 2)
+    report = ingest(db, ndjson([b"[]"] * 5 + damage_lines(1)), "upload.ndjson")
+    assert report["files_failed"] == 5
+    assert len(report["failures"]) == 2
+    assert len(written_ids(db)) == 1
+
+
+@pytest.mark.parametrize("batch_size", [5000, 3])
+def test_truncated_stream_writes_every_source_decoded_before_the_break(db, batch_size):
+    lines = damage_lines(40)
+    data = gzip.compress(ndjson(lines))
+    report = ingest(db, data[:len(data) * 2 // 3], "upload.ndjson.gz", batch_size=batch_size)
+
+    assert report["complete"] is False
+    assert report["failures"][-1]["source"] == "archive"
+    decoded = report["files"]
+    assert 0 < decoded < 40
+    # Every line decoded before the break is written, in order
+    assert written_ids(db) == [json.loads(line)["Metadata"]["Damage_ID"] for line in lines[:decoded]]
+    assert report["files_failed"] == 1
+
+
+def test_tar_members_other_than_json_are_skipped(db):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        upload = damage_upload(3, 1)
+        members = {"batch/upload.json": json.dumps(upload).encode(), "batch/readme.txt": b"notes",
+                   "batch/._upload.json": b"\x00\x05", "batch/bare.json": damage_lines(1, prefix="bare")[0]}
+        for name, payload in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(payload)
+            tar.addfile(info, io.BytesIO(payload))
+
+    report = ingest(db, buffer.getvalue(), "upload.tar.gz")
+    assert report["complete"] is True
+    assert report["files"] == 2
+    assert report["files_failed"] == 0
+    assert sorted(written_ids(db)) == ["bare_000000", "synthetic_000000", "synthetic_000001", "synthetic_000002"]
+
+
+def test_unsupported_file_names_are_rejected():
+    assert archive_format("UPLOAD.TAR.GZ") == ("tar", None)
+    with pytest.raises(ValueError, match="Unsupported archive"):
+        archive_format("upload.zip")
+
+
+def test_failures_from_concurrent_threads_are_all_counted(monkeypatch):
+    monkeypatch.setattr(upload_archive, "MAX_REPORTED_FAILURES", 10**6)
+    report = {"files": 0, "files_failed": 0, "failures": [], "complete": True}
+    reader = _BatchReader(io.BytesIO(b""), "ndjson", None, 10, report)
+
+    def fail_many(thread):
+        for i in range(2000):
+            reader.fail(f"line {thread}-{i}", ValueError("bad"))
+
+    threads = [threading.Thread(target=fail_many, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert report["files_failed"] == len(report["failures"]) == 16000
+
+
+def upload_archive_status(app, data, filename="upload.ndjson.gz"):
+    async def post():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/upload_damage_archive", files={"file": (filename, data, "application/gzip")})
+
+    response = asyncio.run(post())
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_archive_status_tells_failed_partial_and_success_apart(client_app):
+    good = damage_lines(2)
+    assert upload_archive_status(client_app, gzip.compress(ndjson(good)))["status"] == "success"
+    assert upload_archive_status(client_app, gzip.compress(ndjson(good + [b"[]"])))["status"] == "partial"
+
+    truncated = gzip.compress(ndjson(damage_lines(40)))
+    report = upload_archive_status(client_app, truncated[:len(truncated) // 2])
+    assert (report["status"], report["complete"]) == ("partial", False)
+
+    report = upload_archive_status(client_app, gzip.compress(ndjson([b"{not json", b"[]"])))
+    assert report["status"] == "failed"
+    assert report["files_failed"] == report["files"] == 2
+    assert archive_status({"damage_nodes_created": 0, "files_failed": 0}) == "failed"
@@ -0,0 +1,254 @@
+"""Ingest many damage files from one compressed upload.
+
+Accepted layouts, told apart by the file name:
+
+  .ndjson / .jsonl          one damage per line, optionally compressed:
+  .ndjson.gz / .ndjson.zst  .gz (gzip) or .zst (zstd)
+  .tar / .tar.gz / .tgz     JSON files, each laid out like an
+  .tar.bz2 / .tar.xz        /upload_damage_json body, or a single
+  .tar.zst                  bare { Metadata, Epochs } damage
+
+A line or a tar member is a *source*. It is decoded, validated and
+flattened on its own (ingestion.build_ingestion_params), so
+related_to_indices refer to positions within that source, and a bad
+source is reported and skipped without failing the others. Accepted
+sources are written in batches of about ``batch_size`` damages, one
+write transaction per batch, through the same statements as
+/upload_damage_json.
+
+Decompression, parsing and flattening run in a worker thread, reading
+the upload as a stream; the next batch is decoded while the current
+one is being written.
+"""
+import asyncio
+import gzip
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+import zlib
+
+from ingestion import (DEFAULT_CHUNK_SIZE, STAGES, build_ingestion_params, new_ingestion_params,
+                       write_ingestion_params_async)
+from instrumentation import record_rows_written, stage
+
+try:
+    import zstandard
+except ImportError:  # zstd uploads are optional
+    zstandard = None
+
+# --- Archive upload settings ---
+# Damages per write transaction; sources are small, so batches are larger than in streaming mode.
+ARCHIVE_BATCH_SIZE = int(os.getenv('ingest_archive_batch_size', 5000))
+# Failures listed in the report; the count is always complete.
+MAX_REPORTED_FAILURES = int(os.getenv('ingest_archive_max_failures', 1000))
+
+# Errors after which the rest of the stream cannot be read
+STREAM_ERRORS = (OSError, EOFError, zlib.error, tarfile.TarError) + ((zstandard.ZstdError,) if zstandard else ())
+
+ARCHIVE_FORMATS = {
+    ".ndjson": ("ndjson", None), ".jsonl": ("ndjson", None),
+    ".ndjson.gz": ("ndjson", "gzip"), ".jsonl.gz": ("ndjson", "gzip"),
+    ".ndjson.zst": ("ndjson", "zstd"), ".jsonl.zst": ("ndjson", "zstd"),
+    ".tar": ("tar", None), ".tar.gz": ("tar", None), ".tgz": ("tar", None),
+    ".tar.bz2": ("tar", None), ".tar.xz": ("tar", None),
+    ".tar.zst": ("tar", "zstd"),
+}
+
+
+def archive_format(filename):
+    """``(layout, codec)`` for an upload's file name; raises ValueError for anything else."""
+    name = (filename or "").lower()
+    for suffix in sorted(ARCHIVE_FORMATS, key=len, reverse=True):
+        if name.endswith(suffix):
+            layout, codec = ARCHIVE_FORMATS[suffix]
+            if codec == "zstd" and zstandard is None:
+                raise ValueError("zstd uploads need the 'zstandard' package on the server.")
+            return layout, codec
+    raise ValueError(f"Unsupported archive '{filename}'. Expected one of: {', '.join(ARCHIVE_FORMATS)}.")
+
+
+# --- Decoding (worker thread) ---
+def _decompressed(fileobj, codec):
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if codec == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj, read_across_frames=True)
+        return io.BufferedReader(reader)
+    return fileobj
+
+
+def _as_upload(obj, default_key):
+    # A bare damage is wrapped the way a one-damage upload would be
+    if isinstance(obj, dict) and "Metadata" in obj:
+        metadata = obj["Metadata"] if isinstance(obj["Metadata"], dict) else {}
+        return {metadata.get("Damage_ID") or default_key: obj}
+    if not isinstance(obj, dict):
+        raise ValueError("Expected a JSON object.")
+    return obj
+
+
+def iter_sources(fileobj, layout, codec):
+    """``(source, payload)`` per line or tar member; payload is bytes, or an exception for a member that could not be read."""
+    stream = _decompressed(fileobj, codec)
+    if layout == "ndjson":
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                yield f"line {number}", line
+        return
+
+    # "r|*": sequential reads only, compression detected from the stream
+    with tarfile.open(fileobj=stream, mode="r|*") as tar:
+        for member in tar:
+            basename = os.path.basename(member.name)
+            # Skip directories, non-JSON payloads and macOS resource forks (._name.json)
+            if not member.isfile() or not basename.lower().endswith(".json") or basename.startswith("._"):
+                continue
+            try:
+                yield member.name, tar.extractfile(member).read()
+            except (tarfile.TarError, OSError) as e:
+                yield member.name, e
+
+
+class _BatchReader:
+    """Pulls decoded sources into batches; every call to ``next_batch`` runs in a worker thread."""
+
+    def __init__(self, fileobj, layout, codec, batch_size, report):
+        self._sources = iter_sources(fileobj, layout, codec)
+        self.batch_size = batch_size
+        self.report = report
+        self.stream_error = None
+        # next_batch (batch N + 1) and build_params (batch N) report failures from two threads
+        self._lock = threading.Lock()
+
+    def fail(self, source, error):
+        with self._lock:
+            self.report["files_failed"] += 1
+            if len(self.report["failures"]) < MAX_REPORTED_FAILURES:
+                self.report["failures"].append({"source": source, "error": str(error)})
+
+    def next_batch(self):
+        """Parsed ``(source, upload)`` pairs holding about ``batch_size`` damages; [] at the end.
+
+        A stream that cannot be read further ends the batch early: the
+        sources decoded so far are returned and the error is kept in
+        ``stream_error``.
+        """
+        batch, damages = [], 0
+        try:
+            for source, payload in self._sources:
+                self.report["files"] += 1
+                try:
+                    if isinstance(payload, Exception):
+                        raise payload
+                    upload = _as_upload(json.loads(payload), source)
+                except (ValueError, tarfile.TarError, OSError) as e:
+                    self.fail(source, e)
+                    continue
+                batch.append((source, upload))
+                damages += len(upload)
+                if damages >= self.batch_size:
+                    break
+        except STREAM_ERRORS as e:
+            self.stream_error = e
+        return batch
+
+    def build_params(self, batch):
+        """Flatten each source on its own into one parameter set; rejected sources are reported."""
+        params = new_ingestion_params()
+        for source, upload in batch:
+            try:
+                source_params = build_ingestion_params(upload)
+            except ValueError as e:
+                self.fail(source, e)
+                continue
+            for name, rows in source_params.items():
+                params[name].extend(rows)
+        return params
+
+
+# --- Ingestion ---
+def archive_status(report):
+    """"failed" if nothing was written, "partial" if a source or the stream failed, else "success"."""
+    if not report["damage_nodes_created"]:
+        return "failed"
+    return "partial" if report["files_failed"] else "success"
+
+
+async def ingest_archive_async(db, fileobj, filename, chunk_size=DEFAULT_CHUNK_SIZE, batch_size=ARCHIVE_BATCH_SIZE,
+                               on_commit=None, prepare=None):
+    """Ingest every source of an archive upload, one write transaction per batch.
+
+    ``fileobj`` is a synchronous binary file (e.g. ``UploadFile.file``).
+    ``prepare``, if given, is awaited with each batch's raw damage objects
+    before they are validated, as in streaming ingestion. A stream that
+    cannot be decompressed or read further ends the upload: every source
+    decoded before the break is still written, and the report lists an
+    "archive" failure and has ``complete: false``.
+    Raises ValueError for an unsupported file name.
+    """
+    layout, codec = archive_format(filename)
+    start = time.perf_counter()
+    report = {"files": 0, "files_failed": 0, "failures": [], "complete": True}
+    counts = {name: 0 for name, _ in STAGES}
+    timings = {"decode": 0.0, "build_params": 0.0}
+    batches = relations_created = 0
+    reader = _BatchReader(fileobj, layout, codec, batch_size, report)
+
+    async def decode():
+        decode_start = time.perf_counter()
+        with stage("ingest", "decode"):
+            batch = await asyncio.to_thread(reader.next_batch)
+        timings["decode"] += time.perf_counter() - decode_start
+        return batch
+
+    pending = asyncio.ensure_future(decode())
+    try:
+        while True:
+            batch = await pending
+            if not batch:
+                break
+            # Decode the next batch while this one is written (nothing left after a broken stream)
+            pending = asyncio.ensure_future(decode())
+
+            if prepare is not None:
+                with stage("ingest", "prepare", damages=sum(len(upload) for _, upload in batch)):
+                    await prepare([damage_obj for _, upload in batch for damage_obj in upload.values()])
+            build_start = time.perf_counter()
+            with stage("ingest", "build_params"):
+                params = await asyncio.to_thread(reader.build_params, batch)
+            timings["build_params"] += time.perf_counter() - build_start
+            if not params["damages"]:
+                continue
+
+            batch_timings, batch_relations = await db.execute_write(write_ingestion_params_async, params, chunk_size)
+            record_rows_written(params, batch_timings)
+            if on_commit:
+                on_commit(params)
+            for name, seconds in batch_timings.items():
+                timings[name] = timings.get(name, 0.0) + seconds
+            for name, rows in params.items():
+                counts[name] += len(rows)
+            relations_created += batch_relations
+            batches += 1
+    finally:
+        # Never leave a decode running against a file the caller is about to close
+        await asyncio.wait([pending])
+        if not pending.cancelled():
+            pending.exception()
+
+    if reader.stream_error is not None:
+        reader.fail("archive", reader.stream_error)
+        report["complete"] = False
+
+    timings["total"] = time.perf_counter() - start
+    return {
+        "damage_nodes_created": counts["damages"] + counts["epochs"],
+        "relationships_created": counts["next_epoch"],
+        "damage_relations_created": relations_created,
+        "batches": batches,
+        **report,
+        "timings": {name: round(seconds, 6) for name, seconds in timings.items()},
+    }